@@ -4,7 +4,7 @@ from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 
 
-@job
+@job('mail')
 def send_email(user, subject, template_name, context, from_email=None):
     """
     Send an email to a user with both text and HTML content.
@@ -131,16 +131,76 @@ CACHES = {
     }
 }
 
+RQ_CONNECTION = {
+    'HOST': os.environ.get('REDIS_HOST', default='redis'),
+    'PORT': os.environ.get('REDIS_PORT', default=6379),
+    'DB': os.environ.get('REDIS_DB', default=0),
+    'REDIS_CLIENT_KWARGS': {},
+}
+
+# Jobs are routed by type, so short mail and thumbnail jobs never wait behind transcodes.
 RQ_QUEUES = {
-    'default': {
-        'HOST': os.environ.get('REDIS_HOST', default='redis'),
-        'PORT': os.environ.get('REDIS_PORT', default=6379),
-        'DB': os.environ.get('REDIS_DB', default=0),
-        'DEFAULT_TIMEOUT': 900,
-        'REDIS_CLIENT_KWARGS': {},
-    },
+    'default': {**RQ_CONNECTION, 'DEFAULT_TIMEOUT': 900},
+    'mail': {**RQ_CONNECTION, 'DEFAULT_TIMEOUT': 300},
+    'thumbnails': {**RQ_CONNECTION, 'DEFAULT_TIMEOUT': 900},
+    'transcode': {**RQ_CONNECTION, 'DEFAULT_TIMEOUT': int(os.environ.get('RQ_TRANSCODE_TIMEOUT', default=4 * 60 * 60))},
 }
 
+# Worker processes started by the run_workers command, per queue.
+# Transcode workers default to one per CPU; mail workers also drain the default queue, which only takes short jobs.
+RQ_WORKERS = {
+    'mail': int(os.environ.get('RQ_MAIL_WORKERS', default=1)),
+    'thumbnails': int(os.environ.get('RQ_THUMBNAIL_WORKERS', default=1)),
+    'transcode': int(os.environ.get('RQ_TRANSCODE_WORKERS') or os.cpu_count() or 1),
+}
+
+# Host-wide ffmpeg thread budget shared by all workers, by default three quarters of the cores,
+# so concurrent transcodes neither oversubscribe the host nor starve the web container. 0 disables it.
+FFMPEG_CPU_SHARE = float(os.environ.get('FFMPEG_CPU_SHARE', default=0.75))
+FFMPEG_THREAD_BUDGET = int(
+    os.environ.get('FFMPEG_THREAD_BUDGET') or max(1, int((os.cpu_count() or 1) * FFMPEG_CPU_SHARE))
+)
+# Threads one transcode asks for; it starts with fewer if the budget is partly taken.
+FFMPEG_JOB_THREADS = int(os.environ.get('FFMPEG_JOB_THREADS', default=4))
+# Threads of the budget kept for the single-threaded thumbnail and trickplay jobs, which transcodes never take,
+# so previews do not wait hours behind long conversions.
+FFMPEG_PREVIEW_THREADS = int(os.environ.get('FFMPEG_PREVIEW_THREADS') or max(1, FFMPEG_THREAD_BUDGET // 8))
+# Threads the chunked transcode's process pool may hold at once, by default half the budget.
+FFMPEG_CHUNK_POOL_THREADS = int(os.environ.get('FFMPEG_CHUNK_POOL_THREADS') or max(1, FFMPEG_THREAD_BUDGET // 2))
+
+# HLS transcoding: "single_decode" decodes the source once for all renditions,
+# "per_rendition" runs one ffmpeg process per rendition and
+# "fanout" enqueues one RQ job per rendition plus a finalize job and
+# "chunked" encodes keyframe-bounded chunks of the source in parallel.
+HLS_TRANSCODE_MODE = os.environ.get('HLS_TRANSCODE_MODE', default='single_decode')
+
+# Publish the lowest rendition first and extend the master playlist as higher renditions complete.
+HLS_PUBLISH_LOWEST_FIRST = str_to_bool(os.environ.get('HLS_PUBLISH_LOWEST_FIRST', default='True'))
+
+# Segment sources that already match a rendition (H.264 4:2:0, same size, keyframes every segment)
+# by stream copy instead of re-encoding, if their bitrate is at most the tolerance times the rung's.
+HLS_PASSTHROUGH = str_to_bool(os.environ.get('HLS_PASSTHROUGH', default='True'))
+HLS_PASSTHROUGH_BITRATE_TOLERANCE = float(os.environ.get('HLS_PASSTHROUGH_BITRATE_TOLERANCE', default=1.5))
+
+# Derive per-title bitrate caps from a short low-resolution CRF trial encode before transcoding.
+PER_TITLE_LADDER = str_to_bool(os.environ.get('PER_TITLE_LADDER', default='False'))
+
+# Produce thumbnails, trickplay sprites and a hover preview clip as extra outputs of the transcode decode
+# instead of separate jobs decoding the source again (single_decode mode only).
+HLS_INLINE_PREVIEWS = str_to_bool(os.environ.get('HLS_INLINE_PREVIEWS', default='False'))
+
+# HLS segments as "mpegts" (.ts) or "fmp4" (CMAF .m4s with an init.mp4, reusable for DASH).
+# HLS_SINGLE_FILE writes one segment file per rendition and addresses segments with EXT-X-BYTERANGE.
+HLS_SEGMENT_TYPE = os.environ.get('HLS_SEGMENT_TYPE', default='mpegts')
+HLS_SINGLE_FILE = str_to_bool(os.environ.get('HLS_SINGLE_FILE', default='False'))
+# Also write a DASH manifest referencing the same segments; requires HLS_SEGMENT_TYPE=fmp4.
+DASH_MANIFEST = str_to_bool(os.environ.get('DASH_MANIFEST', default='False'))
+
+# Chunked mode: chunk length, and whether chunks run on a local process pool ("pool") or as RQ jobs ("rq").
+HLS_CHUNK_SECONDS = int(os.environ.get('HLS_CHUNK_SECONDS', default=120))
+HLS_CHUNK_EXECUTOR = os.environ.get('HLS_CHUNK_EXECUTOR', default='pool')
+HLS_CHUNK_WORKERS = int(os.environ.get('HLS_CHUNK_WORKERS', default=os.cpu_count() or 1))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -182,6 +242,26 @@ STATIC_ROOT = BASE_DIR / 'static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Let the front proxy send video files: "x-accel" answers with X-Accel-Redirect to the internal
+# nginx location MEDIA_OFFLOAD_PREFIX, "x-sendfile" with X-Sendfile (Apache, lighttpd).
+# Empty streams the files through Django.
+MEDIA_OFFLOAD = os.environ.get('MEDIA_OFFLOAD', default='')
+MEDIA_OFFLOAD_PREFIX = os.environ.get('MEDIA_OFFLOAD_PREFIX', default='/protected-media/')
+
+# Playback URLs carry an HMAC-signed token issued by the play endpoint, valid for PLAYBACK_TOKEN_TTL seconds.
+# Unsigned playlist and segment URLs are rejected unless PLAYBACK_TOKENS_REQUIRED is disabled,
+# e.g. for players that do not request a play session yet.
+PLAYBACK_TOKEN_TTL = int(os.environ.get('PLAYBACK_TOKEN_TTL', default=4 * 60 * 60))
+PLAYBACK_TOKENS_REQUIRED = str_to_bool(os.environ.get('PLAYBACK_TOKENS_REQUIRED', default='True'))
+
+# Seconds players and caches may reuse playlists of finished titles; segments are cached as immutable.
+HLS_PLAYLIST_MAX_AGE = int(os.environ.get('HLS_PLAYLIST_MAX_AGE', default=300))
+
+# Playlists of finished titles are cached per process (LRU of PLAYLIST_CACHE_SIZE entries) in front of Redis.
+# Processes recheck a movie's cache version after PLAYLIST_CACHE_VERSION_TTL seconds to see invalidations.
+PLAYLIST_CACHE_SIZE = int(os.environ.get('PLAYLIST_CACHE_SIZE', default=1024))
+PLAYLIST_CACHE_VERSION_TTL = float(os.environ.get('PLAYLIST_CACHE_VERSION_TTL', default=5))
+
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 # Default primary key field type
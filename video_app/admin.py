@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.core.exceptions import ValidationError
 
-from .models import Movie, Category
+from .models import Movie, Category, UploadSession
 
 # Register your models here.
 
@@ -19,8 +19,8 @@ class MovieAdmin(admin.ModelAdmin):
     Admin interface for managing video movies.
     It includes validation to ensure that title, description, category, and video_file are provided before saving.
     """
-    list_display = ('title', 'category', 'created_at')
-    readonly_fields = ('hls_master_playlist', )
+    list_display = ('title', 'category', 'created_at', 'transcode_status')
+    readonly_fields = ('hls_master_playlist', 'transcode_status', 'transcode_progress', 'video_sha256', 'first_playable_at')
 
     def save_model(self, request, obj, form, change):
         if not obj.title:
@@ -32,3 +32,12 @@ class MovieAdmin(admin.ModelAdmin):
         if not obj.video_file:
             raise ValidationError('Video file must be uploaded.')
         super().save_model(request, obj, form, change)
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    """
+    Admin interface for inspecting resumable uploads.
+    """
+    list_display = ('filename', 'created_by', 'offset', 'size', 'movie', 'created_at')
+    readonly_fields = ('offset', 'movie')
@@ -1,6 +1,10 @@
+import os
+
+from django.conf import settings
+from django.utils.text import get_valid_filename
 from rest_framework import serializers
 
-from video_app.models import Movie
+from video_app.models import Movie, UploadSession
 
 class VideoSerializer(serializers.ModelSerializer):
     """
@@ -12,10 +16,15 @@ class VideoSerializer(serializers.ModelSerializer):
         created_at (datetime): The timestamp when the video was created.
         title (str): The title of the video.
         description (str): A brief description of the video.
-        thumbnail_url (str): The URL of the video's thumbnail image.
+        thumbnail_url (str): The URL of the video's thumbnail image, the smallest JPEG variant if variants exist.
+        thumbnails (dict): srcset strings of the pre-sized thumbnails per image format.
+        preview_url (str): The URL of the hover preview clip.
         category (str): The name of the category the video belongs to.
+        transcode_status (str): The state of the HLS conversion.
     """
     thumbnail_url = serializers.SerializerMethodField()
+    thumbnails = serializers.SerializerMethodField()
+    preview_url = serializers.SerializerMethodField()
     category = serializers.CharField(source='category.name')
 
     class Meta:
@@ -27,11 +36,16 @@ class VideoSerializer(serializers.ModelSerializer):
             fields (tuple): The fields to include in the serialized output.
         """
         model = Movie
-        fields = ('id', 'created_at', 'title', 'description', 'thumbnail_url', 'category')
+        fields = (
+            'id', 'created_at', 'title', 'description', 'thumbnail_url', 'thumbnails', 'preview_url', 'category',
+            'transcode_status'
+        )
 
     def get_thumbnail_url(self, obj):
         """
         Get the absolute URL for the video's thumbnail image.
+        With pre-sized variants this is the smallest JPEG, the fallback src next to the srcset in thumbnails,
+        so clients ignoring the srcset do not download the largest image.
 
         Args:
             obj (Movie): The movie object being serialized.
@@ -40,6 +54,88 @@ class VideoSerializer(serializers.ModelSerializer):
             str: The absolute URL of the thumbnail image, or None if not available.
         """
         request = self.context.get('request')
-        if obj.thumbnail and request:
+        if not request:
+            return None
+        jpeg_variants = obj.thumbnail_variants.get("jpeg")
+        if jpeg_variants:
+            return request.build_absolute_uri(settings.MEDIA_URL + jpeg_variants[min(jpeg_variants, key=int)])
+        if obj.thumbnail:
             return request.build_absolute_uri(obj.thumbnail.url)
         return None
+
+    def get_preview_url(self, obj):
+        """
+        Get the absolute URL of the hover preview clip.
+
+        Args:
+            obj (Movie): The movie object being serialized.
+
+        Returns:
+            str: The absolute URL of the preview clip, or None if not available.
+        """
+        request = self.context.get('request')
+        if obj.preview_clip and request:
+            return request.build_absolute_uri(obj.preview_clip.url)
+        return None
+
+    def get_thumbnails(self, obj):
+        """
+        Get srcset strings for the pre-sized thumbnail variants, so clients pick the smallest fitting image.
+
+        Args:
+            obj (Movie): The movie object being serialized.
+
+        Returns:
+            dict: The srcset per image format, e.g. {"webp": "https://.../1_thumb_320.webp 320w, ..."},
+                empty if no variants exist.
+        """
+        request = self.context.get('request')
+        if not request:
+            return {}
+        return {
+            fmt: ", ".join(
+                f"{request.build_absolute_uri(settings.MEDIA_URL + name)} {width}w"
+                for width, name in sorted(names.items(), key=lambda item: int(item[0]))
+            )
+            for fmt, names in obj.thumbnail_variants.items()
+        }
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """
+    Serializer for resumable upload sessions.
+    It validates the movie metadata when an upload is started and reports the upload state afterwards.
+
+    Fields:
+        id (UUID): The identifier of the upload.
+        filename (str): The original filename of the video.
+        size (int): The total size of the video file in bytes.
+        offset (int): The number of bytes received so far.
+        title (str): The title of the movie to create.
+        description (str): The description of the movie to create.
+        category (int): The ID of the category of the movie to create.
+        movie (int): The ID of the created movie, once the upload is complete.
+    """
+
+    class Meta:
+        """
+        Meta class for upload session serializer.
+
+        Attributes:
+            model (Model): The model class associated with the serializer.
+            fields (tuple): The fields to include in the serialized output.
+            read_only_fields (tuple): The fields set by the server.
+        """
+        model = UploadSession
+        fields = ('id', 'filename', 'size', 'offset', 'title', 'description', 'category', 'movie')
+        read_only_fields = ('id', 'offset', 'movie')
+
+    def validate_filename(self, value):
+        """Strip directories and unsafe characters from the filename."""
+        return get_valid_filename(os.path.basename(value))
+
+    def validate_size(self, value):
+        """Check that the file is not empty."""
+        if value <= 0:
+            raise serializers.ValidationError("Size must be greater than zero.")
+        return value
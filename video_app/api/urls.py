@@ -1,9 +1,21 @@
 from django.urls import path
 
-from .views import VideoListView, video_hls
+from .views import (
+    VideoListView, VideoStatusView, UploadCreateView, UploadChunkView, PlaybackView, video_dash, video_hls,
+)
 
 urlpatterns = [
     path('video/', VideoListView.as_view(), name='video-list'),
+    path('upload/', UploadCreateView.as_view(), name='upload-create'),
+    path('upload/<uuid:upload_id>/', UploadChunkView.as_view(), name='upload-chunk'),
+    path('video/<int:movie_id>/status/', VideoStatusView.as_view(), name='video-status'),
+    path('video/<int:movie_id>/master.m3u8', video_hls),
+    path('video/<int:movie_id>/manifest.mpd', video_dash),
     path('video/<int:movie_id>/<str:resolution>/index.m3u8', video_hls),
     path('video/<int:movie_id>/<str:resolution>/<str:segment>', video_hls),
+    path('video/<int:movie_id>/play/', PlaybackView.as_view(), name='video-play'),
+    path('video/<int:movie_id>/play/<str:token>/master.m3u8', video_hls, name='video-play-hls'),
+    path('video/<int:movie_id>/play/<str:token>/manifest.mpd', video_dash, name='video-play-dash'),
+    path('video/<int:movie_id>/play/<str:token>/<str:resolution>/index.m3u8', video_hls, name='video-play-rendition'),
+    path('video/<int:movie_id>/play/<str:token>/<str:resolution>/<str:segment>', video_hls),
 ]
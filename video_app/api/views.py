@@ -1,13 +1,245 @@
 import os
+import re
+import mimetypes
 
-from django.http import FileResponse, Http404
+from urllib.parse import quote
+
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
 from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.core.files.storage import default_storage
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from rest_framework import status, generics
+from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+
+from .serializers import VideoSerializer, UploadSessionSerializer
+from video_app.models import Movie, UploadSession
+from video_app.tasks import HLS_RESOLUTIONS, TRICKPLAY_DIR, get_hls_base_dir, probe_video
+from video_app.utils import (
+    get_transcode_state, playlist_cache, sign_playback_token, upload_digests, verify_playback_token,
+)
+
+UPLOAD_READ_SIZE = 1024 * 1024
+RANGE_READ_SIZE = 64 * 1024
+
+# A single byte range; multiple ranges are rejected instead of answered with multipart/byteranges.
+BYTE_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Segments and trickplay files never change once published, so players and CDNs may keep them for a year.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# The master playlist and DASH manifest grow while renditions are published, so they are revalidated until then.
+PLAYLIST_EXTENSIONS = ('.m3u8', '.mpd')
+
+# Content types of fMP4 (CMAF) segments, which mimetypes does not know or guesses wrong.
+SEGMENT_CONTENT_TYPES = {'.m4s': 'video/iso.segment', '.mp4': 'video/mp4'}
+
+
+def file_validators(stat):
+    """
+    Derive a strong ETag and the Last-Modified timestamp from file metadata.
+    Published files are replaced by renaming, never rewritten, so inode, size and mtime identify the content.
+
+    Args:
+        stat (os.stat_result): The stat of the file.
+
+    Returns:
+        tuple: The quoted ETag and the modification time in seconds since the epoch.
+    """
+    return f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"', int(stat.st_mtime)
+
+
+def media_file_response(request, file_path, content_type=None, cache_control=None):
+    """
+    Build the response sending a file below MEDIA_ROOT.
+    Conditional requests matching the file's ETag or Last-Modified are answered with 304 Not Modified.
+    With MEDIA_OFFLOAD the view only resolves the path and the front proxy sends the bytes,
+    so a slow viewer does not hold a worker for the whole transfer. Otherwise Range requests are
+    answered by range_file_response; offloaded responses leave ranges to the proxy.
+
+    Args:
+        request (HttpRequest): The request.
+        file_path (str): The absolute path of the file.
+        content_type (str): The content type, or None to guess it from the file name.
+        cache_control (str): The Cache-Control header, or None to send none.
+
+    Returns:
+        HttpResponse: The file response, a 304 response, or an empty response carrying the offload header.
+    """
+    stat = os.stat(file_path)
+    etag, last_modified = file_validators(stat)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None and not settings.MEDIA_OFFLOAD:
+        response = range_file_response(request, file_path, stat.st_size, content_type, etag, last_modified)
+    elif response is None:
+        response = HttpResponse(content_type=content_type or guess_content_type(file_path))
+        if settings.MEDIA_OFFLOAD == 'x-accel':
+            relative_path = os.path.relpath(file_path, settings.MEDIA_ROOT)
+            response['X-Accel-Redirect'] = quote(settings.MEDIA_OFFLOAD_PREFIX + relative_path)
+        else:
+            response['X-Sendfile'] = str(file_path)
+
+    return set_cache_headers(response, etag, last_modified, cache_control)
+
+
+def set_cache_headers(response, etag, last_modified, cache_control=None):
+    """
+    Add the validators and the Cache-Control header to a response.
+
+    Returns:
+        HttpResponse: The response.
+    """
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if cache_control:
+        response['Cache-Control'] = cache_control
+    return response
+
+
+def guess_content_type(file_path):
+    """
+    Guess the content type of a file from its name, like FileResponse does.
+    """
+    return mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+
+
+def parse_byte_range(header, size):
+    """
+    Parse a Range header into the inclusive byte range of a file.
+
+    Args:
+        header (str): The Range header.
+        size (int): The size of the file in bytes.
+
+    Returns:
+        tuple: The first and last byte, or None if the header is malformed and the whole file is sent.
+
+    Raises:
+        ValueError: If the header asks for multiple ranges or the range starts behind the end of the file.
+    """
+    header = header.strip()
+    if header.startswith('bytes=') and ',' in header:
+        raise ValueError("Multiple ranges are not supported.")
+    match = BYTE_RANGE_RE.match(header)
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+        if not int(last):
+            raise ValueError("Empty suffix range.")
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    if start >= size:
+        raise ValueError("Range starts behind the end of the file.")
+    return start, end
+
+
+def if_range_matches(request, etag, last_modified):
+    """
+    Check whether a Range request applies to the current file; a stale If-Range gets the whole file.
+    """
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def read_file_range(file_path, start, length):
+    """
+    Yield length bytes of a file from start on in blocks, without reading anything outside the range.
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(RANGE_READ_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
 
-from .serializers import VideoSerializer
-from video_app.models import Movie
+
+def range_file_response(request, file_path, size, content_type, etag, last_modified):
+    """
+    Build the response streaming a whole file, or only the byte range a player asked for.
+
+    1. Without a Range header, or with a stale If-Range, stream the whole file.
+    2. For a single satisfiable range, stream only those bytes with 206 Partial Content.
+    3. For multiple or unsatisfiable ranges, answer 416 with the file size in Content-Range.
+
+    Returns:
+        HttpResponse: The 200, 206 or 416 response.
+    """
+    byte_range = None
+    header = request.headers.get('Range')
+    if header and if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_byte_range(header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        response = FileResponse(open(file_path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            read_file_range(file_path, start, end - start + 1), status=206,
+            content_type=content_type or guess_content_type(file_path)
+        )
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def playlist_response(request, movie_id, file_path, content_type, growing):
+    """
+    Build the response of a playlist or manifest, served from the playlist cache when possible.
+    Playlists of finished titles are cached with their validators, so in steady state neither
+    the filesystem nor the transcode status is read. They are cached for HLS_PLAYLIST_MAX_AGE;
+    a master playlist or manifest that still grows while renditions are published has to be
+    revalidated on every request.
+
+    Args:
+        request (HttpRequest): The request.
+        movie_id (int): The ID of the movie.
+        file_path (str): The absolute path of the playlist.
+        content_type (str): The content type, or None to guess it from the file name.
+        growing (bool): Whether the file lists renditions and grows during the conversion.
+
+    Returns:
+        HttpResponse: The playlist or a 304 response.
+    """
+    name = os.path.relpath(file_path, settings.MEDIA_ROOT)
+    max_age = f"public, max-age={settings.HLS_PLAYLIST_MAX_AGE}"
+    entry, cache_control = playlist_cache.get(movie_id, name), max_age
+    if entry is None:
+        if not os.path.exists(file_path):
+            raise Http404("File not found")
+        with open(file_path, 'rb') as f:
+            body, (etag, last_modified) = f.read(), file_validators(os.fstat(f.fileno()))
+        entry = {"body": body, "etag": etag, "last_modified": last_modified}
+        state = get_transcode_state(movie_id)
+        if state is not None and state["status"] == Movie.TranscodeStatus.READY:
+            playlist_cache.set(movie_id, name, entry)
+        elif growing:
+            cache_control = "no-cache"
+
+    response = get_conditional_response(request, etag=entry["etag"], last_modified=entry["last_modified"])
+    if response is None:
+        response = HttpResponse(entry["body"], content_type=content_type or guess_content_type(file_path))
+    return set_cache_headers(response, entry["etag"], entry["last_modified"], cache_control)
 
 
 class VideoListView(generics.GenericAPIView):
@@ -39,24 +271,284 @@ class VideoListView(generics.GenericAPIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-def video_hls(request, movie_id, resolution, segment=None):
+def check_playback_token(movie_id, token):
+    """
+    Reject a playback request without a valid token for the movie.
+    Unsigned requests are only rejected with PLAYBACK_TOKENS_REQUIRED.
+
+    Raises:
+        PermissionDenied: If the token is missing but required, invalid or expired.
+    """
+    if token is None and not settings.PLAYBACK_TOKENS_REQUIRED:
+        return
+    if token is None or not verify_playback_token(movie_id, token):
+        raise PermissionDenied("Invalid or expired playback token.")
+
+
+class PlaybackView(APIView):
+    """
+    API view issuing a signed playback session for a movie.
+    The token is part of the returned URLs' path, so the relative URIs in playlists and manifests
+    resolve to signed URLs as well and every segment request carries it without rewriting any playlist.
+
+    Attributes:
+        permission_classes (list): The permission classes for the view.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, movie_id):
+        """
+        Handle POST request starting a play session.
+
+        1. Check that the movie exists.
+        2. Sign a token for the movie, valid for PLAYBACK_TOKEN_TTL seconds.
+        3. Return the signed HLS and DASH URLs and the signed playlist URL of every published rendition.
+           Titles converted before master playlists existed get their highest rendition as hls_url.
+
+        Returns:
+            Response: The token, its expiry and the signed playback URLs.
+        """
+        movie = get_object_or_404(Movie, pk=movie_id)
+        token = sign_playback_token(movie.id)
+        kwargs = {"movie_id": movie.id, "token": token}
+        hls_base_dir = get_hls_base_dir(movie.id)
+        renditions = {
+            res: request.build_absolute_uri(reverse('video-play-rendition', kwargs={**kwargs, "resolution": res}))
+            for res in HLS_RESOLUTIONS
+            if os.path.isfile(os.path.join(hls_base_dir, res, "index.m3u8"))
+        }
+        hls_url = request.build_absolute_uri(reverse('video-play-hls', kwargs=kwargs))
+        if renditions and not os.path.isfile(os.path.join(hls_base_dir, "master.m3u8")):
+            hls_url = list(renditions.values())[-1]
+        return Response({
+            "token": token,
+            "expires_at": int(token.partition(".")[0]),
+            "hls_url": hls_url,
+            "dash_url": request.build_absolute_uri(reverse('video-play-dash', kwargs=kwargs)),
+            "renditions": renditions,
+        }, status=status.HTTP_201_CREATED)
+
+
+def video_hls(request, movie_id, resolution=None, segment=None, token=None):
     """
     Handle HLS video streaming.
 
-    1. Validate the request parameters.
-    2. If segment is None, set it to 'index.m3u8'.
-    3. Construct the file path for the video segment.
-    4. If the file exists, return it as a FileResponse.
-    5. If not, raise a 404 error.
+    1. Validate the request parameters and the playback token.
+    2. If resolution is None, serve the movie's master playlist.
+    3. If segment is None, set it to 'index.m3u8'.
+    4. Construct the file path for the video segment.
+    5. Serve playlists through the playlist cache.
+    6. If another file exists, return it as a FileResponse, or hand it to the front proxy with MEDIA_OFFLOAD.
+       Segments and trickplay files are cached as immutable, fMP4 segments get their CMAF content type.
+       Conditional requests may get a 304 response.
+    7. If not, raise a 404 error.
 
     Returns:
         FileResponse: The response containing the video segment or an error.
     """
-    if segment is None:
-        segment = 'index.m3u8'
-        
-    file_path = os.path.join(settings.MEDIA_ROOT, f"videos/hls/{movie_id}/{resolution}/{segment}")
+    check_playback_token(movie_id, token)
+    if resolution is None:
+        file_path = os.path.join(settings.MEDIA_ROOT, f"videos/hls/{movie_id}/master.m3u8")
+    else:
+        if segment is None:
+            segment = 'index.m3u8'
+        file_path = os.path.join(settings.MEDIA_ROOT, f"videos/hls/{movie_id}/{resolution}/{segment}")
+
+    extension = os.path.splitext(file_path)[1]
+    if extension in PLAYLIST_EXTENSIONS:
+        return playlist_response(request, movie_id, file_path, None, growing=resolution is None)
     if os.path.exists(file_path):
-        return FileResponse(open(file_path, 'rb'))
+        if resolution == TRICKPLAY_DIR:
+            content_type = 'text/vtt' if segment.endswith('.vtt') else None
+            return media_file_response(request, file_path, content_type, IMMUTABLE_CACHE_CONTROL)
+        return media_file_response(request, file_path, SEGMENT_CONTENT_TYPES.get(extension), IMMUTABLE_CACHE_CONTROL)
     else:
         raise Http404("File not found")
+
+
+def video_dash(request, movie_id, token=None):
+    """
+    Handle DASH streaming by serving the movie's manifest.
+    Its segment URLs are relative and resolve to the segments served by video_hls.
+
+    Returns:
+        FileResponse: The response containing the manifest or an error.
+    """
+    check_playback_token(movie_id, token)
+    file_path = os.path.join(settings.MEDIA_ROOT, f"videos/hls/{movie_id}/manifest.mpd")
+    return playlist_response(request, movie_id, file_path, 'application/dash+xml', growing=True)
+
+
+class VideoStatusView(APIView):
+    """
+    API view for polling the transcode status of a movie.
+
+    Attributes:
+        permission_classes (list): The permission classes for the view.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, movie_id):
+        """
+        Handle GET request for the transcode status.
+
+        1. Read the status and live progress from the cache.
+        2. Fall back to the persisted status if the cache holds none.
+        3. If the movie does not exist, raise a 404 error.
+
+        Returns:
+            Response: The status and progress in percent.
+        """
+        state = get_transcode_state(movie_id)
+        if state is None:
+            raise Http404("Movie not found")
+        return Response(state, status=status.HTTP_200_OK)
+
+
+class UploadCreateView(generics.CreateAPIView):
+    """
+    API view for starting a resumable chunked upload of an original video file.
+
+    Attributes:
+        serializer_class (Serializer): The serializer class for validating the upload metadata.
+        permission_classes (list): The permission classes for the view.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAdminUser]
+
+    def perform_create(self, serializer):
+        """
+        Save the upload session and create its empty partial file.
+        """
+        session = serializer.save(created_by=self.request.user)
+        os.makedirs(os.path.dirname(session.partial_path), exist_ok=True)
+        open(session.partial_path, 'wb').close()
+
+
+class UploadChunkView(APIView):
+    """
+    API view for appending chunks to a resumable upload and querying its offset.
+    Clients send each chunk as the raw request body with an Upload-Offset header.
+    After an interruption they read the offset and continue from there.
+
+    Attributes:
+        permission_classes (list): The permission classes for the view.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, upload_id):
+        """
+        Handle GET request for the state of an upload.
+
+        Returns:
+            Response: The upload state with the current offset, also in the Upload-Offset header.
+        """
+        session = get_object_or_404(UploadSession, id=upload_id, created_by=request.user)
+        return self.upload_response(session)
+
+    def head(self, request, upload_id):
+        """
+        Handle HEAD request for the current offset of an upload.
+        """
+        return self.get(request, upload_id)
+
+    def patch(self, request, upload_id):
+        """
+        Handle PATCH request appending a chunk to an upload.
+
+        1. Check that the Upload-Offset header matches the bytes received so far.
+        2. Stream the request body to the partial file without buffering it in memory,
+           updating the running SHA-256 of the upload with it.
+        3. Advance the offset.
+        4. If the last chunk arrived, probe the file and create the movie.
+
+        Returns:
+            Response: The upload state, or an error if the offset or chunk is invalid.
+        """
+        session = get_object_or_404(UploadSession, id=upload_id, created_by=request.user)
+        if session.movie_id:
+            return self.upload_response(session)
+
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers.get('Content-Length') or 0)
+        except (KeyError, ValueError):
+            return Response({"error": "A numeric Upload-Offset header is required."}, status=status.HTTP_400_BAD_REQUEST)
+        if offset != session.offset:
+            return self.upload_response(session, status.HTTP_409_CONFLICT)
+        if offset + length > session.size:
+            return Response({"error": "Chunk exceeds the announced file size."}, status=status.HTTP_400_BAD_REQUEST)
+
+        sha256 = upload_digests.take(session.id, offset)
+        written = self.write_chunk(request, session.partial_path, offset, session.size - offset, sha256)
+        if not UploadSession.objects.filter(pk=session.pk, offset=offset).update(offset=offset + written):
+            session.refresh_from_db()
+            return self.upload_response(session, status.HTTP_409_CONFLICT)
+        session.offset = offset + written
+
+        if session.is_complete:
+            return self.complete(session, sha256.hexdigest() if sha256 else '')
+        if sha256:
+            upload_digests.put(session.id, session.offset, sha256)
+        return self.upload_response(session)
+
+    def write_chunk(self, request, path, offset, remaining, sha256):
+        """
+        Copy the request body into the partial file at offset, reading it in small blocks.
+        Anything behind the chunk, e.g. the tail of an interrupted earlier attempt, is truncated.
+        Every block written is added to sha256, unless it is None.
+
+        Returns:
+            int: The number of bytes written.
+        """
+        written = 0
+        stream = request.stream
+        with open(path, 'r+b') as f:
+            f.seek(offset)
+            while stream is not None and written < remaining:
+                block = stream.read(min(UPLOAD_READ_SIZE, remaining - written))
+                if not block:
+                    break
+                f.write(block)
+                if sha256:
+                    sha256.update(block)
+                written += len(block)
+            f.truncate(offset + written)
+        return written
+
+    def complete(self, session, video_sha256):
+        """
+        Probe the completed file, move it to the originals and create the movie from it.
+        Creating the movie triggers the regular post_save pipeline; the probe result and the running hash
+        are stored on the movie, so neither the conversion nor the re-upload check reads the file again.
+        Without the running hash, video_sha256 stays empty and the post_save pipeline hashes the file in a job.
+
+        Returns:
+            Response: The upload state with the created movie, or an error if the file is no video.
+        """
+        metadata = probe_video(session.partial_path)
+        if not metadata["width"]:
+            return Response({"error": "The uploaded file contains no video stream."}, status=status.HTTP_400_BAD_REQUEST)
+
+        name = default_storage.get_available_name(f"videos/originals/{session.filename}")
+        os.makedirs(os.path.dirname(default_storage.path(name)), exist_ok=True)
+        os.replace(session.partial_path, default_storage.path(name))
+
+        session.movie = Movie.objects.create(
+            title=session.title,
+            description=session.description,
+            category=session.category,
+            video_file=name,
+            video_sha256=video_sha256,
+            **{f"source_{key}": value for key, value in metadata.items()}
+        )
+        session.save(update_fields=['movie'])
+        return self.upload_response(session, status.HTTP_201_CREATED)
+
+    def upload_response(self, session, status_code=status.HTTP_200_OK):
+        """
+        Build the response describing the state of an upload.
+        """
+        response = Response(UploadSessionSerializer(session).data, status=status_code)
+        response['Upload-Offset'] = str(session.offset)
+        return response
@@ -0,0 +1,56 @@
+import resource
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from video_app.tasks import transcode_hls
+
+
+class Command(BaseCommand):
+    """
+    Management command comparing the single-decode HLS transcode against the per-rendition loop.
+    It reports wall time and the CPU seconds spent in the ffmpeg child processes for each mode.
+    """
+    help = "Benchmark single-decode against per-rendition HLS transcoding for a video file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("input_file", help="Path to the source video file.")
+        parser.add_argument("--runs", type=int, default=1, help="Number of runs per mode.")
+
+    def handle(self, *args, **options):
+        if options["runs"] < 1:
+            raise CommandError("--runs must be at least 1.")
+
+        results = {}
+        for mode, single_decode in (("per_rendition", False), ("single_decode", True)):
+            wall, cpu = 0.0, 0.0
+            for _ in range(options["runs"]):
+                run_wall, run_cpu = self.measure(options["input_file"], single_decode)
+                wall += run_wall
+                cpu += run_cpu
+            results[mode] = (wall / options["runs"], cpu / options["runs"])
+            self.stdout.write(f"{mode:<15} wall {results[mode][0]:8.2f}s  cpu {results[mode][1]:8.2f}s")
+
+        base_wall, base_cpu = results["per_rendition"]
+        wall, cpu = results["single_decode"]
+        if wall and cpu:
+            self.stdout.write(self.style.SUCCESS(
+                f"single_decode speedup: wall x{base_wall / wall:.2f}, cpu x{base_cpu / cpu:.2f}"
+            ))
+
+    def measure(self, input_file, single_decode):
+        """
+        Transcode input_file once into a temporary directory.
+
+        Returns:
+            tuple: Wall seconds and child CPU seconds (user + system) of the run.
+        """
+        with tempfile.TemporaryDirectory() as output_dir, tempfile.TemporaryDirectory() as work_dir:
+            usage_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+            start = time.perf_counter()
+            transcode_hls(input_file, output_dir, work_dir, single_decode=single_decode)
+            wall = time.perf_counter() - start
+            usage_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+        return wall, cpu
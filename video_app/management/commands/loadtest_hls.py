@@ -0,0 +1,80 @@
+import time
+import urllib.request
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from video_app.tasks import HLS_SEGMENT_SECONDS
+
+
+class Command(BaseCommand):
+    """
+    Management command measuring how many concurrent viewers the HLS endpoints sustain.
+    Every simulated viewer fetches the given segment URLs back to back; a real viewer needs one
+    segment per HLS_SEGMENT_SECONDS, so the segment rate translates into a viewer capacity.
+    Run it once with MEDIA_OFFLOAD empty and once with MEDIA_OFFLOAD=x-accel behind the nginx
+    service to compare streaming through Django against offloading to the proxy.
+    """
+    help = "Load test HLS segment delivery with concurrent viewers and report the sustainable viewer count."
+
+    def add_arguments(self, parser):
+        parser.add_argument("urls", nargs="+", help="Segment URLs, fetched round-robin by every viewer.")
+        parser.add_argument("--viewers", type=int, default=50, help="Number of concurrent viewers.")
+        parser.add_argument("--requests", type=int, default=20, help="Number of segments per viewer.")
+        parser.add_argument("--timeout", type=float, default=30.0, help="Timeout per request in seconds.")
+
+    def handle(self, *args, **options):
+        if options["viewers"] < 1 or options["requests"] < 1:
+            raise CommandError("--viewers and --requests must be at least 1.")
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["viewers"]) as executor:
+            results = list(executor.map(
+                lambda viewer: self.watch(viewer, options["urls"], options["requests"], options["timeout"]),
+                range(options["viewers"])
+            ))
+        wall = time.perf_counter() - start
+
+        latencies = sorted(latency for viewer in results for latency, _ in viewer if latency is not None)
+        errors = sum(1 for viewer in results for latency, _ in viewer if latency is None)
+        transferred = sum(size for viewer in results for _, size in viewer)
+        if not latencies:
+            raise CommandError(f"All {errors} requests failed.")
+
+        rate = len(latencies) / wall
+        self.stdout.write(
+            f"requests {len(latencies)}  errors {errors}  wall {wall:.2f}s  "
+            f"{rate:.1f} segments/s  {transferred / wall / 1024 / 1024:.1f} MiB/s"
+        )
+        self.stdout.write(
+            f"latency p50 {self.percentile(latencies, 50) * 1000:.0f}ms  "
+            f"p95 {self.percentile(latencies, 95) * 1000:.0f}ms  max {latencies[-1] * 1000:.0f}ms"
+        )
+        self.stdout.write(self.style.SUCCESS(f"sustainable viewers: {int(rate * HLS_SEGMENT_SECONDS)}"))
+
+    def watch(self, viewer, urls, count, timeout):
+        """
+        Fetch count segments as one viewer, starting at a different URL per viewer.
+
+        Returns:
+            list: (latency, bytes) per request; latency is None for failed requests.
+        """
+        results = []
+        for index in range(count):
+            url = urls[(viewer + index) % len(urls)]
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=timeout) as response:
+                    size = len(response.read())
+            except OSError:
+                results.append((None, 0))
+                continue
+            results.append((time.perf_counter() - start, size))
+        return results
+
+    def percentile(self, values, percent):
+        """
+        Get the percentile of sorted values by the nearest-rank method.
+        """
+        return values[max(0, -(-len(values) * percent // 100) - 1)]
@@ -0,0 +1,92 @@
+import signal
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """
+    Management command starting and supervising the RQ worker processes.
+    RQ_WORKERS sets the number of workers per queue; a worker that exits is restarted after restart_delay
+    seconds until the command receives SIGTERM or SIGINT, which is forwarded to all workers.
+    """
+    help = "Start the configured number of RQ workers per queue and restart them when they exit."
+
+    poll_interval = 1.0
+    restart_delay = 5.0
+
+    def handle(self, *args, **options):
+        unknown = set(settings.RQ_WORKERS) - set(settings.RQ_QUEUES)
+        if unknown:
+            raise CommandError(f"RQ_WORKERS references unknown queues: {', '.join(sorted(unknown))}")
+
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        self.workers = {}
+        self.restarts = {}
+        for queue, count in settings.RQ_WORKERS.items():
+            for index in range(count):
+                self.spawn(queue, index)
+        self.stdout.write(f"Started {len(self.workers)} workers: {dict(settings.RQ_WORKERS)}")
+
+        try:
+            self.supervise()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.shutdown()
+
+    def worker_queues(self, queue):
+        """
+        Get the queues a worker of the given pool listens on, in priority order.
+        Mail workers also drain the default queue so jobs enqueued without a queue name still run.
+        """
+        return [queue, "default"] if queue == "mail" else [queue]
+
+    def spawn(self, queue, index):
+        """
+        Start one worker process for a queue pool.
+        """
+        cmd = [sys.executable, "-m", "django", "rqworker", *self.worker_queues(queue)]
+        self.workers[(queue, index)] = subprocess.Popen(cmd)
+
+    def supervise(self):
+        """
+        Restart exited workers until the command is stopped.
+        Each exited worker gets its own restart time, so one crashing worker neither delays
+        the restart of others nor keeps the loop from noticing a stop.
+        """
+        while not self.stopping:
+            now = time.monotonic()
+            for (queue, index), process in list(self.workers.items()):
+                if self.stopping:
+                    break
+                restart_at = self.restarts.get((queue, index))
+                if restart_at is None and process.poll() is not None:
+                    self.stderr.write(
+                        f"Worker {queue}#{index} exited with {process.returncode}, restarting in {self.restart_delay}s"
+                    )
+                    self.restarts[(queue, index)] = now + self.restart_delay
+                elif restart_at is not None and restart_at <= now:
+                    del self.restarts[(queue, index)]
+                    self.spawn(queue, index)
+            time.sleep(self.poll_interval)
+
+    def stop(self, signum, frame):
+        """
+        Signal handler ending the supervision loop.
+        """
+        self.stopping = True
+
+    def shutdown(self):
+        """
+        Ask all workers to finish their current job and wait for them to exit.
+        """
+        for process in self.workers.values():
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+        for process in self.workers.values():
+            process.wait()
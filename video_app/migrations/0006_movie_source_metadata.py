@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_app', '0005_remove_movie_hls_playlist_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='source_bitrate',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='source_frame_rate',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='source_has_audio',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='source_height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='source_width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:58
+
+import os
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def has_hls_output(movie_id):
+    """Check for a master playlist or a rendition playlist of the previous pipeline."""
+    hls_dir = os.path.join(settings.MEDIA_ROOT, f"videos/hls/{movie_id}")
+    if os.path.isfile(os.path.join(hls_dir, "master.m3u8")):
+        return True
+    return os.path.isdir(hls_dir) and any(
+        os.path.isfile(os.path.join(hls_dir, entry, "index.m3u8")) for entry in os.listdir(hls_dir)
+    )
+
+
+def mark_existing_movies(apps, schema_editor):
+    """
+    Movies created before status tracking are ready if the previous pipeline left HLS output,
+    otherwise their conversion never finished and they are marked as failed.
+    """
+    Movie = apps.get_model('video_app', 'Movie')
+    ready_ids = [movie_id for movie_id in Movie.objects.values_list('id', flat=True) if has_hls_output(movie_id)]
+    Movie.objects.filter(id__in=ready_ids).update(transcode_status='ready', transcode_progress=100.0)
+    Movie.objects.exclude(id__in=ready_ids).update(transcode_status='failed')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_app', '0006_movie_source_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='source_duration',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='transcode_progress',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='transcode_status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('failed', 'Failed'), ('ready', 'Ready')], default='queued', max_length=16),
+        ),
+        migrations.RunPython(mark_existing_movies, migrations.RunPython.noop),
+    ]
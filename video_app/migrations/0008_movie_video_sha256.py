@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_app', '0007_movie_transcode_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='video_sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_app', '0009_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='first_playable_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
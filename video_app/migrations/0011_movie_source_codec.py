@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_app', '0010_movie_first_playable_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='source_keyframe_interval',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='source_pix_fmt',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='source_video_codec',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='source_video_level',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='source_video_profile',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+    ]
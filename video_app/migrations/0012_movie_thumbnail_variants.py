@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_app', '0011_movie_source_codec'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='thumbnail_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
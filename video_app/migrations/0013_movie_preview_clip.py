@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_app', '0012_movie_thumbnail_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='preview_clip',
+            field=models.FileField(blank=True, null=True, upload_to='previews/'),
+        ),
+    ]
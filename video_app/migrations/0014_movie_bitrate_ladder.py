@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_app', '0013_movie_preview_clip'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='bitrate_ladder',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -1,4 +1,6 @@
 import os
+import uuid
+import hashlib
 
 from django.db import models
 from django.conf import settings
@@ -15,17 +17,61 @@ class Movie(models.Model):
         title (str): The title of the movie.
         description (str): A brief description of the movie.
         thumbnail (ImageField): The thumbnail image for the movie.
+        thumbnail_variants (dict): The pre-sized thumbnail images as {format: {width: name}}.
+        preview_clip (FileField): A short, silent, low-bitrate clip played on hover.
         category (ForeignKey): The category the movie belongs to.
         video_file (FileField): The original video file.
-        hls_master_playlist (FileField): The HLS master playlist file.
+        hls_master_playlist (FileField): The HLS master playlist file, written after conversion.
+        source_width (int): The probed width of the original video.
+        source_height (int): The probed height of the original video.
+        source_frame_rate (float): The probed frame rate of the original video.
+        source_bitrate (int): The probed bitrate of the original video in bits per second.
+        source_has_audio (bool): Whether the original video has an audio stream, None until probed.
+        source_duration (float): The probed duration of the original video in seconds.
+        source_video_codec (str): The probed video codec of the original video, e.g. "h264".
+        source_video_profile (str): The probed codec profile of the original video, e.g. "High".
+        source_video_level (int): The probed codec level of the original video, e.g. 40 for level 4.0.
+        source_pix_fmt (str): The probed pixel format of the original video.
+        source_keyframe_interval (float): The longest distance between two keyframes of the original video
+            in seconds, only probed for sources that may be stream-copied.
+        bitrate_ladder (dict): The per-title video bitrate cap per rendition name, from the complexity analysis.
+        transcode_status (str): The state of the HLS conversion.
+        transcode_progress (float): The conversion progress in percent, persisted on status changes only.
+        video_sha256 (str): The SHA-256 hash of the original video file, used to detect re-uploads.
+        first_playable_at (datetime): The timestamp when the first rendition was published.
     """
+
+    class TranscodeStatus(models.TextChoices):
+        QUEUED = 'queued', 'Queued'
+        RUNNING = 'running', 'Running'
+        FAILED = 'failed', 'Failed'
+        READY = 'ready', 'Ready'
+
     created_at = models.DateTimeField(auto_now_add=True)
     title = models.CharField(max_length=255)
     description = models.TextField()
     thumbnail = models.ImageField(upload_to='thumbnails/', null=True, blank=True)
+    thumbnail_variants = models.JSONField(default=dict, blank=True)
+    preview_clip = models.FileField(upload_to='previews/', null=True, blank=True)
     category = models.ForeignKey('Category', on_delete=models.CASCADE, related_name='movies')
     video_file = models.FileField(upload_to='videos/originals/')
     hls_master_playlist = models.FileField(upload_to='videos/hls_master/', null=True, blank=True)
+    source_width = models.PositiveIntegerField(null=True, blank=True)
+    source_height = models.PositiveIntegerField(null=True, blank=True)
+    source_frame_rate = models.FloatField(null=True, blank=True)
+    source_bitrate = models.PositiveBigIntegerField(null=True, blank=True)
+    source_has_audio = models.BooleanField(null=True, blank=True)
+    source_duration = models.FloatField(null=True, blank=True)
+    source_video_codec = models.CharField(max_length=32, null=True, blank=True)
+    source_video_profile = models.CharField(max_length=32, null=True, blank=True)
+    source_video_level = models.PositiveSmallIntegerField(null=True, blank=True)
+    source_pix_fmt = models.CharField(max_length=32, null=True, blank=True)
+    source_keyframe_interval = models.FloatField(null=True, blank=True)
+    bitrate_ladder = models.JSONField(default=dict, blank=True)
+    transcode_status = models.CharField(max_length=16, choices=TranscodeStatus.choices, default=TranscodeStatus.QUEUED)
+    transcode_progress = models.FloatField(default=0.0)
+    video_sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    first_playable_at = models.DateTimeField(null=True, blank=True)
 
     def clean(self):
         """
@@ -48,6 +94,44 @@ class Movie(models.Model):
         self.full_clean()
         super().save(*args, **kwargs)
 
+    def hash_video_file(self):
+        """
+        Compute the SHA-256 hash of the original video file.
+        The file is read in chunks, so even multi-GB uploads are never loaded into memory at once.
+
+        Returns:
+            str: The hex digest, or an empty string if the file cannot be read.
+        """
+        sha256 = hashlib.sha256()
+        try:
+            for chunk in self.video_file.chunks(chunk_size=1024 * 1024):
+                sha256.update(chunk)
+        except OSError:
+            return ''
+        return sha256.hexdigest()
+
+    def find_converted_duplicate(self):
+        """
+        Find an already converted movie with the same original video file.
+
+        Returns:
+            Movie: The converted movie, or None if there is none.
+        """
+        if not self.video_sha256:
+            return None
+        return Movie.objects.filter(
+            video_sha256=self.video_sha256, transcode_status=self.TranscodeStatus.READY
+        ).exclude(pk=self.pk).order_by('pk').first()
+
+    @property
+    def time_to_first_playable(self):
+        """
+        The time between upload and the first playable master playlist, or None if not playable yet.
+        """
+        if self.first_playable_at is None:
+            return None
+        return self.first_playable_at - self.created_at
+
     def get_hls_index_path(self, resolution):
         """
         Get the HLS index path for a specific resolution.
@@ -60,6 +144,15 @@ class Movie(models.Model):
         """
         return os.path.join(settings.MEDIA_URL, f"videos/hls/{self.id}/{resolution}/index.m3u8")
 
+    def get_hls_master_path(self):
+        """
+        Get the HLS master playlist path listing all renditions for adaptive bitrate playback.
+
+        Returns:
+            str: The HLS master playlist path.
+        """
+        return os.path.join(settings.MEDIA_URL, f"videos/hls/{self.id}/master.m3u8")
+
     def __str__(self):
         """
         String representation of the movie.
@@ -81,3 +174,52 @@ class Category(models.Model):
         String representation of the category.
         """
         return self.name
+
+
+class UploadSession(models.Model):
+    """
+    Model representing a resumable chunked upload of an original video file.
+    Chunks are appended to a partial file on disk; once all bytes arrived a Movie is created from it.
+
+    Attributes:
+        id (UUID): The identifier of the upload, used in the upload URL.
+        created_at (datetime): The timestamp when the upload was started.
+        created_by (ForeignKey): The user who started the upload.
+        filename (str): The original filename of the video.
+        size (int): The total size of the video file in bytes.
+        offset (int): The number of bytes received so far.
+        title (str): The title of the movie to create.
+        description (str): The description of the movie to create.
+        category (ForeignKey): The category of the movie to create.
+        movie (ForeignKey): The movie created from the completed upload.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    title = models.CharField(max_length=255)
+    description = models.TextField()
+    category = models.ForeignKey('Category', on_delete=models.CASCADE, related_name='upload_sessions')
+    movie = models.ForeignKey('Movie', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    @property
+    def partial_path(self):
+        """
+        The path of the partial file the chunks are written to.
+        """
+        return os.path.join(settings.MEDIA_ROOT, f"videos/uploads/{self.id}.part")
+
+    @property
+    def is_complete(self):
+        """
+        Whether all bytes of the file were received.
+        """
+        return self.offset >= self.size
+
+    def __str__(self):
+        """
+        String representation of the upload session.
+        """
+        return f"{self.filename} ({self.offset}/{self.size})"
@@ -7,8 +7,9 @@ from django.db import transaction
 from django.dispatch import receiver
 from django.conf import settings
 
-from .models import Movie
-from .tasks import convert_movie_task, generate_thumbnail
+from .models import Movie, UploadSession
+from .utils import playlist_cache, upload_digests
+from .tasks import dispatch_conversion, get_preview_name, hash_movie_task
 
 
 @receiver(post_save, sender=Movie)
@@ -17,14 +18,19 @@ def movie_post_save(sender, instance, created, **kwargs):
     Signal handler for post-save actions on Movie instances.
     If a new Movie instance is not created, the function returns immediately.
     If a new Movie instance is created, has a title, description, category and has an associated video file.
-    It triggers asynchronous tasks for generating a thumbnail and converting the video.
+    It triggers asynchronous tasks for generating thumbnails, trickplay previews and converting the video.
+    With inline previews, the conversion produces thumbnails and trickplay itself.
+    If the same video file was already converted for another movie, its renditions and thumbnail
+    are reused instead. A movie saved without the hash of its video file is hashed in a job first.
     """
     if not created:
         return
 
     if created and instance.title and instance.description and instance.category_id and instance.video_file:
-        transaction.on_commit(lambda: generate_thumbnail.delay(instance.id))
-        transaction.on_commit(lambda: convert_movie_task.delay(instance.id))
+        if instance.video_sha256:
+            transaction.on_commit(lambda: dispatch_conversion(instance))
+        else:
+            transaction.on_commit(lambda: hash_movie_task.delay(instance.id))
 
 
 @receiver(post_delete, sender=Movie)
@@ -41,9 +47,29 @@ def delete_movie_files(sender, instance, **kwargs):
     hls_base_dir = os.path.join(settings.MEDIA_ROOT, f'videos/hls/{instance.id}')
     if os.path.isdir(hls_base_dir):
         shutil.rmtree(hls_base_dir)
+    playlist_cache.invalidate(instance.id)
+
+    work_dir = os.path.join(settings.MEDIA_ROOT, f'videos/work/{instance.id}')
+    if os.path.isdir(work_dir):
+        shutil.rmtree(work_dir)
 
     thumb_dir = os.path.join(settings.MEDIA_ROOT, 'thumbnails')
-    pattern = os.path.join(thumb_dir, f"{instance.id}_thumb*.jpg")
+    pattern = os.path.join(thumb_dir, f"{instance.id}_thumb*")
     for thumb_file in glob.glob(pattern):
         if os.path.isfile(thumb_file):
             os.remove(thumb_file)
+
+    preview_path = os.path.join(settings.MEDIA_ROOT, get_preview_name(instance.id))
+    if os.path.isfile(preview_path):
+        os.remove(preview_path)
+
+
+@receiver(post_delete, sender=UploadSession)
+def delete_upload_file(sender, instance, **kwargs):
+    """
+    Signal handler for post-delete actions on UploadSession instances.
+    It removes the partial file and running hash of an upload that never completed.
+    """
+    upload_digests.discard(instance.id)
+    if os.path.isfile(instance.partial_path):
+        os.remove(instance.partial_path)
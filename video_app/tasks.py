@@ -1,113 +1,1971 @@
 import os
-import subprocess
+import glob
 import json
+import logging
+import math
+import shutil
+import subprocess
+import tempfile
+import uuid
+import xml.etree.ElementTree as ET
 
 from django.conf import settings
-from django.core.files import File
+from django.utils import timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from django_rq import job
+from rq import Retry, get_current_job
 
 from .models import Movie
+from .utils import ProgressTracker, ffmpeg_threads, set_transcode_status
+
+logger = logging.getLogger(__name__)
+
+
+THUMBNAIL_WIDTHS = (320, 640, 1280)
+
+THUMBNAIL_FORMATS = {
+    "webp": ["-c:v", "libwebp", "-quality", "80"],
+    "jpeg": ["-q:v", "3"],
+}
+
+THUMBNAIL_EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+
+
+def get_thumbnail_name(movie_id, width, fmt):
+    """
+    Get the media-relative name of a thumbnail variant.
+
+    Args:
+        movie_id (int): The ID of the movie.
+        width (int): The width of the variant.
+        fmt (str): The image format, a key of THUMBNAIL_FORMATS.
+
+    Returns:
+        str: The name, e.g. "thumbnails/1_thumb_640.webp".
+    """
+    return f"thumbnails/{movie_id}_thumb_{width}.{THUMBNAIL_EXTENSIONS[fmt]}"
+
+
+def build_thumbnail_command(input_file, movie_id, threads=None):
+    """
+    Build one ffmpeg command writing every thumbnail variant from a single decoded frame.
+    -ss is given before -i, so ffmpeg seeks in the container instead of decoding up to the frame.
+    The frame is scaled once per width, never above the source width, and encoded in every format.
+
+    Args:
+        input_file (str): The path to the input video file.
+        movie_id (int): The ID of the movie.
+        threads (int): The threads granted to the process, or None to let ffmpeg decide.
+
+    Returns:
+        list: The ffmpeg command.
+    """
+    graph, output_args = thumbnail_outputs("0:v", movie_id)
+    cmd = ["ffmpeg", "-y", *thread_args(threads), "-ss", "00:00:01.000", "-i", input_file]
+    return cmd + ["-filter_complex", graph] + output_args
+
+
+def thumbnail_outputs(label, movie_id):
+    """
+    Build the filter graph and output arguments writing every thumbnail variant from one frame of a stream.
+
+    Args:
+        label (str): The filter graph label of the stream, e.g. "0:v".
+        movie_id (int): The ID of the movie.
+
+    Returns:
+        tuple: The filter graph and the ffmpeg output arguments.
+    """
+    labels = "".join(f"[t{i}]" for i in range(len(THUMBNAIL_WIDTHS)))
+    graph = [f"[{label}]split={len(THUMBNAIL_WIDTHS)}{labels}"]
+    output_args = []
+    for i, width in enumerate(THUMBNAIL_WIDTHS):
+        outputs = "".join(f"[t{i}{fmt}]" for fmt in THUMBNAIL_FORMATS)
+        graph.append(f"[t{i}]scale=w='min(iw,{width})':h=-2,split={len(THUMBNAIL_FORMATS)}{outputs}")
+        for fmt, encoder_args in THUMBNAIL_FORMATS.items():
+            path = os.path.join(settings.MEDIA_ROOT, get_thumbnail_name(movie_id, width, fmt))
+            output_args += ["-map", f"[t{i}{fmt}]", "-frames:v", "1", *encoder_args, path]
+    return ";".join(graph), output_args
+
+
+def get_thumbnail_variants(movie_id):
+    """
+    Get the thumbnail variants of a movie as stored in Movie.thumbnail_variants.
+
+    Returns:
+        dict: The variant names as {format: {width: name}}.
+    """
+    return {
+        fmt: {str(width): get_thumbnail_name(movie_id, width, fmt) for width in THUMBNAIL_WIDTHS}
+        for fmt in THUMBNAIL_FORMATS
+    }
 
 
-@job
+@job('thumbnails')
 def generate_thumbnail(movie_id):
     """
-    Generate a thumbnail for the specified movie.
-    This function uses ffmpeg to extract a frame from the video file and save it as a thumbnail image.
+    Generate the thumbnails for the specified movie.
+    This function uses ffmpeg to extract a frame from the video file and save it in THUMBNAIL_WIDTHS
+    widths as WebP and JPEG. The variants are stored on the movie, the largest JPEG becomes the thumbnail.
     This is a background task that can be queued for processing.
+    ffmpeg runs single-threaded on a lease from the host-wide thread budget.
 
     Args:
         movie_id (int): The ID of the movie for which to generate a thumbnail.
     """
     movie = Movie.objects.get(id=movie_id)
     if not movie.thumbnail and movie.video_file:
-        thumb_dir = os.path.join(settings.MEDIA_ROOT, "thumbnails")
-        os.makedirs(thumb_dir, exist_ok=True)
-        thumb_path = os.path.join(thumb_dir, f"{movie.id}_thumb.jpg")
-        subprocess.run([
-            "ffmpeg", "-i", movie.video_file.path,
-            "-ss", "00:00:01.000", "-vframes", "1",
-            "-q:v", "2", thumb_path
-        ], check=True)
-        with open(thumb_path, "rb") as f:
-            movie.thumbnail.save(f"{movie.id}_thumb.jpg", File(f), save=True)
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, "thumbnails"), exist_ok=True)
+        with ffmpeg_threads(1, preview=True) as threads:
+            subprocess.run(build_thumbnail_command(movie.video_file.path, movie.id, threads), check=True)
+        store_thumbnail_variants(movie.id)
 
 
-def has_audio_stream(input_file):
+def store_thumbnail_variants(movie_id):
     """
-    Check if input file has an audio stream using ffprobe.
+    Store the generated thumbnail variants on a movie; the largest JPEG becomes the thumbnail.
+
+    Args:
+        movie_id (int): The ID of the movie.
+    """
+    variants = get_thumbnail_variants(movie_id)
+    Movie.objects.filter(pk=movie_id).update(
+        thumbnail=variants["jpeg"][str(max(THUMBNAIL_WIDTHS))], thumbnail_variants=variants
+    )
+
+
+# Trickplay: one preview every TRICKPLAY_INTERVAL seconds, TRICKPLAY_WIDTH pixels wide,
+# tiled into sprite sheets of TRICKPLAY_COLUMNS x TRICKPLAY_ROWS previews.
+TRICKPLAY_DIR = "trickplay"
+TRICKPLAY_INTERVAL = 10
+TRICKPLAY_WIDTH = 160
+TRICKPLAY_COLUMNS = 10
+TRICKPLAY_ROWS = 10
+
+# Hover preview clip, only produced inside the transcode decode (HLS_INLINE_PREVIEWS).
+PREVIEW_SECONDS = 6
+PREVIEW_WIDTH = 480
+PREVIEW_BITRATE = 300000
+
+INLINE_PREVIEWS_CHECKPOINT = "previews"
+
+
+def trickplay_tile_height(width, height):
+    """
+    Get the even preview height keeping the aspect ratio of the source, 16:9 if it is unknown.
+    """
+    if not width or not height:
+        width, height = 16, 9
+    return max(2, round(TRICKPLAY_WIDTH * height / width / 2) * 2)
+
+
+def build_trickplay_command(input_file, output_dir, tile_height, threads=None):
+    """
+    Build the ffmpeg command that samples one frame every TRICKPLAY_INTERVAL seconds
+    and tiles the scaled frames into numbered JPEG sprite sheets.
 
     Args:
         input_file (str): The path to the input video file.
+        output_dir (str): The directory receiving sprite_001.jpg, sprite_002.jpg, ...
+        tile_height (int): The height of one preview.
+        threads (int): The threads granted to the process, or None to let ffmpeg decide.
 
     Returns:
-        bool: True if the input file has an audio stream, False otherwise.
+        list: The ffmpeg command.
+    """
+    return [
+        "ffmpeg", *thread_args(threads), "-skip_frame", "nokey", "-i", input_file,
+        "-map", "0:v:0", "-vf", trickplay_filter(tile_height), *trickplay_output_args(output_dir),
+    ]
+
+
+def trickplay_filter(tile_height):
+    """
+    Build the filter chain sampling one frame every TRICKPLAY_INTERVAL seconds into sprite sheets.
+    """
+    return (
+        f"fps=1/{TRICKPLAY_INTERVAL},scale={TRICKPLAY_WIDTH}:{tile_height},"
+        f"tile={TRICKPLAY_COLUMNS}x{TRICKPLAY_ROWS}"
+    )
+
+
+def trickplay_output_args(output_dir):
+    """
+    Build the output arguments writing one JPEG per sprite sheet into output_dir.
+    """
+    return ["-fps_mode", "passthrough", "-q:v", "5", os.path.join(output_dir, "sprite_%03d.jpg")]
+
+
+def format_vtt_timestamp(seconds):
+    """
+    Format seconds as a WebVTT timestamp, e.g. 00:01:05.000.
+    """
+    millis = round(seconds * 1000)
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    return f"{hours:02d}:{minutes:02d}:{millis // 1000:02d}.{millis % 1000:03d}"
+
+
+def write_trickplay_vtt(output_dir, duration, tile_height):
+    """
+    Write the WebVTT index mapping every TRICKPLAY_INTERVAL of the video to its preview
+    through a media fragment of the sprite sheet, e.g. "sprite_001.jpg#xywh=160,0,160,90".
+
+    Args:
+        output_dir (str): The directory holding the sprite sheets.
+        duration (float): The duration of the video in seconds.
+        tile_height (int): The height of one preview.
+
+    Returns:
+        str: The path of the written thumbnails.vtt.
+    """
+    per_sheet = TRICKPLAY_COLUMNS * TRICKPLAY_ROWS
+    lines = ["WEBVTT", ""]
+    count = max(1, math.ceil(duration / TRICKPLAY_INTERVAL))
+    for index in range(count):
+        start, end = index * TRICKPLAY_INTERVAL, min((index + 1) * TRICKPLAY_INTERVAL, duration)
+        sheet, position = divmod(index, per_sheet)
+        row, column = divmod(position, TRICKPLAY_COLUMNS)
+        lines.append(f"{format_vtt_timestamp(start)} --> {format_vtt_timestamp(end)}")
+        lines.append(
+            f"sprite_{sheet + 1:03d}.jpg#xywh={column * TRICKPLAY_WIDTH},{row * tile_height},"
+            f"{TRICKPLAY_WIDTH},{tile_height}"
+        )
+        lines.append("")
+    vtt_path = os.path.join(output_dir, "thumbnails.vtt")
+    with open(vtt_path, "w") as f:
+        f.write("\n".join(lines))
+    return vtt_path
+
+
+@job('thumbnails')
+def generate_trickplay(movie_id):
+    """
+    Generate the trickplay sprite sheets and their WebVTT index for the specified movie.
+    Only keyframes are decoded, so the previews land on the keyframe at or before every interval.
+    The files are written into a scratch directory and published as videos/hls/<id>/trickplay
+    in one rename, next to the renditions.
+    This is a background task that can be queued for processing.
+
+    Args:
+        movie_id (int): The ID of the movie.
+    """
+    movie = Movie.objects.get(id=movie_id)
+    metadata = get_source_metadata(movie, movie.video_file.path)
+    if not metadata["duration"]:
+        return
+    tile_height = trickplay_tile_height(metadata["width"], metadata["height"])
+    scratch_root = os.path.join(settings.MEDIA_ROOT, "videos/work")
+    os.makedirs(scratch_root, exist_ok=True)
+    scratch_dir = tempfile.mkdtemp(prefix=f"{movie.id}-trickplay-", dir=scratch_root)
+    try:
+        output_dir = os.path.join(scratch_dir, TRICKPLAY_DIR)
+        os.makedirs(output_dir)
+        with ffmpeg_threads(1, preview=True) as threads:
+            run_ffmpeg(build_trickplay_command(movie.video_file.path, output_dir, tile_height, threads))
+        write_trickplay_vtt(output_dir, metadata["duration"], tile_height)
+        publish_rendition(output_dir, get_hls_base_dir(movie.id), TRICKPLAY_DIR)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def parse_frame_rate(value):
+    """
+    Parse an ffprobe frame rate such as "30000/1001".
+
+    Args:
+        value (str): The frame rate as reported by ffprobe.
+
+    Returns:
+        float: The frame rate, or None if it is missing or invalid.
+    """
+    try:
+        num, _, den = value.partition("/")
+        rate = float(num) / float(den or 1)
+    except (AttributeError, ValueError, ZeroDivisionError):
+        return None
+    return rate or None
+
+
+def probe_video(input_file):
+    """
+    Probe the input file with a single ffprobe call.
+
+    Args:
+        input_file (str): The path to the input video file.
+
+    Returns:
+        dict: has_audio, width, height, frame_rate, bitrate, duration, video_codec, video_profile,
+            video_level and pix_fmt of the source. Values ffprobe does not report are None.
     """
+    stream_entries = "codec_type,codec_name,profile,level,pix_fmt,width,height,avg_frame_rate,r_frame_rate,bit_rate"
     cmd = [
         "ffprobe",
         "-v", "error",
-        "-select_streams", "a",
-        "-show_entries", "stream=codec_type",
+        "-show_entries", f"stream={stream_entries}:format=bit_rate,duration",
         "-of", "json",
         input_file
     ]
     result = subprocess.run(cmd, capture_output=True, text=True)
     info = json.loads(result.stdout)
-    return "streams" in info and len(info["streams"]) > 0
+    streams = info.get("streams", [])
+    video = next((stream for stream in streams if stream.get("codec_type") == "video"), {})
+    bitrate = video.get("bit_rate") or info.get("format", {}).get("bit_rate")
+    duration = info.get("format", {}).get("duration")
+    return {
+        "has_audio": any(stream.get("codec_type") == "audio" for stream in streams),
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "frame_rate": parse_frame_rate(video.get("avg_frame_rate")) or parse_frame_rate(video.get("r_frame_rate")),
+        "bitrate": int(bitrate) if bitrate else None,
+        "duration": float(duration) if duration else None,
+        "video_codec": video.get("codec_name"),
+        "video_profile": video.get("profile"),
+        "video_level": video.get("level") if (video.get("level") or 0) > 0 else None,
+        "pix_fmt": video.get("pix_fmt"),
+    }
 
 
-def convert_to_hls(movie, input_file):
+def probe_keyframe_interval(input_file):
     """
-    Convert the specified movie to HLS format.
-    This function generates HLS segments and playlists for multiple resolutions.
-    The generated files are stored in the media directory.
+    Measure the longest distance between two video keyframes, including the tail after the last one.
+    Only packet headers are read, so this is a demux pass without decoding.
 
     Args:
-        movie (Movie): The movie instance to convert.
         input_file (str): The path to the input video file.
+
+    Returns:
+        float: The longest keyframe distance in seconds, or None if ffprobe reports no keyframes.
     """
-    hls_resolutions = {
-        "480p": "854:480",
-        "720p": "1280:720",
-        "1080p": "1920:1080",
-    }
+    cmd = [
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        input_file
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    keyframes, last = [], None
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(",")
+        try:
+            last = float(pts_time)
+        except ValueError:
+            continue
+        if "K" in flags:
+            keyframes.append(last)
+    if not keyframes:
+        return None
+    keyframes.sort()
+    return max(b - a for a, b in zip(keyframes, keyframes[1:] + [max(last, keyframes[-1])]))
+
+
+def has_audio_stream(input_file):
+    """
+    Check if input file has an audio stream using ffprobe.
+
+    Args:
+        input_file (str): The path to the input video file.
+
+    Returns:
+        bool: True if the input file has an audio stream, False otherwise.
+    """
+    return probe_video(input_file)["has_audio"]
 
-    audio_exists = has_audio_stream(input_file)
-
-    for res, size in hls_resolutions.items():
-        hls_dir = os.path.join(settings.MEDIA_ROOT, f"videos/hls/{movie.id}/{res}")
-        os.makedirs(hls_dir, exist_ok=True)
-        hls_index = os.path.join(hls_dir, "index.m3u8")
-
-        cmd = [
-            "ffmpeg",
-            "-i", input_file,
-            "-vf", f"scale={size}",
-            "-c:v", "h264",
-            "-f", "hls",
-            "-hls_time", "10",
-            "-hls_list_size", "0",
-            "-hls_segment_filename", os.path.join(hls_dir, "segment_%03d.ts"),
-            hls_index,
-        ]
-
-        if audio_exists:
-            cmd.insert(cmd.index("-c:v", ) + 2, "-c:a")
-            cmd.insert(cmd.index("-c:v", ) + 3, "aac")
 
+SOURCE_METADATA_KEYS = (
+    "has_audio", "width", "height", "frame_rate", "bitrate", "duration",
+    "video_codec", "video_profile", "video_level", "pix_fmt", "keyframe_interval",
+)
+
+
+def get_source_metadata(movie, input_file):
+    """
+    Get the probed source metadata of a movie.
+    The source is probed only once; the result is stored on the movie and reused afterwards.
+    The keyframe interval is only measured for H.264 sources, which are candidates for stream copy.
+
+    Args:
+        movie (Movie): The movie instance.
+        input_file (str): The path to the input video file.
+
+    Returns:
+        dict: The source metadata as returned by probe_video, plus keyframe_interval and the
+            per-title bitrate_ladder, which is empty until analyze_complexity ran.
+    """
+    fields = {}
+    if movie.source_has_audio is None:
+        fields.update({f"source_{key}": value for key, value in probe_video(input_file).items()})
+    codec = fields.get("source_video_codec", movie.source_video_codec)
+    if settings.HLS_PASSTHROUGH and codec == "h264" and movie.source_keyframe_interval is None:
+        fields["source_keyframe_interval"] = probe_keyframe_interval(input_file)
+    if fields:
+        Movie.objects.filter(pk=movie.pk).update(**fields)
+        for name, value in fields.items():
+            setattr(movie, name, value)
+    metadata = {key: getattr(movie, f"source_{key}") for key in SOURCE_METADATA_KEYS}
+    metadata["bitrate_ladder"] = movie.bitrate_ladder
+    return metadata
+
+
+def run_ffmpeg(cmd, on_progress=None):
+    """
+    Run an ffmpeg command and fail if it fails.
+    With on_progress, ffmpeg reports its position through -progress and the callback receives
+    the encoded position in seconds on every report.
+
+    Args:
+        cmd (list): The ffmpeg command.
+        on_progress (callable): Optional callback receiving the encoded position in seconds.
+    """
+    if on_progress is None:
         subprocess.run(cmd, check=True)
+        return
 
+    cmd = [cmd[0], "-progress", "pipe:1", "-nostats"] + cmd[1:]
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True) as process:
+        for line in process.stdout:
+            key, _, value = line.strip().partition("=")
+            # ffmpeg reports out_time_ms in microseconds.
+            if key == "out_time_ms" and value.isdigit():
+                on_progress(int(value) / 1000000)
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, cmd)
 
-@job
-def convert_movie_task(movie_id):
+
+HLS_SEGMENT_SECONDS = 10
+
+HLS_RESOLUTIONS = {
+    "480p": {"width": 854, "height": 480, "video_bitrate": 1400000, "profile": "main", "level": "3.1"},
+    "720p": {"width": 1280, "height": 720, "video_bitrate": 2800000, "profile": "high", "level": "3.1"},
+    "1080p": {"width": 1920, "height": 1080, "video_bitrate": 5000000, "profile": "high", "level": "4.0"},
+}
+
+HLS_AUDIO_BITRATE = 128000
+
+# Segment file extension per HLS_SEGMENT_TYPE; fMP4 renditions start with a shared init segment.
+HLS_SEGMENT_EXTENSIONS = {"mpegts": "ts", "fmp4": "m4s"}
+HLS_INIT_SEGMENT = "init.mp4"
+
+# Audio is encoded once into its own rendition directory and shared by every video variant.
+HLS_AUDIO_RENDITION = "audio"
+HLS_AUDIO_GROUP = "aac"
+
+H264_PROFILE_IDC = {"baseline": "42e0", "main": "4d40", "high": "6400"}
+
+# H.264 levels with their maximum macroblocks per second and per frame (ITU-T H.264 Table A-1), ascending.
+H264_LEVELS = [
+    ("3.0", 40500, 1620), ("3.1", 108000, 3600), ("3.2", 216000, 5120), ("4.0", 245760, 8192),
+    ("4.2", 522240, 8704), ("5.0", 589824, 22080), ("5.1", 983040, 36864), ("5.2", 2073600, 36864),
+]
+
+# ffprobe profile names of H.264 sources that players accept as-is, mapped to HLS_RESOLUTIONS profiles.
+PASSTHROUGH_PROFILES = {"Constrained Baseline": "baseline", "Main": "main", "High": "high"}
+
+
+def scaled_width(width, height, target_height):
     """
-    Convert the specified movie to HLS format.
-    This is a background task that retrieves the movie instance and calls the conversion function.
+    Get the even width ffmpeg's "scale=-2:<target_height>" produces for a source size.
+
+    Returns:
+        int: The width, or None if the source size is unknown.
+    """
+    if not width or not height:
+        return None
+    return round(width * target_height / (height * 2)) * 2
+
+
+def h264_level(rendition, frame_rate):
+    """
+    Get the lowest H.264 level that fits a rendition at a frame rate, at least the rendition's default level.
+    The defaults of HLS_RESOLUTIONS hold up to 30 fps; e.g. 720p60 needs 3.2 and 1080p60 needs 4.2.
 
     Args:
-        movie_id (int): The ID of the movie to convert.
+        rendition (dict): The rendition entry with its encoded width and height.
+        frame_rate (float): The frame rate of the source, which the encode keeps.
+
+    Returns:
+        str: The level, e.g. "4.2".
     """
-    movie = Movie.objects.get(id=movie_id)
+    frame_size = math.ceil(rendition["width"] / 16) * math.ceil(rendition["height"] / 16)
+    rate = frame_size * (frame_rate or 30)
+    for level, max_rate, max_frame_size in H264_LEVELS:
+        if float(level) >= float(rendition["level"]) and rate <= max_rate and frame_size <= max_frame_size:
+            return level
+    return H264_LEVELS[-1][0]
+
+
+def select_renditions(metadata):
+    """
+    Select the renditions of HLS_RESOLUTIONS that fit the source.
+    Renditions taller than the source are skipped and every bitrate is capped at the source bitrate,
+    so nothing is upscaled or padded with bits the source never had. Renditions are scaled to the rung
+    height and keep the source aspect ratio, so their width follows the source like "scale=-2:<h>" does.
+    A source smaller than the lowest rung still gets that rung at the source size.
+    A rendition the source can be stream-copied into is marked with "passthrough" and takes over
+    the profile, level and bitrate of the source; every other rendition gets the level its size
+    and the source frame rate need, so high frame rate sources are not encoded above the advertised level.
+    A per-title bitrate_ladder in the metadata replaces the default bitrates before they are capped.
+
+    Args:
+        metadata (dict): The source metadata as returned by probe_video.
+
+    Returns:
+        dict: The selected renditions keyed by name, in ladder order.
+    """
+    width, height, bitrate = metadata.get("width"), metadata.get("height"), metadata.get("bitrate")
+    ladder = metadata.get("bitrate_ladder") or {}
+    renditions = {
+        res: dict(
+            rendition, width=scaled_width(width, height, rendition["height"]) or rendition["width"],
+            video_bitrate=ladder.get(res, rendition["video_bitrate"])
+        )
+        for res, rendition in HLS_RESOLUTIONS.items()
+        if not width or not height or rendition["height"] <= height
+    }
+    if not renditions:
+        res, rendition = next(iter(HLS_RESOLUTIONS.items()))
+        even_height = height - height % 2
+        renditions = {
+            res: dict(
+                rendition, width=scaled_width(width, height, even_height), height=even_height,
+                video_bitrate=ladder.get(res, rendition["video_bitrate"])
+            )
+        }
+
+    for rendition in renditions.values():
+        if can_passthrough(metadata, rendition):
+            rendition.update(
+                passthrough=True,
+                profile=PASSTHROUGH_PROFILES[metadata["video_profile"]],
+                level=f"{metadata['video_level'] / 10:.1f}",
+                video_bitrate=bitrate,
+            )
+        else:
+            rendition["level"] = h264_level(rendition, metadata.get("frame_rate"))
+            if bitrate:
+                rendition["video_bitrate"] = min(rendition["video_bitrate"], bitrate)
+    return renditions
+
+
+def can_passthrough(metadata, rendition):
+    """
+    Check whether the source video can be segmented into a rendition by stream copy.
+    It has to be H.264 in 4:2:0 with a standard profile, exactly the size of the rendition,
+    no more than HLS_PASSTHROUGH_BITRATE_TOLERANCE times its bitrate and keyframes at least
+    every HLS_SEGMENT_SECONDS, so segments still start on keyframes and stay about segment length.
+
+    Args:
+        metadata (dict): The source metadata as returned by get_source_metadata.
+        rendition (dict): The rendition entry from HLS_RESOLUTIONS.
+
+    Returns:
+        bool: True if the rendition can be produced without re-encoding.
+    """
+    keyframe_interval, bitrate = metadata.get("keyframe_interval"), metadata.get("bitrate")
+    return bool(
+        settings.HLS_PASSTHROUGH
+        and metadata.get("video_codec") == "h264"
+        and metadata.get("pix_fmt") == "yuv420p"
+        and metadata.get("video_profile") in PASSTHROUGH_PROFILES
+        and metadata.get("video_level")
+        and (metadata.get("width"), metadata.get("height")) == (rendition["width"], rendition["height"])
+        and keyframe_interval and keyframe_interval <= HLS_SEGMENT_SECONDS
+        and bitrate and bitrate <= rendition["video_bitrate"] * settings.HLS_PASSTHROUGH_BITRATE_TOLERANCE
+    )
+
+
+def encoded_renditions(renditions):
+    """
+    Get the renditions that have to be encoded, leaving out the stream-copied ones.
+
+    Args:
+        renditions (dict): The selected renditions keyed by name.
+
+    Returns:
+        dict: The renditions without "passthrough", in ladder order.
+    """
+    return {res: rendition for res, rendition in renditions.items() if not rendition.get("passthrough")}
+
+
+def report_passthrough(renditions):
+    """
+    Record in the metadata of the running RQ job which renditions are stream-copied and which are encoded.
+
+    Args:
+        renditions (dict): The selected renditions keyed by name.
+    """
+    current_job = get_current_job()
+    if current_job is None:
+        return
+    current_job.meta["passthrough"] = [res for res, r in renditions.items() if r.get("passthrough")]
+    current_job.meta["encoded"] = [res for res, r in renditions.items() if not r.get("passthrough")]
+    current_job.save_meta()
+
+
+# Per-title analysis: short CRF trial encodes spread over the source at a low resolution.
+# A typical title yields COMPLEXITY_REFERENCE_BITRATE, for which the default ladder is right;
+# the measured bitrate relative to it scales every rung within COMPLEXITY_FACTOR_RANGE.
+COMPLEXITY_SAMPLES = 5
+COMPLEXITY_SAMPLE_SECONDS = 4
+COMPLEXITY_HEIGHT = 360
+COMPLEXITY_CRF = 23
+COMPLEXITY_REFERENCE_BITRATE = 800000
+COMPLEXITY_FACTOR_RANGE = (0.4, 1.5)
+
+
+def complexity_samples(duration):
+    """
+    Get the evenly spread (start, length) windows of the trial encode.
+
+    Args:
+        duration (float): The source duration in seconds.
+
+    Returns:
+        list: The windows as (start, length) in seconds.
+    """
+    if duration <= COMPLEXITY_SAMPLES * COMPLEXITY_SAMPLE_SECONDS:
+        return [(0, duration)]
+    step = duration / COMPLEXITY_SAMPLES
+    return [
+        (round(step * (i + 0.5) - COMPLEXITY_SAMPLE_SECONDS / 2, 3), COMPLEXITY_SAMPLE_SECONDS)
+        for i in range(COMPLEXITY_SAMPLES)
+    ]
+
+
+def build_complexity_command(input_file, start, length, output_file, threads=None):
+    """
+    Build the ffmpeg command of one constant-quality trial encode window.
+
+    Args:
+        input_file (str): The path to the input video file.
+        start (float): The window start in seconds.
+        length (float): The window length in seconds.
+        output_file (str): The path of the trial encode.
+        threads (int): The encoder threads, or None to let ffmpeg decide.
+
+    Returns:
+        list: The ffmpeg command.
+    """
+    return ["ffmpeg", "-y", "-ss", str(start), "-t", str(length), "-i", input_file] + thread_args(threads) + [
+        "-map", "0:v:0", "-an",
+        "-vf", f"scale=-2:{COMPLEXITY_HEIGHT}",
+        "-c:v", "h264", "-preset", "veryfast", "-crf", str(COMPLEXITY_CRF),
+        output_file,
+    ]
+
+
+def ladder_for_bitrate(trial_bitrate):
+    """
+    Derive the per-title bitrate caps of every rendition from the trial encode bitrate.
+
+    Args:
+        trial_bitrate (float): The bitrate of the trial encode in bits per second.
+
+    Returns:
+        dict: The bitrate cap per rendition name.
+    """
+    low, high = COMPLEXITY_FACTOR_RANGE
+    factor = min(max(trial_bitrate / COMPLEXITY_REFERENCE_BITRATE, low), high)
+    return {res: int(rendition["video_bitrate"] * factor) for res, rendition in HLS_RESOLUTIONS.items()}
+
+
+def analyze_complexity(movie, input_file):
+    """
+    Derive and store the per-title bitrate ladder of a movie.
+    Static content encodes to few bits at constant quality and gets lower caps,
+    complex content gets higher ones. The ladder is analysed once and stored on the movie.
+
+    Args:
+        movie (Movie): The movie instance.
+        input_file (str): The path to the input video file.
+
+    Returns:
+        dict: The bitrate cap per rendition name, empty if the source duration is unknown.
+    """
+    if movie.bitrate_ladder:
+        return movie.bitrate_ladder
+    duration = get_source_metadata(movie, input_file)["duration"]
+    if not duration:
+        return {}
+
+    work_dir = get_work_dir(movie.id)
+    os.makedirs(work_dir, exist_ok=True)
+    trial_file = os.path.join(work_dir, "complexity.mp4")
+    encoded_bytes = encoded_seconds = 0
+    with ffmpeg_threads(settings.FFMPEG_JOB_THREADS) as threads:
+        for start, length in complexity_samples(duration):
+            run_ffmpeg(build_complexity_command(input_file, start, length, trial_file, threads))
+            encoded_bytes += os.path.getsize(trial_file)
+            encoded_seconds += length
+    os.remove(trial_file)
+
+    trial_bitrate = encoded_bytes * 8 / encoded_seconds
+    ladder = ladder_for_bitrate(trial_bitrate)
+    logger.info("Movie %s trial encode at %d bit/s, bitrate ladder %s", movie.id, trial_bitrate, ladder)
+    Movie.objects.filter(pk=movie.pk).update(bitrate_ladder=ladder)
+    movie.bitrate_ladder = ladder
+    return ladder
+
+
+def get_hls_base_dir(movie_id):
+    """
+    Get the directory holding all HLS renditions of a movie.
+
+    Args:
+        movie_id (int): The ID of the movie.
+
+    Returns:
+        str: The absolute path of the movie's HLS directory.
+    """
+    return os.path.join(settings.MEDIA_ROOT, f"videos/hls/{movie_id}")
+
+
+def thread_args(threads):
+    """
+    Build the -threads option for a granted number of threads.
+
+    Args:
+        threads (int): The number of threads, or None to let ffmpeg decide.
+
+    Returns:
+        list: The ffmpeg arguments.
+    """
+    return ["-threads", str(threads)] if threads else []
+
+
+def split_threads(threads, parts):
+    """
+    Split granted threads evenly over parts running at once, at least one each.
+
+    Args:
+        threads (int): The number of threads, or None to let ffmpeg decide.
+        parts (int): The number of encoders or processes sharing them.
+
+    Returns:
+        int: The threads per part, or None.
+    """
+    return max(1, threads // parts) if threads else None
+
+
+def video_encoder_args(rendition, threads=None):
+    """
+    Build the H.264 encoder arguments for a rendition.
+    Keyframes are forced on every segment boundary and scene-cut keyframes are disabled,
+    so all renditions share the same GOP boundaries and players can switch between them cleanly.
+
+    Args:
+        rendition (dict): The rendition entry from HLS_RESOLUTIONS.
+        threads (int): The encoder threads, or None to let ffmpeg decide.
+
+    Returns:
+        list: The ffmpeg arguments.
+    """
+    bitrate = rendition["video_bitrate"]
+    return thread_args(threads) + [
+        "-c:v", "h264",
+        "-profile:v", rendition["profile"],
+        "-level:v", rendition["level"],
+        "-b:v", str(bitrate),
+        "-maxrate", str(int(bitrate * 1.07)),
+        "-bufsize", str(bitrate * 2),
+        "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+        "-sc_threshold", "0",
+    ]
+
+
+def audio_encoder_args():
+    """
+    Build the AAC encoder arguments shared by all renditions.
+
+    Returns:
+        list: The ffmpeg arguments.
+    """
+    return ["-c:a", "aac", "-b:a", str(HLS_AUDIO_BITRATE)]
+
+
+def hls_playlist_version():
+    """
+    Get the EXT-X-VERSION the playlists need for the configured segment output.
+    fMP4 segments with EXT-X-MAP need version 7, byte-range segments in a single file version 4.
+    """
+    if settings.HLS_SEGMENT_TYPE == "fmp4":
+        return 7
+    return 4 if settings.HLS_SINGLE_FILE else 3
+
+
+def hls_output_args(hls_dir):
+    """
+    Build the ffmpeg output arguments for a single HLS rendition.
+    HLS_SEGMENT_TYPE selects MPEG-TS or fMP4 (CMAF) segments; with HLS_SINGLE_FILE all segments
+    of the rendition go into one file, addressed with EXT-X-BYTERANGE.
+
+    Args:
+        hls_dir (str): The directory the rendition is written to.
+
+    Returns:
+        list: The ffmpeg arguments, ending with the playlist path.
+    """
+    extension = HLS_SEGMENT_EXTENSIONS[settings.HLS_SEGMENT_TYPE]
+    args = [
+        "-f", "hls",
+        "-hls_time", str(HLS_SEGMENT_SECONDS),
+        "-hls_list_size", "0",
+        "-hls_playlist_type", "vod",
+    ]
+    if settings.HLS_SEGMENT_TYPE == "fmp4":
+        args += ["-hls_segment_type", "fmp4", "-hls_fmp4_init_filename", HLS_INIT_SEGMENT]
+    if settings.HLS_SINGLE_FILE:
+        args += ["-hls_flags", "single_file", "-hls_segment_filename", os.path.join(hls_dir, f"segments.{extension}")]
+    else:
+        args += ["-hls_segment_filename", os.path.join(hls_dir, f"segment_%03d.{extension}")]
+    return args + [os.path.join(hls_dir, "index.m3u8")]
+
+
+def audio_output_args(audio_dir):
+    """
+    Build the output arguments encoding the first audio stream of input 0 into the shared audio rendition.
+
+    Args:
+        audio_dir (str): The directory the audio rendition is written to.
+
+    Returns:
+        list: The ffmpeg arguments.
+    """
+    return ["-map", "0:a:0", "-vn"] + audio_encoder_args() + hls_output_args(audio_dir)
+
+
+def build_audio_command(input_file, audio_dir, threads=None):
+    """
+    Build the ffmpeg command that encodes only the shared audio rendition.
+
+    Args:
+        input_file (str): The path to the input video file.
+        audio_dir (str): The directory the audio rendition is written to.
+        threads (int): The threads granted to the process, or None to let ffmpeg decide.
+
+    Returns:
+        list: The ffmpeg command.
+    """
+    return ["ffmpeg", *thread_args(threads), "-i", input_file] + audio_output_args(audio_dir)
+
+
+def build_rendition_command(input_file, hls_dir, rendition, audio_dir=None, threads=None):
+    """
+    Build the ffmpeg command that encodes one video-only rendition from its own decode of the source.
+
+    Args:
+        input_file (str): The path to the input video file.
+        hls_dir (str): The directory the rendition is written to.
+        rendition (dict): The rendition entry from HLS_RESOLUTIONS.
+        audio_dir (str): If given, the shared audio rendition is encoded into it by the same process.
+        threads (int): The threads granted to the process, or None to let ffmpeg decide.
+
+    Returns:
+        list: The ffmpeg command.
+    """
+    cmd = ["ffmpeg", *thread_args(threads), "-i", input_file]
+    cmd += ["-map", "0:v:0", "-vf", f"scale=-2:{rendition['height']}", "-an"]
+    cmd += video_encoder_args(rendition, threads) + hls_output_args(hls_dir)
+    if audio_dir:
+        cmd += audio_output_args(audio_dir)
+    return cmd
+
+
+def build_passthrough_command(input_file, hls_dir, audio_dir=None):
+    """
+    Build the ffmpeg command that segments the source video into a rendition by stream copy.
+
+    Args:
+        input_file (str): The path to the input video file.
+        hls_dir (str): The directory the rendition is written to.
+        audio_dir (str): If given, the shared audio rendition is encoded into it by the same process.
+
+    Returns:
+        list: The ffmpeg command.
+    """
+    cmd = ["ffmpeg", "-i", input_file, "-map", "0:v:0", "-c:v", "copy", "-an"] + hls_output_args(hls_dir)
+    if audio_dir:
+        cmd += audio_output_args(audio_dir)
+    return cmd
+
+
+def split_filter_graph(renditions, extra_branches=0):
+    """
+    Build the filter graph that splits the decoded video once per rendition and scales each branch.
+    Branch i is available as the output label "[v{i}out]"; extra branches follow unscaled as "[v{n}]".
+
+    Args:
+        renditions (list): The rendition entries, in output order.
+        extra_branches (int): The number of additional unscaled branches.
+
+    Returns:
+        str: The -filter_complex graph.
+    """
+    branches = len(renditions) + extra_branches
+    splits = "".join(f"[v{i}]" for i in range(branches))
+    graph = [f"[0:v]split={branches}{splits}"]
+    graph += [
+        f"[v{i}]scale=-2:{rendition['height']}[v{i}out]"
+        for i, rendition in enumerate(renditions)
+    ]
+    return ";".join(graph)
+
+
+def build_single_decode_command(input_file, outputs, audio_dir=None, threads=None, extras=()):
+    """
+    Build one ffmpeg command that decodes the source once and fans it out to all renditions.
+    The decoded video is split in a filter graph and scaled once per rendition,
+    each scaled stream is encoded into its own video-only HLS output.
+    Granted threads are split evenly over the encoders.
+
+    Args:
+        input_file (str): The path to the input video file.
+        outputs (list): (hls_dir, rendition) tuples, one per rendition.
+        audio_dir (str): If given, the shared audio rendition is encoded into it by the same process.
+        threads (int): The threads granted to the process, or None to let ffmpeg decide.
+        extras (list): Further outputs fed from the same decode, each a callable turning the label
+            of its branch into a filter graph and output arguments.
+
+    Returns:
+        list: The ffmpeg command.
+    """
+    encoder_threads = split_threads(threads, max(len(outputs), 1))
+    graph = [split_filter_graph([r for _, r in outputs], extra_branches=len(extras))]
+    extra_args = []
+    for i, extra in enumerate(extras, start=len(outputs)):
+        extra_graph, args = extra(f"v{i}")
+        graph.append(extra_graph)
+        extra_args += args
+
+    cmd = ["ffmpeg", *thread_args(threads), "-i", input_file, "-filter_complex", ";".join(graph)]
+    for i, (hls_dir, rendition) in enumerate(outputs):
+        cmd += ["-map", f"[v{i}out]"] + video_encoder_args(rendition, encoder_threads) + hls_output_args(hls_dir)
+    if audio_dir:
+        cmd += audio_output_args(audio_dir)
+    return cmd + extra_args
+
+
+def rendition_codecs(rendition, audio_exists):
+    """
+    Build the RFC 6381 CODECS attribute of a rendition.
+
+    Args:
+        rendition (dict): The rendition entry from HLS_RESOLUTIONS.
+        audio_exists (bool): Whether the variant plays AAC audio alongside the video.
+
+    Returns:
+        str: The codecs string, e.g. "avc1.64001f,mp4a.40.2".
+    """
+    level = round(float(rendition["level"]) * 10)
+    codecs = f"avc1.{H264_PROFILE_IDC[rendition['profile']]}{level:02x}"
+    if audio_exists:
+        codecs += ",mp4a.40.2"
+    return codecs
+
+
+def write_atomically(path, data):
+    """
+    Write a file through a unique temporary file in its directory and rename it into place.
+    Readers never see a partial file, and concurrent writers, e.g. fanout jobs publishing at the same time,
+    never write into each other's temporary file.
+
+    Args:
+        path (str): The path of the file to write.
+        data (bytes): The content of the file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_master_playlist(hls_base_dir, renditions, audio_exists):
+    """
+    Write the HLS master playlist listing every rendition with its bandwidth, resolution and codecs.
+    With audio, every video variant references the shared audio rendition through an EXT-X-MEDIA group
+    and an audio-only variant is listed last for very low bandwidth.
+    Variant URIs are relative, so the master resolves against the URL it is served from.
+    The playlist is written to a unique temporary file and renamed into place, so readers never see a partial file.
+
+    Args:
+        hls_base_dir (str): The directory holding one subdirectory per rendition.
+        renditions (dict): The encoded renditions keyed by name.
+        audio_exists (bool): Whether the shared audio rendition exists.
+
+    Returns:
+        str: The path of the written master playlist.
+    """
+    audio_bitrate = HLS_AUDIO_BITRATE if audio_exists else 0
+    audio_uri = f"{HLS_AUDIO_RENDITION}/index.m3u8"
+    group = f",AUDIO=\"{HLS_AUDIO_GROUP}\"" if audio_exists else ""
+    lines = ["#EXTM3U", f"#EXT-X-VERSION:{hls_playlist_version()}", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    if audio_exists:
+        lines.append(
+            f"#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID=\"{HLS_AUDIO_GROUP}\",NAME=\"Default\","
+            f"DEFAULT=YES,AUTOSELECT=YES,URI=\"{audio_uri}\""
+        )
+    for res, rendition in renditions.items():
+        lines.append(
+            f"#EXT-X-STREAM-INF:BANDWIDTH={int(rendition['video_bitrate'] * 1.07) + audio_bitrate},"
+            f"AVERAGE-BANDWIDTH={rendition['video_bitrate'] + audio_bitrate},"
+            f"RESOLUTION={rendition['width']}x{rendition['height']},"
+            f"CODECS=\"{rendition_codecs(rendition, audio_exists)}\"{group}"
+        )
+        lines.append(f"{res}/index.m3u8")
+    if audio_exists:
+        lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={audio_bitrate},CODECS=\"mp4a.40.2\"{group}")
+        lines.append(audio_uri)
+
+    os.makedirs(hls_base_dir, exist_ok=True)
+    master_path = os.path.join(hls_base_dir, "master.m3u8")
+    write_atomically(master_path, ("\n".join(lines) + "\n").encode())
+    if settings.DASH_MANIFEST and settings.HLS_SEGMENT_TYPE == "fmp4":
+        write_dash_manifest(hls_base_dir, renditions, audio_exists)
+    return master_path
+
+
+def parse_byterange(value, offset):
+    """
+    Convert an HLS BYTERANGE "length[@offset]" into a DASH byte range "first-last".
+
+    Args:
+        value (str): The BYTERANGE value.
+        offset (int): The offset to use if the value has none, i.e. the end of the previous range.
+
+    Returns:
+        tuple: The DASH range and the offset following it.
+    """
+    length, _, start = value.partition("@")
+    start = int(start) if start else offset
+    end = start + int(length)
+    return f"{start}-{end - 1}", end
+
+
+def parse_media_playlist(playlist_path):
+    """
+    Read the init segment and the media segments of a fMP4 HLS media playlist.
+
+    Args:
+        playlist_path (str): The path of the rendition's index.m3u8.
+
+    Returns:
+        dict: "init" as (uri, range) and "segments" as a list of (duration, uri, range);
+            ranges are DASH byte ranges or None for whole files.
+    """
+    init, segments = None, []
+    duration, byterange, offset = None, None, 0
+    with open(playlist_path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#EXT-X-MAP:"):
+                attributes = dict(
+                    part.split("=", 1) for part in line[len("#EXT-X-MAP:"):].split(",") if "=" in part
+                )
+                init_range = attributes.get("BYTERANGE")
+                if init_range:
+                    init_range, _ = parse_byterange(init_range.strip('"'), 0)
+                init = (attributes["URI"].strip('"'), init_range)
+            elif line.startswith("#EXTINF:"):
+                duration = float(line[len("#EXTINF:"):].split(",")[0])
+            elif line.startswith("#EXT-X-BYTERANGE:"):
+                byterange, offset = parse_byterange(line[len("#EXT-X-BYTERANGE:"):], offset)
+            elif line and not line.startswith("#"):
+                segments.append((duration, line, byterange))
+                duration, byterange = None, None
+    return {"init": init, "segments": segments}
+
+
+def dash_segment_list(parent, playlist, prefix):
+    """
+    Add a SegmentList addressing the segments of an HLS media playlist to a DASH element.
+    Segments are referenced in place, so HLS and DASH share the same files.
+
+    Args:
+        parent (Element): The Representation receiving the SegmentList.
+        playlist (dict): The parsed media playlist as returned by parse_media_playlist.
+        prefix (str): The rendition directory the playlist URIs are relative to.
+    """
+    segment_list = ET.SubElement(parent, "SegmentList", timescale="1000")
+    init_uri, init_range = playlist["init"]
+    initialization = ET.SubElement(segment_list, "Initialization", sourceURL=f"{prefix}/{init_uri}")
+    if init_range:
+        initialization.set("range", init_range)
+    timeline = ET.SubElement(segment_list, "SegmentTimeline")
+    start = 0
+    for duration, uri, byterange in playlist["segments"]:
+        ET.SubElement(timeline, "S", t=str(start), d=str(round(duration * 1000)))
+        start += round(duration * 1000)
+        segment_url = ET.SubElement(segment_list, "SegmentURL", media=f"{prefix}/{uri}")
+        if byterange:
+            segment_url.set("mediaRange", byterange)
+
+
+def write_dash_manifest(hls_base_dir, renditions, audio_exists):
+    """
+    Write a static DASH manifest next to the HLS master playlist, referencing the same fMP4 segments.
+    The segment timeline is taken from the published media playlists, so no second encode is needed.
+    The manifest is written to a temporary file and renamed into place, like the master playlist.
+
+    Args:
+        hls_base_dir (str): The directory holding one subdirectory per rendition.
+        renditions (dict): The encoded renditions keyed by name.
+        audio_exists (bool): Whether the shared audio rendition exists.
+
+    Returns:
+        str: The path of the written manifest.
+    """
+    mpd = ET.Element(
+        "MPD", xmlns="urn:mpeg:dash:schema:mpd:2011", type="static", minBufferTime="PT2S",
+        profiles="urn:mpeg:dash:profile:isoff-main:2011"
+    )
+    period = ET.SubElement(mpd, "Period", id="0", start="PT0S")
+    duration = 0.0
+
+    video_set = ET.SubElement(period, "AdaptationSet", contentType="video", mimeType="video/mp4", segmentAlignment="true")
+    for res, rendition in renditions.items():
+        playlist = parse_media_playlist(os.path.join(hls_base_dir, res, "index.m3u8"))
+        representation = ET.SubElement(
+            video_set, "Representation", id=res, bandwidth=str(rendition["video_bitrate"]),
+            width=str(rendition["width"]), height=str(rendition["height"]), codecs=rendition_codecs(rendition, False)
+        )
+        dash_segment_list(representation, playlist, res)
+        duration = max(duration, sum(segment[0] for segment in playlist["segments"]))
+
+    if audio_exists:
+        playlist = parse_media_playlist(os.path.join(hls_base_dir, HLS_AUDIO_RENDITION, "index.m3u8"))
+        audio_set = ET.SubElement(period, "AdaptationSet", contentType="audio", mimeType="audio/mp4", lang="und")
+        representation = ET.SubElement(
+            audio_set, "Representation", id=HLS_AUDIO_RENDITION, bandwidth=str(HLS_AUDIO_BITRATE), codecs="mp4a.40.2"
+        )
+        dash_segment_list(representation, playlist, HLS_AUDIO_RENDITION)
+
+    mpd.set("mediaPresentationDuration", f"PT{duration:.3f}S")
+    manifest_path = os.path.join(hls_base_dir, "manifest.mpd")
+    write_atomically(manifest_path, ET.tostring(mpd, encoding="utf-8", xml_declaration=True))
+    return manifest_path
+
+
+def get_work_dir(movie_id):
+    """
+    Get the scratch directory for intermediate files of a movie's conversion.
+    It lives outside videos/hls, so intermediate files are never served.
+
+    Args:
+        movie_id (int): The ID of the movie.
+
+    Returns:
+        str: The absolute path of the movie's work directory.
+    """
+    return os.path.join(settings.MEDIA_ROOT, f"videos/work/{movie_id}")
+
+
+def is_checkpointed(work_dir, name):
+    """
+    Check whether a step of a conversion (a rendition, a chunk) already completed.
+
+    Args:
+        work_dir (str): The work directory of the conversion.
+        name (str): The name of the step.
+
+    Returns:
+        bool: True if the step completed in an earlier attempt.
+    """
+    return os.path.exists(os.path.join(work_dir, "done", name))
+
+
+def checkpoint(work_dir, name):
+    """
+    Record that a step of a conversion completed, so a retried job skips it.
+    The markers live in the work directory, which is removed once the movie is ready;
+    a later re-conversion therefore starts from scratch.
+
+    Args:
+        work_dir (str): The work directory of the conversion.
+        name (str): The name of the step.
+    """
+    os.makedirs(os.path.join(work_dir, "done"), exist_ok=True)
+    open(os.path.join(work_dir, "done", name), "w").close()
+
+
+def get_staging_dir(work_dir, resolution):
+    """
+    Get an empty staging directory to encode a rendition into.
+    Leftovers of an interrupted attempt are removed first.
+
+    Args:
+        work_dir (str): The work directory of the conversion.
+        resolution (str): The name of the rendition.
+
+    Returns:
+        str: The path of the empty staging directory.
+    """
+    staging_dir = os.path.join(work_dir, "staging", resolution)
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+    return staging_dir
+
+
+def publish_rendition(staging_dir, hls_base_dir, resolution):
+    """
+    Move a completely encoded rendition from its staging directory into the served HLS tree.
+    The rendition is moved into a new version directory and the served path is a symlink to it,
+    swapped in one os.replace, so video_hls serves either the previous rendition or the complete
+    new one, never a half-written or missing playlist.
+
+    Args:
+        staging_dir (str): The staging directory holding the encoded rendition.
+        hls_base_dir (str): The directory holding one subdirectory per rendition.
+        resolution (str): The name of the rendition.
+    """
+    hls_dir = os.path.join(hls_base_dir, resolution)
+    os.makedirs(hls_base_dir, exist_ok=True)
+    version = f".{resolution}.{uuid.uuid4().hex[:12]}"
+    os.rename(staging_dir, os.path.join(hls_base_dir, version))
+
+    previous_dir = os.path.realpath(hls_dir) if os.path.islink(hls_dir) else None
+    if os.path.isdir(hls_dir) and previous_dir is None:
+        # A directory published before versioning cannot be replaced by a symlink in one step.
+        shutil.rmtree(hls_dir)
+    link = os.path.join(hls_base_dir, f"{version}.link")
+    os.symlink(version, link)
+    os.replace(link, hls_dir)
+    if previous_dir:
+        shutil.rmtree(previous_dir, ignore_errors=True)
+
+
+def publish_checkpointed(work_dir, hls_base_dir, name, on_publish=None):
+    """
+    Publish a staged rendition, checkpoint it and notify on_publish.
+
+    Args:
+        work_dir (str): The work directory of the conversion.
+        hls_base_dir (str): The directory receiving one subdirectory per rendition.
+        name (str): The name of the rendition.
+        on_publish (callable): Optional callback receiving the name of the published rendition.
+    """
+    publish_rendition(os.path.join(work_dir, "staging", name), hls_base_dir, name)
+    checkpoint(work_dir, name)
+    if on_publish:
+        on_publish(name)
+
+
+def transcode_hls(input_file, hls_base_dir, work_dir, single_decode=True, metadata=None, progress=None,
+                  lowest_first=False, on_publish=None, threads=None, extras=(), on_extras=None):
+    """
+    Encode the renditions fitting the source into hls_base_dir and write the master playlist.
+    Each rendition is encoded into a staging directory, published atomically and checkpointed;
+    renditions checkpointed by an interrupted earlier attempt are skipped.
+    Renditions the source can be stream-copied into are segmented first, without re-encoding.
+    Audio is encoded once, by the first ffmpeg process, into the shared audio rendition.
+
+    Args:
+        input_file (str): The path to the input video file.
+        hls_base_dir (str): The directory receiving one subdirectory per rendition.
+        work_dir (str): The scratch directory for staging and checkpoints.
+        single_decode (bool): Decode the source once for all renditions instead of once per rendition.
+        metadata (dict): The source metadata; the source is probed if it is not given.
+        progress (ProgressTracker): Optional tracker receiving the encoding progress.
+        lowest_first (bool): In single-decode mode, encode and publish the lowest rendition on its own
+            before the others, so the title becomes playable after a fraction of the total time.
+        on_publish (callable): Optional callback receiving the name of every published rendition.
+        threads (int): The threads granted from the ffmpeg thread budget, or None to let ffmpeg decide.
+        extras (list): Further outputs for build_single_decode_command, fed from the first single decode.
+            Without a single decode to join, they get a decode of their own.
+        on_extras (callable): Optional callback run once the extras are written.
+
+    Returns:
+        str: The path of the master playlist.
+    """
+    if metadata is None:
+        metadata = probe_video(input_file)
+    audio_exists = metadata["has_audio"]
+    renditions = select_renditions(metadata)
+    pending = {res: rendition for res, rendition in renditions.items() if not is_checkpointed(work_dir, res)}
+    encoded = encoded_renditions(pending)
+    copied = [{res: rendition} for res, rendition in pending.items() if res not in encoded]
+
+    if not single_decode:
+        batches = [{res: rendition} for res, rendition in encoded.items()]
+    elif lowest_first and len(encoded) > 1 and next(iter(renditions)) in encoded:
+        lowest = next(iter(renditions))
+        batches = [{lowest: encoded[lowest]}, {res: r for res, r in encoded.items() if res != lowest}]
+    else:
+        batches = [encoded] if encoded else []
+    batches = copied + batches
+
+    audio_pending = audio_exists and not is_checkpointed(work_dir, HLS_AUDIO_RENDITION)
+    if audio_pending and not batches:
+        run_ffmpeg(build_audio_command(input_file, get_staging_dir(work_dir, HLS_AUDIO_RENDITION), threads))
+        publish_checkpointed(work_dir, hls_base_dir, HLS_AUDIO_RENDITION, on_publish)
+
+    # Extras join the first single-decode batch, which follows the stream-copied ones.
+    extras_batch = len(copied) if single_decode and encoded else None
+    if extras and extras_batch is None:
+        run_ffmpeg(build_single_decode_command(input_file, [], threads=threads, extras=extras))
+        if on_extras:
+            on_extras()
+
+    if progress:
+        progress.set_parts(range(len(batches)))
+    for index, batch in enumerate(batches):
+        outputs = [(get_staging_dir(work_dir, res), rendition) for res, rendition in batch.items()]
+        audio_dir = get_staging_dir(work_dir, HLS_AUDIO_RENDITION) if audio_pending and index == 0 else None
+        batch_extras = extras if index == extras_batch else ()
+        if outputs[0][1].get("passthrough"):
+            cmd = build_passthrough_command(input_file, outputs[0][0], audio_dir)
+        elif single_decode:
+            cmd = build_single_decode_command(input_file, outputs, audio_dir, threads=threads, extras=batch_extras)
+        else:
+            cmd = build_rendition_command(input_file, *outputs[0], audio_dir, threads=threads)
+        run_ffmpeg(cmd, progress.callback(index) if progress else None)
+        if audio_dir:
+            publish_checkpointed(work_dir, hls_base_dir, HLS_AUDIO_RENDITION)
+        if batch_extras and on_extras:
+            on_extras()
+        for res in batch:
+            publish_checkpointed(work_dir, hls_base_dir, res, on_publish)
+
+    return write_master_playlist(hls_base_dir, renditions, audio_exists)
+
+
+def split_into_chunks(input_file, work_dir):
+    """
+    Cut the video stream of the source into chunks of about HLS_CHUNK_SECONDS without re-encoding.
+    The segment muxer copies the stream, so every chunk starts on a source keyframe
+    and can be decoded independently. A split finished by an earlier attempt is reused.
+
+    Args:
+        input_file (str): The path to the input video file.
+        work_dir (str): The directory receiving the chunks.
+
+    Returns:
+        list: The chunk paths in playback order.
+    """
+    chunk_dir = os.path.join(work_dir, "source")
+    if not is_checkpointed(work_dir, "split"):
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+        os.makedirs(chunk_dir)
+        run_ffmpeg([
+            "ffmpeg", "-i", input_file,
+            "-map", "0:v:0", "-c", "copy",
+            "-f", "segment",
+            "-segment_time", str(settings.HLS_CHUNK_SECONDS),
+            "-reset_timestamps", "1",
+            os.path.join(chunk_dir, "chunk_%05d.mkv"),
+        ])
+        checkpoint(work_dir, "split")
+    return sorted(glob.glob(os.path.join(chunk_dir, "chunk_*.mkv")))
+
+
+def get_encoded_chunk_path(work_dir, resolution, index):
+    """
+    Get the path of an encoded chunk of one rendition.
+
+    Args:
+        work_dir (str): The work directory of the conversion.
+        resolution (str): The name of the rendition.
+        index (int): The position of the chunk in the source.
+
+    Returns:
+        str: The path of the encoded chunk.
+    """
+    return os.path.join(work_dir, resolution, f"chunk_{index:05d}.mkv")
+
+
+def encode_chunk(chunk_path, index, work_dir, renditions, threads=None):
+    """
+    Encode the video of one source chunk into every rendition with a single decode.
+    A chunk checkpointed by an earlier attempt is skipped, a partially encoded one is overwritten.
+
+    Args:
+        chunk_path (str): The path of the source chunk.
+        index (int): The position of the chunk in the source.
+        work_dir (str): The work directory of the conversion.
+        renditions (dict): The renditions keyed by name.
+        threads (int): The threads granted to the process, or None to let ffmpeg decide.
+    """
+    if is_checkpointed(work_dir, f"chunk_{index:05d}"):
+        return
+    encoder_threads = split_threads(threads, len(renditions))
+    cmd = ["ffmpeg", "-y", *thread_args(threads), "-i", chunk_path]
+    cmd += ["-filter_complex", split_filter_graph(list(renditions.values()))]
+    for i, (res, rendition) in enumerate(renditions.items()):
+        output = get_encoded_chunk_path(work_dir, res, index)
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        cmd += ["-map", f"[v{i}out]"] + video_encoder_args(rendition, encoder_threads) + [output]
+    run_ffmpeg(cmd)
+    checkpoint(work_dir, f"chunk_{index:05d}")
+
+
+def stitch_chunks(input_file, work_dir, hls_base_dir, renditions, chunk_count, audio_exists, on_publish=None):
+    """
+    Join the encoded chunks of every rendition into one continuous video-only HLS rendition.
+    The video is stream-copied through the concat demuxer; passthrough renditions are segmented straight
+    from the source. The audio is encoded once into the shared audio rendition straight from the source,
+    so it has no gaps at chunk boundaries.
+    Every rendition is stitched into a staging directory and published atomically.
+
+    Args:
+        input_file (str): The path to the input video file.
+        work_dir (str): The work directory of the conversion.
+        hls_base_dir (str): The directory receiving one subdirectory per rendition.
+        renditions (dict): The renditions keyed by name.
+        chunk_count (int): The number of chunks the source was cut into.
+        audio_exists (bool): Whether the source has an audio stream.
+        on_publish (callable): Optional callback receiving the name of every published rendition.
+
+    Returns:
+        str: The path of the master playlist.
+    """
+    if audio_exists and not is_checkpointed(work_dir, HLS_AUDIO_RENDITION):
+        run_ffmpeg(build_audio_command(input_file, get_staging_dir(work_dir, HLS_AUDIO_RENDITION)))
+        publish_checkpointed(work_dir, hls_base_dir, HLS_AUDIO_RENDITION)
+
+    for res in renditions:
+        if is_checkpointed(work_dir, res):
+            continue
+        if renditions[res].get("passthrough"):
+            run_ffmpeg(build_passthrough_command(input_file, get_staging_dir(work_dir, res)))
+            publish_checkpointed(work_dir, hls_base_dir, res, on_publish)
+            continue
+        concat_list = os.path.join(work_dir, f"{res}.txt")
+        with open(concat_list, "w") as f:
+            for index in range(chunk_count):
+                f.write(f"file '{get_encoded_chunk_path(work_dir, res, index)}'\n")
+
+        staging_dir = get_staging_dir(work_dir, res)
+        cmd = ["ffmpeg", "-f", "concat", "-safe", "0", "-i", concat_list, "-map", "0:v:0", "-c:v", "copy"]
+        run_ffmpeg(cmd + hls_output_args(staging_dir))
+        publish_checkpointed(work_dir, hls_base_dir, res, on_publish)
+
+    return write_master_playlist(hls_base_dir, renditions, audio_exists)
+
+
+def transcode_hls_chunked(input_file, hls_base_dir, work_dir, metadata=None, progress=None, on_publish=None,
+                          threads=None):
+    """
+    Encode the source in keyframe-bounded chunks on a pool of HLS_CHUNK_WORKERS parallel ffmpeg processes
+    and stitch the chunks into continuous HLS renditions.
+    Wall time scales with the number of cores instead of the length of the source.
+    Granted threads cap the pool size and are split evenly over the parallel processes.
+
+    Args:
+        input_file (str): The path to the input video file.
+        hls_base_dir (str): The directory receiving one subdirectory per rendition.
+        work_dir (str): The scratch directory for chunks, staging and checkpoints.
+        metadata (dict): The source metadata; the source is probed if it is not given.
+        progress (ProgressTracker): Optional tracker receiving one part per finished chunk.
+        on_publish (callable): Optional callback receiving the name of every published rendition.
+        threads (int): The threads granted from the ffmpeg thread budget, or None to let ffmpeg decide.
+
+    Returns:
+        str: The path of the master playlist.
+    """
+    if metadata is None:
+        metadata = probe_video(input_file)
+    renditions = select_renditions(metadata)
+    encoded = encoded_renditions(renditions)
+    chunks = split_into_chunks(input_file, work_dir) if encoded else []
+    if progress:
+        progress.set_parts(range(len(chunks)) or [None])
+
+    workers = min(settings.HLS_CHUNK_WORKERS, threads or settings.HLS_CHUNK_WORKERS)
+    chunk_threads = split_threads(threads, workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(encode_chunk, chunk_path, index, work_dir, encoded, chunk_threads): index
+            for index, chunk_path in enumerate(chunks)
+        }
+        for future in as_completed(futures):
+            future.result()
+            if progress:
+                progress.update(futures[future], 1.0)
+
+    return stitch_chunks(
+        input_file, work_dir, hls_base_dir, renditions, len(chunks), metadata["has_audio"], on_publish=on_publish
+    )
+
+
+def convert_to_hls(movie, input_file, progress=None):
+    """
+    Convert the specified movie to HLS format.
+    This function generates HLS segments and playlists for the resolutions fitting the source
+    plus a master playlist and stores the master playlist on the movie.
+    The generated files are stored in the media directory.
+    HLS_TRANSCODE_MODE selects whether the source is decoded once for all renditions
+    ("single_decode"), once per rendition ("per_rendition") or in parallel chunks ("chunked").
+    With HLS_PUBLISH_LOWEST_FIRST the lowest rendition is published first and the master playlist
+    is rewritten whenever another rendition becomes available.
+    Encoding waits for a lease from the host-wide ffmpeg thread budget; the chunked pool asks for
+    the whole budget, the other modes for FFMPEG_JOB_THREADS.
+    With HLS_INLINE_PREVIEWS, thumbnails, trickplay sprites and the hover preview clip are extra outputs
+    of the first single decode.
+    Which renditions are stream-copied and which are encoded is reported in the job metadata.
+
+    Args:
+        movie (Movie): The movie instance to convert.
+        input_file (str): The path to the input video file.
+        progress (ProgressTracker): Optional tracker receiving the encoding progress.
+    """
+    metadata = get_source_metadata(movie, input_file)
+    report_passthrough(select_renditions(metadata))
+    if progress:
+        progress.duration = metadata["duration"]
+    hls_base_dir, work_dir = get_hls_base_dir(movie.id), get_work_dir(movie.id)
+    lowest_first = settings.HLS_PUBLISH_LOWEST_FIRST
+    on_publish = (lambda res: publish_available_renditions(movie, metadata)) if lowest_first else None
+    extras, on_extras = (), None
+    if inline_previews_enabled() and not is_checkpointed(work_dir, INLINE_PREVIEWS_CHECKPOINT):
+        extras, on_extras = build_inline_previews(movie, metadata, work_dir)
+    if settings.HLS_TRANSCODE_MODE == "chunked":
+        with ffmpeg_threads(settings.FFMPEG_CHUNK_POOL_THREADS) as threads:
+            master_path = transcode_hls_chunked(
+                input_file, hls_base_dir, work_dir, metadata=metadata, progress=progress, on_publish=on_publish,
+                threads=threads
+            )
+    else:
+        single_decode = settings.HLS_TRANSCODE_MODE == "single_decode"
+        with ffmpeg_threads(settings.FFMPEG_JOB_THREADS) as threads:
+            master_path = transcode_hls(
+                input_file, hls_base_dir, work_dir, single_decode=single_decode, metadata=metadata,
+                progress=progress, lowest_first=lowest_first, on_publish=on_publish, threads=threads,
+                extras=extras, on_extras=on_extras
+            )
+    movie.hls_master_playlist.name = os.path.relpath(master_path, settings.MEDIA_ROOT)
+
+
+def inline_previews_enabled():
+    """
+    Check whether thumbnails, trickplay and the preview clip are produced inside the transcode decode.
+    This needs HLS_INLINE_PREVIEWS and the single_decode mode, the only one sharing one decode between outputs;
+    otherwise they get their own jobs.
+    """
+    return settings.HLS_INLINE_PREVIEWS and settings.HLS_TRANSCODE_MODE == "single_decode"
+
+
+def get_preview_name(movie_id):
+    """
+    Get the media-relative name of the hover preview clip of a movie.
+    """
+    return f"previews/{movie_id}_preview.mp4"
+
+
+def preview_encoder_args():
+    """
+    Build the encoder arguments of the small, silent hover preview clip.
+
+    Returns:
+        list: The ffmpeg arguments.
+    """
+    return [
+        "-c:v", "h264", "-profile:v", "main",
+        "-b:v", str(PREVIEW_BITRATE), "-maxrate", str(int(PREVIEW_BITRATE * 1.5)), "-bufsize", str(PREVIEW_BITRATE * 2),
+        "-an", "-movflags", "+faststart",
+    ]
+
+
+def build_inline_previews(movie, metadata, work_dir):
+    """
+    Build the thumbnail, trickplay and preview clip outputs that ride along a single-decode ffmpeg command.
+    The preview clip covers PREVIEW_SECONDS from a tenth into the video.
+    Like generate_thumbnail, a thumbnail supplied with the movie is kept and no thumbnails are rendered.
+
+    Args:
+        movie (Movie): The movie being converted.
+        metadata (dict): The source metadata as returned by get_source_metadata.
+        work_dir (str): The work directory of the conversion.
+
+    Returns:
+        tuple: The extra outputs for build_single_decode_command and a callable storing
+            the results once ffmpeg finished.
+    """
+    duration = metadata["duration"] or 0
+    tile_height = trickplay_tile_height(metadata["width"], metadata["height"])
+    trickplay_dir = get_staging_dir(work_dir, TRICKPLAY_DIR)
+    thumb_start = min(1.0, duration / 2)
+    preview_start = round(min(duration / 10, max(duration - PREVIEW_SECONDS, 0)), 3)
+    for name in ("thumbnails", "previews"):
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, name), exist_ok=True)
+
+    def thumbnails(label):
+        graph, output_args = thumbnail_outputs("thumb", movie.id)
+        return f"[{label}]trim=start={thumb_start},setpts=PTS-STARTPTS[thumb];{graph}", output_args
+
+    def trickplay(label):
+        return f"[{label}]{trickplay_filter(tile_height)}[tp]", ["-map", "[tp]"] + trickplay_output_args(trickplay_dir)
+
+    def preview(label):
+        graph = (
+            f"[{label}]trim=start={preview_start}:duration={PREVIEW_SECONDS},setpts=PTS-STARTPTS,"
+            f"scale=w='min(iw,{PREVIEW_WIDTH})':h=-2[pv]"
+        )
+        path = os.path.join(settings.MEDIA_ROOT, get_preview_name(movie.id))
+        return graph, ["-map", "[pv]"] + preview_encoder_args() + [path]
+
+    keep_thumbnail = bool(movie.thumbnail)
+
+    def store():
+        if duration:
+            write_trickplay_vtt(trickplay_dir, duration, tile_height)
+            publish_rendition(trickplay_dir, get_hls_base_dir(movie.id), TRICKPLAY_DIR)
+        if not keep_thumbnail:
+            store_thumbnail_variants(movie.id)
+        Movie.objects.filter(pk=movie.pk).update(preview_clip=get_preview_name(movie.id))
+        checkpoint(work_dir, INLINE_PREVIEWS_CHECKPOINT)
+
+    extras = [trickplay, preview] if keep_thumbnail else [thumbnails, trickplay, preview]
+    return extras, store
+
+
+def record_first_playable(movie_id, master_name):
+    """
+    Store the master playlist and the time a movie first became playable, if it was not playable before.
+    The delay between upload and first playable master is logged as the time-to-first-playable metric.
+
+    Args:
+        movie_id (int): The ID of the movie.
+        master_name (str): The master playlist path relative to MEDIA_ROOT.
+    """
+    now = timezone.now()
+    first = Movie.objects.filter(pk=movie_id, first_playable_at__isnull=True).update(
+        first_playable_at=now, hls_master_playlist=master_name
+    )
+    if first:
+        created_at = Movie.objects.values_list("created_at", flat=True).get(pk=movie_id)
+        logger.info("Movie %s playable %.1fs after upload", movie_id, (now - created_at).total_seconds())
+
+
+def publish_available_renditions(movie, metadata):
+    """
+    Rewrite the master playlist with the renditions published so far and make the movie playable.
+    Nothing is published until a video rendition and, if the source has audio, the audio rendition exist.
+
+    Args:
+        movie (Movie): The movie being converted.
+        metadata (dict): The source metadata as returned by probe_video.
+    """
+    hls_base_dir = get_hls_base_dir(movie.id)
+    renditions = {
+        res: rendition for res, rendition in select_renditions(metadata).items()
+        if os.path.isdir(os.path.join(hls_base_dir, res))
+    }
+    audio_published = os.path.isdir(os.path.join(hls_base_dir, HLS_AUDIO_RENDITION))
+    if not renditions or (metadata["has_audio"] and not audio_published):
+        return
+    master_path = write_master_playlist(hls_base_dir, renditions, metadata["has_audio"])
+    record_first_playable(movie.id, os.path.relpath(master_path, settings.MEDIA_ROOT))
+
+
+def mark_conversion_failed(job, connection, exc_type, exc_value, traceback):
+    """
+    RQ failure callback of the conversion jobs.
+    It marks the movie as failed once the failing job has no retries left.
+    """
+    if job.retries_left:
+        return
+    set_transcode_status(job.args[0], Movie.TranscodeStatus.FAILED)
+
+
+def mark_movie_ready(movie):
+    """
+    Mark a converted movie as ready, writing only the master playlist and status fields,
+    and drop the work directory with its checkpoints.
+
+    Args:
+        movie (Movie): The converted movie with its master playlist set.
+    """
+    set_transcode_status(
+        movie.id, Movie.TranscodeStatus.READY, progress=100.0,
+        hls_master_playlist=movie.hls_master_playlist.name
+    )
+    record_first_playable(movie.id, movie.hls_master_playlist.name)
+    shutil.rmtree(get_work_dir(movie.id), ignore_errors=True)
+
+
+def publish_master_playlist(movie, metadata):
+    """
+    Write the master playlist for the renditions fitting the source and store it on the movie.
+
+    Args:
+        movie (Movie): The movie instance.
+        metadata (dict): The source metadata as returned by probe_video.
+    """
+    renditions = select_renditions(metadata)
+    master_path = write_master_playlist(get_hls_base_dir(movie.id), renditions, metadata["has_audio"])
+    movie.hls_master_playlist.name = os.path.relpath(master_path, settings.MEDIA_ROOT)
+
+
+@job('transcode', retry=Retry(max=3, interval=[30, 120, 300]), on_failure=mark_conversion_failed)
+def convert_rendition_task(movie_id, resolution):
+    """
+    Encode a single rendition of the specified movie.
+    Each rendition runs as its own job, so renditions of one movie are spread over all workers
+    and a failed rendition is retried on its own. A rendition that was already published
+    by an earlier attempt is skipped.
+
+    Args:
+        movie_id (int): The ID of the movie to convert.
+        resolution (str): The name of the rendition in HLS_RESOLUTIONS, or HLS_AUDIO_RENDITION.
+    """
+    movie = Movie.objects.get(id=movie_id)
+    work_dir = get_work_dir(movie.id)
+    if is_checkpointed(work_dir, resolution):
+        return
+    input_file = movie.video_file.path
+    metadata = get_source_metadata(movie, input_file)
+    staging_dir = get_staging_dir(work_dir, resolution)
+    progress = ProgressTracker(movie.id, metadata["duration"], scope=resolution)
+    if resolution == HLS_AUDIO_RENDITION:
+        with ffmpeg_threads(1) as threads:
+            run_ffmpeg(build_audio_command(input_file, staging_dir, threads), progress.callback())
+    elif select_renditions(metadata)[resolution].get("passthrough"):
+        run_ffmpeg(build_passthrough_command(input_file, staging_dir), progress.callback())
+    else:
+        rendition = select_renditions(metadata)[resolution]
+        with ffmpeg_threads(settings.FFMPEG_JOB_THREADS) as threads:
+            run_ffmpeg(build_rendition_command(input_file, staging_dir, rendition, threads=threads), progress.callback())
+    publish_checkpointed(work_dir, get_hls_base_dir(movie.id), resolution)
+    if settings.HLS_PUBLISH_LOWEST_FIRST:
+        publish_available_renditions(movie, metadata)
+
+
+@job('transcode', on_failure=mark_conversion_failed)
+def finalize_movie_task(movie_id):
+    """
+    Finish a fanned-out conversion once all rendition jobs succeeded.
+    It writes the master playlist, stores it on the movie and marks the movie as ready.
+
+    Args:
+        movie_id (int): The ID of the converted movie.
+    """
+    movie = Movie.objects.get(id=movie_id)
+    publish_master_playlist(movie, get_source_metadata(movie, movie.video_file.path))
+    mark_movie_ready(movie)
+
+
+def enqueue_rendition_jobs(movie):
+    """
+    Fan the conversion of a movie out into one job per rendition plus a dependent finalize job.
+    Sources with audio get one more job encoding the shared audio rendition.
+    With HLS_PUBLISH_LOWEST_FIRST the audio and the lowest rendition jump the queue.
+
+    Args:
+        movie (Movie): The movie instance to convert.
+
+    Returns:
+        Job: The finalize job, which runs after all rendition jobs finished.
+    """
+    metadata = get_source_metadata(movie, movie.video_file.path)
+    report_passthrough(select_renditions(metadata))
+    renditions = list(select_renditions(metadata))
+    set_transcode_status(movie.id, Movie.TranscodeStatus.RUNNING, progress=0.0, scopes=renditions)
+    if metadata["has_audio"]:
+        renditions.insert(0, HLS_AUDIO_RENDITION)
+    lowest = renditions[:2] if metadata["has_audio"] else renditions[:1]
+    rendition_jobs = [
+        convert_rendition_task.delay(movie.id, res, at_front=settings.HLS_PUBLISH_LOWEST_FIRST and res in lowest)
+        for res in renditions
+    ]
+    return finalize_movie_task.delay(movie.id, depends_on=rendition_jobs)
+
+
+@job('transcode', retry=Retry(max=3, interval=[30, 120, 300]), on_failure=mark_conversion_failed)
+def encode_chunk_task(movie_id, index):
+    """
+    Encode one source chunk of the specified movie into every rendition.
+    Chunks of one movie are spread over all workers; a failed chunk is retried on its own.
+
+    Args:
+        movie_id (int): The ID of the movie to convert.
+        index (int): The position of the chunk in the source.
+    """
+    movie = Movie.objects.get(id=movie_id)
+    work_dir = get_work_dir(movie.id)
+    renditions = encoded_renditions(select_renditions(get_source_metadata(movie, movie.video_file.path)))
+    chunk_path = os.path.join(work_dir, "source", f"chunk_{index:05d}.mkv")
+    with ffmpeg_threads(settings.FFMPEG_JOB_THREADS) as threads:
+        encode_chunk(chunk_path, index, work_dir, renditions, threads)
+    ProgressTracker(movie.id, movie.source_duration, scope=f"chunk{index}").update(None, 1.0)
+
+
+@job('transcode', on_failure=mark_conversion_failed)
+def stitch_chunks_task(movie_id, chunk_count):
+    """
+    Stitch the encoded chunks of the specified movie into HLS renditions once all chunk jobs succeeded
+    and mark the movie as ready.
+
+    Args:
+        movie_id (int): The ID of the converted movie.
+        chunk_count (int): The number of chunks the source was cut into.
+    """
+    movie = Movie.objects.get(id=movie_id)
+    input_file = movie.video_file.path
+    metadata = get_source_metadata(movie, input_file)
+    on_publish = (lambda res: publish_available_renditions(movie, metadata)) if settings.HLS_PUBLISH_LOWEST_FIRST else None
+    master_path = stitch_chunks(
+        input_file, get_work_dir(movie.id), get_hls_base_dir(movie.id),
+        select_renditions(metadata), chunk_count, metadata["has_audio"], on_publish=on_publish
+    )
+    movie.hls_master_playlist.name = os.path.relpath(master_path, settings.MEDIA_ROOT)
+    mark_movie_ready(movie)
+
+
+def enqueue_chunk_jobs(movie):
+    """
+    Cut the source of a movie into chunks and enqueue one encode job per chunk plus a dependent stitch job.
+    If every rendition is stream-copied, the source is not cut and only the stitch job is enqueued.
+
+    Args:
+        movie (Movie): The movie instance to convert.
+
+    Returns:
+        Job: The stitch job, which runs after all chunk jobs finished.
+    """
+    renditions = select_renditions(get_source_metadata(movie, movie.video_file.path))
+    report_passthrough(renditions)
+    chunks = split_into_chunks(movie.video_file.path, get_work_dir(movie.id)) if encoded_renditions(renditions) else []
+    scopes = [f"chunk{index}" for index in range(len(chunks))]
+    set_transcode_status(movie.id, Movie.TranscodeStatus.RUNNING, progress=0.0, scopes=scopes)
+    chunk_jobs = [encode_chunk_task.delay(movie.id, index) for index in range(len(chunks))]
+    return stitch_chunks_task.delay(movie.id, len(chunks), depends_on=chunk_jobs)
+
+
+def link_or_copy(source, destination):
+    """
+    Hard-link a file, falling back to a copy where hard links are not possible.
+
+    Args:
+        source (str): The existing file.
+        destination (str): The path of the new file.
+    """
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def enqueue_conversion(movie_id):
+    """
+    Enqueue the conversion of a movie, with thumbnail and trickplay jobs unless the conversion produces them.
+
+    Args:
+        movie_id (int): The ID of the movie to convert.
+    """
+    if not inline_previews_enabled():
+        generate_thumbnail.delay(movie_id)
+        generate_trickplay.delay(movie_id)
+    convert_movie_task.delay(movie_id)
+
+
+def dispatch_conversion(movie):
+    """
+    Reuse the conversion of a movie with the same original video file, or enqueue a new conversion.
+
+    Args:
+        movie (Movie): The movie instance with its video_sha256, if known.
+    """
+    duplicate = movie.find_converted_duplicate()
+    if duplicate:
+        reuse_conversion.delay(duplicate.id, movie.id)
+    else:
+        enqueue_conversion(movie.id)
+
+
+@job('thumbnails')
+def hash_movie_task(movie_id):
+    """
+    Hash the original video file of a movie and dispatch its conversion.
+    Hashing reads the whole file, so it runs here instead of in the request that saved the movie,
+    and on the thumbnails queue, so it never holds up the mail workers draining the default queue.
+
+    Args:
+        movie_id (int): The ID of the movie to hash.
+    """
+    movie = Movie.objects.get(id=movie_id)
+    movie.video_sha256 = movie.hash_video_file()
+    Movie.objects.filter(pk=movie.pk).update(video_sha256=movie.video_sha256)
+    dispatch_conversion(movie)
+
+
+@job('thumbnails')
+def reuse_conversion(source_id, movie_id):
+    """
+    Give a movie the renditions and thumbnail of an already converted movie with the same original file.
+    The files are hard-linked, so re-uploads cost neither a decode nor additional storage,
+    and deleting either movie leaves the other one intact.
+    If the converted movie or its renditions are gone, the movie is converted normally instead.
+
+    Args:
+        source_id (int): The ID of the converted movie.
+        movie_id (int): The ID of the re-uploaded movie.
+    """
+    source = Movie.objects.filter(id=source_id).first()
+    if source is None or not os.path.isfile(os.path.join(get_hls_base_dir(source_id), "master.m3u8")):
+        logger.warning("Converted movie %s is gone, converting movie %s instead", source_id, movie_id)
+        enqueue_conversion(movie_id)
+        return
+    hls_base_dir = get_hls_base_dir(movie_id)
+    shutil.rmtree(hls_base_dir, ignore_errors=True)
+    shutil.copytree(get_hls_base_dir(source.id), hls_base_dir, symlinks=True, copy_function=link_or_copy)
+
+    fields = {f"source_{key}": getattr(source, f"source_{key}") for key in SOURCE_METADATA_KEYS}
+    fields["bitrate_ladder"] = source.bitrate_ladder
+    fields["hls_master_playlist"] = os.path.relpath(os.path.join(hls_base_dir, "master.m3u8"), settings.MEDIA_ROOT)
+    if source.thumbnail_variants:
+        variants = {}
+        for fmt, names in source.thumbnail_variants.items():
+            variants[fmt] = {width: get_thumbnail_name(movie_id, width, fmt) for width in names}
+            for width, name in names.items():
+                link_or_copy(
+                    os.path.join(settings.MEDIA_ROOT, name), os.path.join(settings.MEDIA_ROOT, variants[fmt][width])
+                )
+        fields["thumbnail_variants"] = variants
+        fields["thumbnail"] = variants["jpeg"][str(max(THUMBNAIL_WIDTHS))]
+    elif source.thumbnail:
+        thumb_name = f"thumbnails/{movie_id}_thumb.jpg"
+        link_or_copy(source.thumbnail.path, os.path.join(settings.MEDIA_ROOT, thumb_name))
+        fields["thumbnail"] = thumb_name
+    if source.preview_clip:
+        link_or_copy(source.preview_clip.path, os.path.join(settings.MEDIA_ROOT, get_preview_name(movie_id)))
+        fields["preview_clip"] = get_preview_name(movie_id)
+    set_transcode_status(movie_id, Movie.TranscodeStatus.READY, progress=100.0, **fields)
+
+
+@job('transcode', retry=Retry(max=3, interval=[30, 120, 300]), on_failure=mark_conversion_failed)
+def convert_movie_task(movie_id):
+    """
+    Convert the specified movie to HLS format.
+    This is a background task that retrieves the movie instance and calls the conversion function.
+    With HLS_TRANSCODE_MODE "fanout" it only enqueues one job per rendition and a finalize job.
+    With "chunked" and HLS_CHUNK_EXECUTOR "rq" it only cuts the source and enqueues one job per chunk
+    and a stitch job.
+    With PER_TITLE_LADDER the source is analysed first, so every mode encodes with the per-title bitrates.
+    Status transitions are persisted on the movie, live progress is buffered in the cache.
+    A failed conversion is retried like the rendition and chunk jobs and resumes from its checkpoints.
+
+    Args:
+        movie_id (int): The ID of the movie to convert.
+    """
+    movie = Movie.objects.get(id=movie_id)
+    if settings.PER_TITLE_LADDER:
+        analyze_complexity(movie, movie.video_file.path)
+    if settings.HLS_TRANSCODE_MODE == "fanout":
+        enqueue_rendition_jobs(movie)
+        return
+    if settings.HLS_TRANSCODE_MODE == "chunked" and settings.HLS_CHUNK_EXECUTOR == "rq":
+        enqueue_chunk_jobs(movie)
+        return
+
     input_file = movie.video_file.path
-    convert_to_hls(movie, input_file)
-    movie.save()
+    set_transcode_status(movie.id, Movie.TranscodeStatus.RUNNING, progress=0.0)
+    convert_to_hls(movie, input_file, progress=ProgressTracker(movie.id))
+    mark_movie_ready(movie)
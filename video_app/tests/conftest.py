@@ -1,10 +1,28 @@
 import pytest
 
+from django.core.cache import cache
 from django.test import RequestFactory
 from rest_framework.test import APIClient
 from rest_framework_simplejwt.tokens import AccessToken
 
 from video_app.models import Movie, Category
+from video_app.utils import playlist_cache, upload_digests
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    playlist_cache.clear()
+    upload_digests.clear()
+    yield
+    cache.clear()
+    playlist_cache.clear()
+    upload_digests.clear()
+
+
+@pytest.fixture(autouse=True)
+def no_thread_budget(settings):
+    settings.FFMPEG_THREAD_BUDGET = 0
 
 
 @pytest.fixture
@@ -0,0 +1,65 @@
+import pytest
+
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+
+def test_benchmark_hls_runs_both_modes(tmp_path):
+    with mock.patch("video_app.management.commands.benchmark_hls.transcode_hls") as mock_transcode:
+        out = StringIO()
+        call_command("benchmark_hls", str(tmp_path / "video.mp4"), stdout=out)
+
+    modes = [call.kwargs["single_decode"] for call in mock_transcode.call_args_list]
+    assert modes == [False, True]
+    assert "per_rendition" in out.getvalue()
+    assert "single_decode" in out.getvalue()
+
+
+def test_loadtest_hls_reports_viewer_capacity():
+    response = mock.MagicMock()
+    response.__enter__.return_value.read.return_value = b"segment"
+    with mock.patch("urllib.request.urlopen", return_value=response) as mock_urlopen:
+        out = StringIO()
+        call_command("loadtest_hls", "http://proxy/a.ts", "http://proxy/b.ts", viewers=2, requests=3, stdout=out)
+
+    assert mock_urlopen.call_count == 6
+    assert "requests 6  errors 0" in out.getvalue()
+    assert "sustainable viewers" in out.getvalue()
+
+
+def test_run_workers_starts_workers_per_queue(settings):
+    settings.RQ_WORKERS = {"mail": 1, "thumbnails": 1, "transcode": 2}
+    with mock.patch("subprocess.Popen") as mock_popen, \
+         mock.patch("signal.signal"), \
+         mock.patch("time.sleep", side_effect=KeyboardInterrupt):
+        mock_popen.return_value.poll.return_value = None
+        call_command("run_workers", stdout=StringIO())
+
+    queues = [call.args[0][4:] for call in mock_popen.call_args_list]
+    assert queues == [["mail", "default"], ["thumbnails"], ["transcode"], ["transcode"]]
+    assert mock_popen.return_value.send_signal.call_count == 4
+
+
+def test_run_workers_restarts_exited_workers_after_delay(settings):
+    settings.RQ_WORKERS = {"transcode": 2}
+    crashed, running = mock.MagicMock(returncode=1), mock.MagicMock()
+    crashed.poll.return_value = 1
+    running.poll.return_value = None
+    clock = iter([0.0, 1.0, 6.0])
+    with mock.patch("subprocess.Popen", side_effect=[crashed, running, running]) as mock_popen, \
+         mock.patch("signal.signal"), \
+         mock.patch("time.monotonic", side_effect=lambda: next(clock)), \
+         mock.patch("time.sleep", side_effect=[None, None, KeyboardInterrupt]) as mock_sleep:
+        call_command("run_workers", stdout=StringIO(), stderr=StringIO())
+
+    assert mock_popen.call_count == 3
+    assert all(call.args == (1.0,) for call in mock_sleep.call_args_list)
+
+
+def test_run_workers_rejects_unknown_queue(settings):
+    settings.RQ_WORKERS = {"encode": 1}
+    with pytest.raises(CommandError):
+        call_command("run_workers")
@@ -3,11 +3,14 @@ import pytest
 from unittest import mock
 
 from video_app.models import Movie
+from video_app import tasks
 
 @pytest.mark.django_db
 def test_video_integration(auth_client, user, category, movie_file):
-    with mock.patch("video_app.signals.generate_thumbnail.delay") as mock_thumb, \
-         mock.patch("video_app.signals.convert_movie_task.delay") as mock_convert, \
+    with mock.patch("video_app.signals.hash_movie_task.delay", side_effect=tasks.hash_movie_task), \
+         mock.patch("video_app.tasks.generate_thumbnail.delay") as mock_thumb, \
+         mock.patch("video_app.tasks.generate_trickplay.delay") as mock_trickplay, \
+         mock.patch("video_app.tasks.convert_movie_task.delay") as mock_convert, \
          mock.patch("django.db.transaction.on_commit", side_effect=lambda func: func()):
 
         movie = Movie.objects.create(
@@ -53,4 +53,31 @@ def test_video_serializer_without_thumbnail(user):
     data = serializer.data
 
     assert data["thumbnail_url"] is None
-    assert data["category"] == "Drama"
\ No newline at end of file
+    assert data["category"] == "Drama"
+
+
+@pytest.mark.django_db
+def test_video_serializer_thumbnail_srcset(user):
+    request = APIRequestFactory().get("/api/videos/")
+    category = Category.objects.create(name="Docs")
+    movie = Movie.objects.create(
+        title="Variants",
+        description="desc",
+        video_file="test.mp4",
+        category=category,
+        thumbnail="thumbnails/1_thumb_1280.jpg",
+        thumbnail_variants={
+            "webp": {"640": "thumbnails/1_thumb_640.webp", "320": "thumbnails/1_thumb_320.webp"},
+            "jpeg": {"640": "thumbnails/1_thumb_640.jpg", "320": "thumbnails/1_thumb_320.jpg"},
+        },
+    )
+
+    data = VideoSerializer(movie, context={"request": request}).data
+
+    assert data["thumbnail_url"] == "http://testserver/media/thumbnails/1_thumb_320.jpg"
+    assert data["thumbnails"] == {
+        "webp": "http://testserver/media/thumbnails/1_thumb_320.webp 320w, "
+                "http://testserver/media/thumbnails/1_thumb_640.webp 640w",
+        "jpeg": "http://testserver/media/thumbnails/1_thumb_320.jpg 320w, "
+                "http://testserver/media/thumbnails/1_thumb_640.jpg 640w",
+    }
@@ -1,24 +1,52 @@
 import os
 import json
+import hashlib
 import pytest
 
 from unittest import mock
 
+from django.conf import settings
+
 from video_app.models import Movie
+from video_app.utils import ThreadBudget, get_transcode_state
 from video_app.signals import movie_post_save, delete_movie_files
 from video_app import tasks
 
 
+def probe_result(has_audio, width=1920, height=1080, bitrate=8000000):
+    return {"has_audio": has_audio, "width": width, "height": height, "frame_rate": 25.0, "bitrate": bitrate}
+
+
 @pytest.mark.django_db
 def test_movie_post_save_triggers_tasks(movie):
-    with mock.patch("video_app.signals.generate_thumbnail.delay") as mock_thumb, \
-         mock.patch("video_app.signals.convert_movie_task.delay") as mock_convert, \
+    movie.video_sha256 = "0" * 64
+    with mock.patch("video_app.tasks.generate_thumbnail.delay") as mock_thumb, \
+         mock.patch("video_app.tasks.generate_trickplay.delay") as mock_trickplay, \
+         mock.patch("video_app.tasks.convert_movie_task.delay") as mock_convert, \
          mock.patch("django.db.transaction.on_commit") as mock_tx:
 
         mock_tx.side_effect = lambda func: func()
         movie_post_save(Movie, movie, created=True)
 
     assert mock_thumb.called
+    assert mock_trickplay.called
+    assert mock_convert.called
+
+
+@pytest.mark.django_db
+def test_movie_post_save_skips_preview_jobs_with_inline_previews(movie, settings):
+    settings.HLS_INLINE_PREVIEWS = True
+    movie.video_sha256 = "0" * 64
+    with mock.patch("video_app.tasks.generate_thumbnail.delay") as mock_thumb, \
+         mock.patch("video_app.tasks.generate_trickplay.delay") as mock_trickplay, \
+         mock.patch("video_app.tasks.convert_movie_task.delay") as mock_convert, \
+         mock.patch("django.db.transaction.on_commit") as mock_tx:
+
+        mock_tx.side_effect = lambda func: func()
+        movie_post_save(Movie, movie, created=True)
+
+    assert not mock_thumb.called
+    assert not mock_trickplay.called
     assert mock_convert.called
 
 
@@ -47,15 +75,43 @@ def test_generate_thumbnail_runs_ffmpeg(movie):
     movie.video_file.path = "/fake/path.mp4"
     movie.thumbnail = None
 
-    with mock.patch("subprocess.run") as mock_run, \
-         mock.patch("builtins.open", mock.mock_open(read_data=b"thumbdata")), \
-         mock.patch("django.db.models.fields.files.ImageFieldFile.save", autospec=True) as mock_save:
-
+    with mock.patch("subprocess.run") as mock_run:
         mock_run.return_value = mock.Mock(returncode=0)
         tasks.generate_thumbnail(movie.id)
 
-        assert mock_run.called
-        assert mock_save.called
+    cmd = mock_run.call_args[0][0]
+    assert cmd.index("-ss") < cmd.index("-i")
+    assert mock_run.call_count == 1
+    assert len([arg for arg in cmd if "_thumb_" in arg]) == 6
+    movie.refresh_from_db()
+    assert movie.thumbnail.name == f"thumbnails/{movie.id}_thumb_1280.jpg"
+    assert movie.thumbnail_variants["webp"]["320"] == f"thumbnails/{movie.id}_thumb_320.webp"
+
+
+@pytest.mark.django_db
+def test_generate_trickplay_publishes_sprites_and_vtt(movie):
+    Movie.objects.filter(pk=movie.pk).update(
+        source_has_audio=True, source_width=1920, source_height=1080, source_duration=1005.0
+    )
+
+    def write_sprites(cmd, check):
+        output_dir = os.path.dirname(cmd[-1])
+        for index in (1, 2):
+            open(os.path.join(output_dir, f"sprite_{index:03d}.jpg"), "wb").close()
+
+    with mock.patch("subprocess.run", side_effect=write_sprites) as mock_run:
+        tasks.generate_trickplay(movie.id)
+
+    cmd = mock_run.call_args[0][0]
+    assert cmd.index("-skip_frame") < cmd.index("-i")
+    assert "fps=1/10,scale=160:90,tile=10x10" in cmd
+    trickplay_dir = os.path.join(tasks.get_hls_base_dir(movie.id), "trickplay")
+    assert sorted(os.listdir(trickplay_dir)) == ["sprite_001.jpg", "sprite_002.jpg", "thumbnails.vtt"]
+    vtt = open(os.path.join(trickplay_dir, "thumbnails.vtt")).read()
+    assert vtt.startswith("WEBVTT")
+    assert "00:00:10.000 --> 00:00:20.000\nsprite_001.jpg#xywh=160,0,160,90" in vtt
+    assert "00:16:40.000 --> 00:16:45.000\nsprite_002.jpg#xywh=0,0,160,90" in vtt
+    assert os.listdir(os.path.join(settings.MEDIA_ROOT, "videos/work")) == []
 
 
 def test_has_audio_stream_true_false(movie_file):
@@ -72,14 +128,14 @@ def test_has_audio_stream_true_false(movie_file):
 
 @pytest.mark.django_db
 def test_convert_to_hls_calls_ffmpeg(movie):
-    with mock.patch("video_app.tasks.has_audio_stream", return_value=True), \
+    with mock.patch("video_app.tasks.probe_video", return_value=probe_result(True)), \
          mock.patch("subprocess.run") as mock_run:
         tasks.convert_to_hls(movie, str(movie.video_file.path))
 
     assert mock_run.called
     args, _ = mock_run.call_args
     assert str(movie.video_file.path) in args[0]
-    assert "-c:a" in args[0]
+    assert sum(call[0][0].count("-c:a") for call in mock_run.call_args_list) == 1
 
 
 @pytest.mark.django_db
@@ -88,3 +144,609 @@ def test_convert_movie_task_runs(movie):
         tasks.convert_movie_task(movie.id)
 
     mock_convert.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_convert_to_hls_single_decode_runs_one_ffmpeg(movie, settings):
+    settings.HLS_TRANSCODE_MODE = "single_decode"
+    settings.HLS_PUBLISH_LOWEST_FIRST = False
+    with mock.patch("video_app.tasks.probe_video", return_value=probe_result(True)), \
+         mock.patch("subprocess.run") as mock_run:
+        tasks.convert_to_hls(movie, str(movie.video_file.path))
+
+    assert mock_run.call_count == 1
+    cmd = mock_run.call_args[0][0]
+    assert cmd.count("-i") == 1
+    assert "split=3[v0][v1][v2]" in cmd[cmd.index("-filter_complex") + 1]
+    playlists = [arg.split("/")[-2] for arg in cmd if arg.endswith("index.m3u8")]
+    assert playlists == list(tasks.HLS_RESOLUTIONS) + [tasks.HLS_AUDIO_RENDITION]
+    assert cmd.count("-c:a") == 1
+
+
+@pytest.mark.django_db
+def test_convert_to_hls_inline_previews_share_the_decode(movie, settings):
+    settings.HLS_TRANSCODE_MODE = "single_decode"
+    settings.HLS_PUBLISH_LOWEST_FIRST = False
+    settings.HLS_INLINE_PREVIEWS = True
+    probe = dict(probe_result(True), duration=100.0)
+    with mock.patch("video_app.tasks.probe_video", return_value=probe), \
+         mock.patch("subprocess.run") as mock_run:
+        tasks.convert_to_hls(movie, str(movie.video_file.path))
+
+    assert mock_run.call_count == 1
+    cmd = mock_run.call_args[0][0]
+    graph = cmd[cmd.index("-filter_complex") + 1]
+    assert "split=6[v0][v1][v2][v3][v4][v5]" in graph
+    assert "[v4]fps=1/10,scale=160:90,tile=10x10[tp]" in graph
+    assert "[v5]trim=start=10.0:duration=6" in graph
+    assert any(arg.endswith(f"{movie.id}_thumb_1280.webp") for arg in cmd)
+    assert cmd[-1].endswith(f"previews/{movie.id}_preview.mp4")
+    movie.refresh_from_db()
+    assert movie.preview_clip.name == f"previews/{movie.id}_preview.mp4"
+    assert movie.thumbnail.name == f"thumbnails/{movie.id}_thumb_1280.jpg"
+    vtt = os.path.join(tasks.get_hls_base_dir(movie.id), "trickplay", "thumbnails.vtt")
+    assert os.path.isfile(vtt)
+
+
+@pytest.mark.django_db
+def test_convert_to_hls_inline_previews_keep_supplied_thumbnail(movie, settings):
+    settings.HLS_TRANSCODE_MODE = "single_decode"
+    settings.HLS_PUBLISH_LOWEST_FIRST = False
+    settings.HLS_INLINE_PREVIEWS = True
+    Movie.objects.filter(pk=movie.pk).update(thumbnail="thumbnails/custom.jpg")
+    movie.refresh_from_db()
+    probe = dict(probe_result(True), duration=100.0)
+    with mock.patch("video_app.tasks.probe_video", return_value=probe), \
+         mock.patch("subprocess.run") as mock_run:
+        tasks.convert_to_hls(movie, str(movie.video_file.path))
+
+    cmd = mock_run.call_args[0][0]
+    assert not any("_thumb_" in arg for arg in cmd)
+    movie.refresh_from_db()
+    assert movie.thumbnail.name == "thumbnails/custom.jpg"
+    assert movie.preview_clip.name == f"previews/{movie.id}_preview.mp4"
+
+
+def test_inline_previews_only_share_the_single_decode(settings):
+    settings.HLS_INLINE_PREVIEWS = True
+    settings.HLS_TRANSCODE_MODE = "per_rendition"
+    assert not tasks.inline_previews_enabled()
+    settings.HLS_TRANSCODE_MODE = "single_decode"
+    assert tasks.inline_previews_enabled()
+
+
+def test_hls_output_args_fmp4_single_file(settings, tmp_path):
+    settings.HLS_SEGMENT_TYPE = "fmp4"
+    settings.HLS_SINGLE_FILE = True
+
+    args = tasks.hls_output_args(str(tmp_path))
+
+    assert args[args.index("-hls_segment_type") + 1] == "fmp4"
+    assert args[args.index("-hls_fmp4_init_filename") + 1] == "init.mp4"
+    assert args[args.index("-hls_flags") + 1] == "single_file"
+    assert args[args.index("-hls_segment_filename") + 1] == str(tmp_path / "segments.m4s")
+    master = tasks.write_master_playlist(str(tmp_path), {"720p": tasks.HLS_RESOLUTIONS["720p"]}, True)
+    assert "#EXT-X-VERSION:7" in open(master).read()
+
+
+def test_write_atomically_replaces_file_without_leftovers(tmp_path):
+    path = str(tmp_path / "master.m3u8")
+    tasks.write_atomically(path, b"#EXTM3U\n480p/index.m3u8\n720p/index.m3u8\n")
+    tasks.write_atomically(path, b"#EXTM3U\n")
+
+    assert open(path, "rb").read() == b"#EXTM3U\n"
+    assert os.listdir(tmp_path) == ["master.m3u8"]
+    assert os.stat(path).st_mode & 0o777 == 0o644
+
+
+def test_write_master_playlist_writes_dash_manifest_for_fmp4(settings, tmp_path):
+    settings.HLS_SEGMENT_TYPE = "fmp4"
+    settings.DASH_MANIFEST = True
+    (tmp_path / "720p").mkdir()
+    (tmp_path / "720p" / "index.m3u8").write_text(
+        "#EXTM3U\n#EXT-X-VERSION:7\n#EXT-X-MAP:URI=\"init.mp4\"\n"
+        "#EXTINF:10.000000,\nsegment_000.m4s\n#EXTINF:4.500000,\nsegment_001.m4s\n#EXT-X-ENDLIST\n"
+    )
+    (tmp_path / "audio").mkdir()
+    (tmp_path / "audio" / "index.m3u8").write_text(
+        "#EXTM3U\n#EXT-X-VERSION:7\n#EXT-X-MAP:URI=\"segments.m4s\",BYTERANGE=\"800@0\"\n"
+        "#EXTINF:10.000000,\n#EXT-X-BYTERANGE:1000@800\nsegments.m4s\n"
+        "#EXTINF:4.500000,\n#EXT-X-BYTERANGE:500\nsegments.m4s\n#EXT-X-ENDLIST\n"
+    )
+
+    tasks.write_master_playlist(str(tmp_path), {"720p": tasks.HLS_RESOLUTIONS["720p"]}, True)
+
+    mpd = open(tmp_path / "manifest.mpd").read()
+    assert 'mediaPresentationDuration="PT14.500S"' in mpd
+    assert '<Initialization sourceURL="720p/init.mp4" />' in mpd
+    assert '<S t="10000" d="4500" />' in mpd
+    assert '<SegmentURL media="720p/segment_001.m4s" />' in mpd
+    assert '<Initialization sourceURL="audio/segments.m4s" range="0-799" />' in mpd
+    assert '<SegmentURL media="audio/segments.m4s" mediaRange="1800-2299" />' in mpd
+
+
+@pytest.mark.django_db
+def test_convert_to_hls_per_rendition_runs_ffmpeg_per_resolution(movie, settings):
+    settings.HLS_TRANSCODE_MODE = "per_rendition"
+    with mock.patch("video_app.tasks.probe_video", return_value=probe_result(False)), \
+         mock.patch("subprocess.run") as mock_run:
+        tasks.convert_to_hls(movie, str(movie.video_file.path))
+
+    assert mock_run.call_count == len(tasks.HLS_RESOLUTIONS)
+    assert all("-c:a" not in call[0][0] for call in mock_run.call_args_list)
+
+
+@pytest.mark.django_db
+def test_convert_to_hls_writes_master_playlist(movie):
+    with mock.patch("video_app.tasks.probe_video", return_value=probe_result(True)), \
+         mock.patch("subprocess.run"):
+        tasks.convert_to_hls(movie, str(movie.video_file.path))
+
+    assert movie.hls_master_playlist.name == f"videos/hls/{movie.id}/master.m3u8"
+    master = open(movie.hls_master_playlist.path).read()
+    assert master.startswith("#EXTM3U")
+    assert 'RESOLUTION=854x480,CODECS="avc1.4d401f,mp4a.40.2",AUDIO="aac"' in master
+    assert '#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aac"' in master
+    assert master.rstrip().endswith("audio/index.m3u8")
+    assert 'RESOLUTION=1920x1080,CODECS="avc1.640028,mp4a.40.2",AUDIO="aac"' in master
+    assert "720p/index.m3u8" in master
+
+
+@pytest.mark.django_db
+def test_convert_to_hls_aligns_keyframes(movie, settings):
+    settings.HLS_PUBLISH_LOWEST_FIRST = False
+    with mock.patch("video_app.tasks.probe_video", return_value=probe_result(False)), \
+         mock.patch("subprocess.run") as mock_run:
+        tasks.convert_to_hls(movie, str(movie.video_file.path))
+
+    cmd = mock_run.call_args[0][0]
+    assert cmd.count("-force_key_frames") == len(tasks.HLS_RESOLUTIONS)
+    assert f"expr:gte(t,n_forced*{tasks.HLS_SEGMENT_SECONDS})" in cmd
+    assert cmd.count("-sc_threshold") == len(tasks.HLS_RESOLUTIONS)
+
+
+@pytest.mark.django_db
+def test_convert_to_hls_publishes_lowest_rendition_first(movie, settings):
+    settings.HLS_TRANSCODE_MODE = "single_decode"
+    settings.HLS_PUBLISH_LOWEST_FIRST = True
+    masters = []
+
+    def record_master(cmd, check):
+        master_path = os.path.join(tasks.get_hls_base_dir(movie.id), "master.m3u8")
+        masters.append(open(master_path).read() if os.path.exists(master_path) else None)
+
+    with mock.patch("video_app.tasks.probe_video", return_value=probe_result(True)), \
+         mock.patch("subprocess.run", side_effect=record_master) as mock_run:
+        tasks.convert_to_hls(movie, str(movie.video_file.path))
+
+    assert mock_run.call_count == 2
+    first_cmd = mock_run.call_args_list[0][0][0]
+    assert [arg.split("/")[-2] for arg in first_cmd if arg.endswith("index.m3u8")] == ["480p", "audio"]
+    assert "480p/index.m3u8" in masters[1] and "720p/index.m3u8" not in masters[1]
+    movie.refresh_from_db()
+    assert movie.first_playable_at is not None
+    assert movie.time_to_first_playable.total_seconds() >= 0
+
+
+@pytest.mark.django_db
+def test_convert_to_hls_splits_granted_threads_over_encoders(movie, settings):
+    settings.HLS_TRANSCODE_MODE = "single_decode"
+    settings.HLS_PUBLISH_LOWEST_FIRST = False
+    settings.FFMPEG_THREAD_BUDGET = 8
+    with mock.patch("video_app.utils.django_rq.get_connection"), \
+         mock.patch.object(ThreadBudget, "try_acquire", return_value=6), \
+         mock.patch.object(ThreadBudget, "release") as mock_release, \
+         mock.patch("video_app.tasks.probe_video", return_value=probe_result(True)), \
+         mock.patch("subprocess.run") as mock_run:
+        tasks.convert_to_hls(movie, str(movie.video_file.path))
+
+    cmd = mock_run.call_args[0][0]
+    assert cmd[1:4] == ["-threads", "6", "-i"]
+    assert cmd.count("-threads") == 1 + len(tasks.HLS_RESOLUTIONS)
+    assert [cmd[i + 1] for i, arg in enumerate(cmd) if arg == "-threads"][1:] == ["2", "2", "2"]
+    mock_release.assert_called_once()
+
+
+def test_thread_budget_waits_for_free_threads():
+    budget = ThreadBudget(budget=4, reserved=1, connection=mock.MagicMock())
+    budget.poll_interval = 0
+    budget.acquire_script.side_effect = [0, 0, 3]
+
+    with budget.lease(8) as granted:
+        assert granted == 3
+
+    assert budget.acquire_script.call_count == 3
+    assert budget.acquire_script.call_args.kwargs["args"][2:5] == [3, 1, 3]
+    budget.connection.pipeline.return_value.zrem.assert_called_once()
+
+
+def test_thread_budget_keeps_reserved_threads_for_previews():
+    budget = ThreadBudget(budget=4, reserved=1, connection=mock.MagicMock())
+    budget.acquire_script.return_value = 1
+
+    with budget.lease(1, preview=True):
+        pass
+
+    assert budget.acquire_script.call_args.kwargs["args"][4] == 4
+
+
+def test_probe_video_reads_source_metadata(movie_file):
+    ffprobe_out = json.dumps({
+        "streams": [
+            {"codec_type": "video", "width": 1280, "height": 720, "avg_frame_rate": "30000/1001", "bit_rate": "2500000"},
+            {"codec_type": "audio"},
+        ],
+        "format": {"bit_rate": "2700000"},
+    })
+    with mock.patch("subprocess.run") as mock_run:
+        mock_run.return_value = mock.Mock(stdout=ffprobe_out)
+        metadata = tasks.probe_video(str(movie_file))
+
+    assert mock_run.call_count == 1
+    assert metadata["has_audio"] is True
+    assert (metadata["width"], metadata["height"]) == (1280, 720)
+    assert metadata["frame_rate"] == pytest.approx(29.97, abs=0.01)
+    assert metadata["bitrate"] == 2500000
+
+
+def h264_source(profile="High", keyframe_interval=2.0, bitrate=4500000):
+    return dict(
+        probe_result(True, bitrate=bitrate),
+        video_codec="h264", video_profile=profile, video_level=40, pix_fmt="yuv420p",
+        keyframe_interval=keyframe_interval,
+    )
+
+
+def test_select_renditions_marks_matching_source_for_passthrough():
+    renditions = tasks.select_renditions(h264_source())
+
+    assert [res for res, r in renditions.items() if r.get("passthrough")] == ["1080p"]
+    assert renditions["1080p"]["video_bitrate"] == 4500000
+    assert tasks.rendition_codecs(renditions["1080p"], True) == "avc1.640028,mp4a.40.2"
+    assert not tasks.can_passthrough(h264_source(keyframe_interval=12.0), tasks.HLS_RESOLUTIONS["1080p"])
+    assert not tasks.can_passthrough(h264_source(profile="High 10"), tasks.HLS_RESOLUTIONS["1080p"])
+    assert not tasks.can_passthrough(h264_source(bitrate=20000000), tasks.HLS_RESOLUTIONS["1080p"])
+
+
+def test_probe_keyframe_interval_includes_tail(movie_file):
+    packets = "0.000000,K__\n0.040000,___\n4.000000,K__\n6.000000,K__\n11.500000,___\n"
+    with mock.patch("subprocess.run", return_value=mock.Mock(stdout=packets)):
+        assert tasks.probe_keyframe_interval(str(movie_file)) == pytest.approx(5.5)
+
+
+@pytest.mark.django_db
+def test_convert_to_hls_stream_copies_matching_rendition(movie, settings):
+    settings.HLS_TRANSCODE_MODE = "single_decode"
+    settings.HLS_PUBLISH_LOWEST_FIRST = False
+    current_job = mock.Mock(meta={})
+    with mock.patch("video_app.tasks.probe_video", return_value=h264_source()), \
+         mock.patch("video_app.tasks.probe_keyframe_interval") as mock_keyframes, \
+         mock.patch("video_app.tasks.get_current_job", return_value=current_job), \
+         mock.patch("subprocess.run") as mock_run:
+        mock_keyframes.return_value = 2.0
+        tasks.convert_to_hls(movie, str(movie.video_file.path))
+
+    copy_cmd, encode_cmd = [call[0][0] for call in mock_run.call_args_list]
+    assert copy_cmd[copy_cmd.index("-c:v") + 1] == "copy"
+    assert any(arg.endswith("1080p/index.m3u8") for arg in copy_cmd)
+    assert "split=2[v0][v1]" in encode_cmd[encode_cmd.index("-filter_complex") + 1]
+    assert current_job.meta == {"passthrough": ["1080p"], "encoded": ["480p", "720p"]}
+    current_job.save_meta.assert_called_once()
+    movie.refresh_from_db()
+    assert movie.source_keyframe_interval == 2.0
+
+
+def test_select_renditions_skips_upscales_and_caps_bitrate():
+    renditions = tasks.select_renditions(probe_result(True, width=1280, height=720, bitrate=2000000))
+
+    assert list(renditions) == ["480p", "720p"]
+    assert renditions["480p"]["video_bitrate"] == 1400000
+    assert renditions["720p"]["video_bitrate"] == 2000000
+
+
+@pytest.mark.django_db
+def test_analyze_complexity_stores_per_title_ladder(movie):
+    Movie.objects.filter(pk=movie.pk).update(source_has_audio=True, source_duration=600.0)
+    movie.refresh_from_db()
+
+    def write_trial(cmd, check):
+        # 4 s windows at 400 kbit/s, half the reference bitrate.
+        with open(cmd[-1], "wb") as f:
+            f.write(b"\0" * 200000)
+
+    with mock.patch("subprocess.run", side_effect=write_trial) as mock_run:
+        ladder = tasks.analyze_complexity(movie, movie.video_file.path)
+        tasks.analyze_complexity(movie, movie.video_file.path)
+
+    assert mock_run.call_count == tasks.COMPLEXITY_SAMPLES
+    first = mock_run.call_args_list[0][0][0]
+    assert first[first.index("-ss") + 1] == "58.0"
+    assert ladder["1080p"] == 2500000
+    movie.refresh_from_db()
+    assert movie.bitrate_ladder == ladder
+    renditions = tasks.select_renditions(dict(probe_result(True, bitrate=None), bitrate_ladder=ladder))
+    assert renditions["480p"]["video_bitrate"] == 700000
+
+
+def test_select_renditions_raises_level_for_high_frame_rates():
+    metadata = dict(probe_result(True), frame_rate=60.0)
+    renditions = tasks.select_renditions(metadata)
+
+    assert [r["level"] for r in renditions.values()] == ["3.1", "3.2", "4.2"]
+    assert tasks.rendition_codecs(renditions["1080p"], False) == "avc1.64002a"
+    assert [r["level"] for r in tasks.select_renditions(probe_result(True)).values()] == ["3.1", "3.1", "4.0"]
+
+
+def test_select_renditions_keeps_source_aspect_ratio():
+    renditions = tasks.select_renditions(probe_result(True, width=1440, height=1080, bitrate=None))
+    assert [(r["width"], r["height"]) for r in renditions.values()] == [(640, 480), (960, 720), (1440, 1080)]
+
+    renditions = tasks.select_renditions(probe_result(True, width=640, height=480, bitrate=None))
+    assert [(r["width"], r["height"]) for r in renditions.values()] == [(640, 480)]
+
+
+def test_select_renditions_keeps_lowest_rung_for_small_sources():
+    renditions = tasks.select_renditions(probe_result(True, width=640, height=360))
+
+    assert list(renditions) == ["480p"]
+    assert (renditions["480p"]["width"], renditions["480p"]["height"]) == (640, 360)
+
+
+@pytest.mark.django_db
+def test_convert_to_hls_probes_source_once(movie):
+    with mock.patch("video_app.tasks.probe_video", return_value=probe_result(True, 854, 480)) as mock_probe, \
+         mock.patch("subprocess.run") as mock_run:
+        tasks.convert_to_hls(movie, str(movie.video_file.path))
+        movie = Movie.objects.get(id=movie.id)
+        tasks.convert_to_hls(movie, str(movie.video_file.path))
+
+    mock_probe.assert_called_once()
+    assert (movie.source_width, movie.source_height, movie.source_has_audio) == (854, 480, True)
+    cmd = mock_run.call_args[0][0]
+    assert "split=1[v0]" in cmd[cmd.index("-filter_complex") + 1]
+    assert "1080p/index.m3u8" not in open(movie.hls_master_playlist.path).read()
+
+
+@pytest.mark.django_db
+def test_convert_movie_task_fanout_enqueues_rendition_jobs(movie, settings):
+    settings.HLS_TRANSCODE_MODE = "fanout"
+    with mock.patch("video_app.tasks.probe_video", return_value=probe_result(True, 1280, 720)), \
+         mock.patch("video_app.tasks.convert_rendition_task.delay",
+                    side_effect=["job-audio", "job-480p", "job-720p"]) as mock_rendition, \
+         mock.patch("video_app.tasks.finalize_movie_task.delay") as mock_finalize, \
+         mock.patch("video_app.tasks.convert_to_hls") as mock_convert:
+        tasks.convert_movie_task(movie.id)
+
+    mock_convert.assert_not_called()
+    assert [call.args for call in mock_rendition.call_args_list] == [
+        (movie.id, "audio"), (movie.id, "480p"), (movie.id, "720p")
+    ]
+    mock_finalize.assert_called_once_with(movie.id, depends_on=["job-audio", "job-480p", "job-720p"])
+
+
+@pytest.mark.django_db
+def test_convert_rendition_task_encodes_one_rendition(movie):
+    with mock.patch("video_app.tasks.probe_video", return_value=probe_result(True)), \
+         mock.patch("subprocess.Popen") as mock_popen:
+        process = mock_popen.return_value.__enter__.return_value
+        process.stdout, process.returncode = [], 0
+        tasks.convert_rendition_task(movie.id, "720p")
+
+    mock_popen.assert_called_once()
+    cmd = mock_popen.call_args[0][0]
+    assert "scale=-2:720" in cmd
+    assert cmd[-1].endswith(f"videos/work/{movie.id}/staging/720p/index.m3u8")
+    assert os.path.isdir(os.path.join(tasks.get_hls_base_dir(movie.id), "720p"))
+    assert tasks.is_checkpointed(tasks.get_work_dir(movie.id), "720p")
+
+
+@pytest.mark.django_db
+def test_finalize_movie_task_publishes_master_playlist(movie):
+    with mock.patch("video_app.tasks.probe_video", return_value=probe_result(False, 854, 480)):
+        tasks.finalize_movie_task(movie.id)
+
+    movie.refresh_from_db()
+    assert movie.hls_master_playlist.name == f"videos/hls/{movie.id}/master.m3u8"
+    assert 'CODECS="avc1.4d401f"' in open(movie.hls_master_playlist.path).read()
+
+
+@pytest.mark.django_db
+def test_convert_to_hls_chunked_encodes_chunks_and_stitches(movie, settings):
+    settings.HLS_TRANSCODE_MODE = "chunked"
+    settings.HLS_CHUNK_WORKERS = 2
+    chunks = [f"/work/source/chunk_{index:05d}.mkv" for index in range(3)]
+    with mock.patch("video_app.tasks.probe_video", return_value=probe_result(True, 1280, 720)), \
+         mock.patch("video_app.tasks.glob.glob", return_value=chunks), \
+         mock.patch("subprocess.run") as mock_run:
+        tasks.convert_to_hls(movie, str(movie.video_file.path))
+
+    cmds = [call[0][0] for call in mock_run.call_args_list]
+    assert "segment" in cmds[0] and "copy" in cmds[0]
+    encodes = [cmd for cmd in cmds if cmd[3] in chunks]
+    assert sorted(cmd[3] for cmd in encodes) == chunks
+    assert all("split=2[v0][v1]" in cmd[cmd.index("-filter_complex") + 1] for cmd in encodes)
+    stitches = [cmd for cmd in cmds if "concat" in cmd]
+    assert len(stitches) == 2
+    assert all("-c:a" not in cmd and cmd[-1].endswith("index.m3u8") for cmd in stitches)
+    audio = [cmd for cmd in cmds if "-c:a" in cmd]
+    assert len(audio) == 1 and audio[0][-1].endswith("audio/index.m3u8")
+    assert movie.hls_master_playlist.name == f"videos/hls/{movie.id}/master.m3u8"
+    assert os.path.isdir(os.path.join(tasks.get_hls_base_dir(movie.id), "720p"))
+
+
+@pytest.mark.django_db
+def test_convert_movie_task_chunked_rq_enqueues_chunk_jobs(movie, settings):
+    settings.HLS_TRANSCODE_MODE = "chunked"
+    settings.HLS_CHUNK_EXECUTOR = "rq"
+    with mock.patch("video_app.tasks.probe_video", return_value=probe_result(True)), \
+         mock.patch("video_app.tasks.split_into_chunks", return_value=["a.mkv", "b.mkv"]), \
+         mock.patch("video_app.tasks.encode_chunk_task.delay", side_effect=["job-0", "job-1"]) as mock_chunk, \
+         mock.patch("video_app.tasks.stitch_chunks_task.delay") as mock_stitch:
+        tasks.convert_movie_task(movie.id)
+
+    assert [call.args for call in mock_chunk.call_args_list] == [(movie.id, 0), (movie.id, 1)]
+    mock_stitch.assert_called_once_with(movie.id, 2, depends_on=["job-0", "job-1"])
+
+
+@pytest.mark.django_db
+def test_convert_movie_task_tracks_status_and_progress(movie):
+    def fake_convert(movie, input_file, progress):
+        progress.duration = 100.0
+        progress.callback()(50.0)
+        assert get_transcode_state(movie.id) == {"status": "running", "progress": 50.0}
+        movie.hls_master_playlist.name = f"videos/hls/{movie.id}/master.m3u8"
+
+    with mock.patch("video_app.tasks.convert_to_hls", side_effect=fake_convert), \
+         mock.patch("video_app.models.Movie.save") as mock_save:
+        tasks.convert_movie_task(movie.id)
+
+    mock_save.assert_not_called()
+    movie.refresh_from_db()
+    assert movie.transcode_status == Movie.TranscodeStatus.READY
+    assert movie.transcode_progress == 100.0
+    assert movie.hls_master_playlist.name == f"videos/hls/{movie.id}/master.m3u8"
+
+
+def test_run_ffmpeg_reports_progress():
+    reported = []
+    with mock.patch("subprocess.Popen") as mock_popen:
+        process = mock_popen.return_value.__enter__.return_value
+        process.stdout = ["frame=10\n", "out_time_ms=2500000\n", "progress=continue\n", "out_time_ms=N/A\n"]
+        process.returncode = 0
+        tasks.run_ffmpeg(["ffmpeg", "-i", "in.mp4", "out.m3u8"], reported.append)
+
+    assert mock_popen.call_args[0][0][:4] == ["ffmpeg", "-progress", "pipe:1", "-nostats"]
+    assert reported == [2.5]
+
+
+@pytest.mark.django_db
+def test_mark_conversion_failed_waits_for_last_retry(movie):
+    job = mock.Mock(args=(movie.id, "720p"), retries_left=1)
+    tasks.mark_conversion_failed(job, None, RuntimeError, RuntimeError(), None)
+    movie.refresh_from_db()
+    assert movie.transcode_status == Movie.TranscodeStatus.QUEUED
+
+    job.retries_left = 0
+    tasks.mark_conversion_failed(job, None, RuntimeError, RuntimeError(), None)
+    movie.refresh_from_db()
+    assert movie.transcode_status == Movie.TranscodeStatus.FAILED
+
+
+@pytest.mark.django_db
+def test_convert_to_hls_publishes_renditions_atomically(movie):
+    def fake_ffmpeg(cmd, check):
+        for arg in cmd:
+            if arg.endswith("index.m3u8"):
+                assert "/videos/work/" in arg
+                open(arg, "w").write("#EXTM3U\n#EXT-X-ENDLIST\n")
+
+    with mock.patch("video_app.tasks.probe_video", return_value=probe_result(True, 1280, 720)), \
+         mock.patch("subprocess.run", side_effect=fake_ffmpeg):
+        tasks.convert_to_hls(movie, str(movie.video_file.path))
+
+    for res in ("480p", "720p"):
+        index = os.path.join(tasks.get_hls_base_dir(movie.id), res, "index.m3u8")
+        assert open(index).read().endswith("#EXT-X-ENDLIST\n")
+    assert not os.path.exists(os.path.join(tasks.get_work_dir(movie.id), "staging", "480p"))
+
+
+def test_publish_rendition_swaps_versions_atomically(tmp_path):
+    hls_base_dir = str(tmp_path / "hls")
+    for content in ("old", "new"):
+        staging_dir = tmp_path / "staging"
+        staging_dir.mkdir()
+        (staging_dir / "index.m3u8").write_text(content)
+        tasks.publish_rendition(str(staging_dir), hls_base_dir, "720p")
+
+    hls_dir = os.path.join(hls_base_dir, "720p")
+    assert os.path.islink(hls_dir)
+    assert open(os.path.join(hls_dir, "index.m3u8")).read() == "new"
+    assert sorted(os.listdir(hls_base_dir)) == sorted(["720p", os.readlink(hls_dir)])
+
+
+@pytest.mark.django_db
+def test_convert_to_hls_retry_skips_checkpointed_renditions(movie, settings):
+    settings.HLS_TRANSCODE_MODE = "per_rendition"
+    tasks.checkpoint(tasks.get_work_dir(movie.id), "480p")
+
+    with mock.patch("video_app.tasks.probe_video", return_value=probe_result(True)), \
+         mock.patch("subprocess.run") as mock_run:
+        tasks.convert_to_hls(movie, str(movie.video_file.path))
+
+    encoded = [
+        next(arg for arg in call[0][0] if arg.endswith("index.m3u8")).split("/")[-2]
+        for call in mock_run.call_args_list
+    ]
+    assert encoded == ["720p", "1080p"]
+    assert "480p/index.m3u8" in open(movie.hls_master_playlist.path).read()
+
+
+@pytest.mark.django_db
+def test_convert_movie_task_drops_checkpoints_when_ready(movie):
+    tasks.checkpoint(tasks.get_work_dir(movie.id), "480p")
+    with mock.patch("video_app.tasks.convert_to_hls"):
+        tasks.convert_movie_task(movie.id)
+
+    assert not os.path.exists(tasks.get_work_dir(movie.id))
+
+
+@pytest.mark.django_db
+def test_movie_post_save_hashes_unhashed_movies_in_job(movie):
+    with mock.patch("video_app.signals.hash_movie_task.delay") as mock_hash, \
+         mock.patch("video_app.tasks.convert_movie_task.delay") as mock_convert, \
+         mock.patch("django.db.transaction.on_commit", side_effect=lambda func: func()):
+        movie_post_save(Movie, movie, created=True)
+
+    mock_hash.assert_called_once_with(movie.id)
+    mock_convert.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_hash_movie_task_hashes_and_dispatches(movie, movie_file):
+    with mock.patch("video_app.tasks.dispatch_conversion") as mock_dispatch:
+        tasks.hash_movie_task(movie.id)
+
+    movie.refresh_from_db()
+    assert movie.video_sha256 == hashlib.sha256(movie_file.read_bytes()).hexdigest()
+    assert mock_dispatch.call_args.args[0].video_sha256 == movie.video_sha256
+
+
+@pytest.mark.django_db
+def test_movie_post_save_reuses_converted_duplicate(movie, category, movie_file, tmp_path):
+    hls_dir = tmp_path / f"media/videos/hls/{movie.id}/480p"
+    hls_dir.mkdir(parents=True)
+    (hls_dir / "index.m3u8").write_text("#EXTM3U")
+    (hls_dir.parent / "master.m3u8").write_text("#EXTM3U")
+    video_sha256 = hashlib.sha256(movie_file.read_bytes()).hexdigest()
+    Movie.objects.filter(pk=movie.pk).update(
+        transcode_status=Movie.TranscodeStatus.READY, source_height=480, video_sha256=video_sha256
+    )
+
+    with mock.patch("video_app.tasks.generate_thumbnail.delay") as mock_thumb, \
+         mock.patch("video_app.tasks.generate_trickplay.delay") as mock_trickplay, \
+         mock.patch("video_app.tasks.convert_movie_task.delay") as mock_convert, \
+         mock.patch("video_app.tasks.reuse_conversion.delay", side_effect=tasks.reuse_conversion), \
+         mock.patch("django.db.transaction.on_commit", side_effect=lambda func: func()):
+        copy = Movie.objects.create(
+            title="Re-upload", description="desc", category=category, video_file=str(movie_file),
+            video_sha256=video_sha256
+        )
+
+    mock_thumb.assert_not_called()
+    mock_trickplay.assert_not_called()
+    mock_convert.assert_not_called()
+    copy.refresh_from_db()
+    assert copy.transcode_status == Movie.TranscodeStatus.READY
+    assert copy.source_height == 480
+    assert copy.hls_master_playlist.name == f"videos/hls/{copy.id}/master.m3u8"
+    assert (tmp_path / f"media/videos/hls/{copy.id}/480p/index.m3u8").read_text() == "#EXTM3U"
+
+
+@pytest.mark.django_db
+def test_reuse_conversion_converts_when_source_files_are_gone(movie):
+    Movie.objects.filter(pk=movie.pk).update(transcode_status=Movie.TranscodeStatus.READY)
+
+    with mock.patch("video_app.tasks.enqueue_conversion") as mock_enqueue:
+        tasks.reuse_conversion(movie.id, 999)
+
+    mock_enqueue.assert_called_once_with(999)
@@ -1,13 +1,22 @@
 import pytest
 import os
+import time
+import hashlib
 
 from unittest import mock
 
 from django.conf import settings
 from django.http import Http404, FileResponse
 
-from video_app.api.views import video_hls
+from video_app.api.views import video_dash, video_hls
 from video_app.models import Movie
+from video_app.utils import set_transcode_status, sign_playback_token, upload_digests, verify_playback_token
+
+
+@pytest.fixture(autouse=True)
+def unsigned_playback(settings):
+    """The serving tests call the views without a token; the playback tests enable enforcement themselves."""
+    settings.PLAYBACK_TOKENS_REQUIRED = False
 
 
 @pytest.mark.django_db
@@ -33,17 +42,155 @@ def test_video_list_view_multiple_movies(auth_client, user, movie, category):
     assert len(response.data) == 2
 
 
-def test_video_hls_file_exists(rf):
+@pytest.fixture
+def hls_files(tmp_path, settings):
+    settings.MEDIA_ROOT = tmp_path
+    hls_dir = tmp_path / "videos/hls/1"
+    (hls_dir / "720p").mkdir(parents=True)
+    (hls_dir / "master.m3u8").write_text("#EXTM3U\n")
+    (hls_dir / "720p" / "index.m3u8").write_text("#EXTM3U\n")
+    (hls_dir / "720p" / "test.ts").write_bytes(b"data")
+    return hls_dir
+
+
+def test_video_hls_file_exists(rf, hls_files):
     request = rf.get('/fake-url/')
     movie_id = 1
     resolution = '720p'
     segment = 'test.ts'
 
-    with mock.patch('os.path.exists', return_value=True), \
-         mock.patch('builtins.open', mock.mock_open(read_data=b'data')) as m_open:
-        response = video_hls(request, movie_id, resolution, segment)
-        assert isinstance(response, FileResponse)
-        m_open.assert_called_once()
+    response = video_hls(request, movie_id, resolution, segment)
+    assert isinstance(response, FileResponse)
+    assert b"".join(response.streaming_content) == b"data"
+    assert response["Cache-Control"] == "public, max-age=31536000, immutable"
+
+
+def test_video_hls_answers_conditional_requests_with_304(rf, hls_files):
+    response = video_hls(rf.get('/fake-url/'), 1, "720p", "test.ts")
+    response.file_to_stream.close()
+
+    not_modified = video_hls(rf.get('/fake-url/', HTTP_IF_NONE_MATCH=response["ETag"]), 1, "720p", "test.ts")
+    assert not_modified.status_code == 304
+    assert not_modified["ETag"] == response["ETag"]
+    since = video_hls(rf.get('/fake-url/', HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]), 1, "720p", "test.ts")
+    assert since.status_code == 304
+    os.utime(hls_files / "720p" / "test.ts", ns=(0, 10 ** 18))
+    changed = video_hls(rf.get('/fake-url/', HTTP_IF_NONE_MATCH=response["ETag"]), 1, "720p", "test.ts")
+    assert changed.status_code == 200
+    changed.file_to_stream.close()
+
+
+def test_video_hls_serves_byte_ranges(rf, hls_files):
+    (hls_files / "720p" / "segments.m4s").write_bytes(bytes(range(100)))
+
+    def get(**headers):
+        return video_hls(rf.get('/fake-url/', **headers), 1, "720p", "segments.m4s")
+
+    response = get(HTTP_RANGE="bytes=10-19")
+    assert response.status_code == 206
+    assert response["Content-Range"] == "bytes 10-19/100"
+    assert response["Content-Length"] == "10"
+    assert b"".join(response.streaming_content) == bytes(range(10, 20))
+
+    response = get(HTTP_RANGE="bytes=-5")
+    assert response["Content-Range"] == "bytes 95-99/100"
+    assert b"".join(response.streaming_content) == bytes(range(95, 100))
+
+    for header in ("bytes=0-1,5-6", "bytes=100-"):
+        response = get(HTTP_RANGE=header)
+        assert response.status_code == 416
+        assert response["Content-Range"] == "bytes */100"
+
+    response = get(HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE='"stale"')
+    assert response.status_code == 200
+    assert response["Accept-Ranges"] == "bytes"
+    response.file_to_stream.close()
+
+
+@pytest.mark.django_db
+def test_video_hls_caches_playlists_of_finished_titles(rf, movie, hls_files, settings):
+    settings.HLS_PLAYLIST_MAX_AGE = 120
+    hls_files.rename(hls_files.parent / str(movie.id))
+    response = video_hls(rf.get('/fake-url/'), movie.id, "720p")
+    assert response["Cache-Control"] == "public, max-age=120"
+
+    response = video_hls(rf.get('/fake-url/'), movie.id)
+    assert response["Cache-Control"] == "no-cache"
+    Movie.objects.filter(pk=movie.pk).update(transcode_status=Movie.TranscodeStatus.READY)
+    response = video_hls(rf.get('/fake-url/'), movie.id)
+    assert response["Cache-Control"] == "public, max-age=120"
+
+
+@pytest.mark.django_db
+def test_video_hls_serves_finished_playlists_from_cache(rf, movie, hls_files):
+    hls_files.rename(hls_files.parent / str(movie.id))
+    master = hls_files.parent / str(movie.id) / "master.m3u8"
+    set_transcode_status(movie.id, Movie.TranscodeStatus.READY)
+    first = video_hls(rf.get('/fake-url/'), movie.id)
+
+    master.write_text("#EXTM3U\n#EXT-X-VERSION:7\n")
+    with mock.patch('os.path.exists') as m_exists:
+        cached = video_hls(rf.get('/fake-url/', HTTP_IF_NONE_MATCH=first["ETag"]), movie.id)
+        assert cached.status_code == 304
+        assert video_hls(rf.get('/fake-url/'), movie.id).content == b"#EXTM3U\n"
+    assert not m_exists.called
+
+    set_transcode_status(movie.id, Movie.TranscodeStatus.RUNNING)
+    assert video_hls(rf.get('/fake-url/'), movie.id).content == b"#EXTM3U\n#EXT-X-VERSION:7\n"
+
+
+def test_video_hls_serves_trickplay_with_long_cache(rf, tmp_path, settings):
+    settings.MEDIA_ROOT = tmp_path
+    trickplay_dir = tmp_path / "videos/hls/1/trickplay"
+    trickplay_dir.mkdir(parents=True)
+    (trickplay_dir / "thumbnails.vtt").write_text("WEBVTT\n")
+
+    response = video_hls(rf.get('/fake-url/'), 1, "trickplay", "thumbnails.vtt")
+
+    assert response["Content-Type"] == "text/vtt"
+    assert response["Cache-Control"] == "public, max-age=31536000, immutable"
+    response.file_to_stream.close()
+
+
+def test_video_hls_serves_fmp4_segments_as_cmaf(rf, tmp_path, settings):
+    settings.MEDIA_ROOT = tmp_path
+    hls_dir = tmp_path / "videos/hls/1/720p"
+    hls_dir.mkdir(parents=True)
+    (hls_dir / "segment_000.m4s").write_bytes(b"moof")
+
+    response = video_hls(rf.get('/fake-url/'), 1, "720p", "segment_000.m4s")
+
+    assert response["Content-Type"] == "video/iso.segment"
+    response.file_to_stream.close()
+
+
+def test_video_hls_offloads_segment_to_front_proxy(rf, tmp_path, settings):
+    settings.MEDIA_ROOT = tmp_path
+    settings.MEDIA_OFFLOAD = "x-accel"
+    hls_dir = tmp_path / "videos/hls/1/720p"
+    hls_dir.mkdir(parents=True)
+    (hls_dir / "segment_000.m4s").write_bytes(b"moof")
+
+    response = video_hls(rf.get('/fake-url/'), 1, "720p", "segment_000.m4s")
+
+    assert response["X-Accel-Redirect"] == "/protected-media/videos/hls/1/720p/segment_000.m4s"
+    assert response["Content-Type"] == "video/iso.segment"
+    assert response.content == b""
+
+
+@pytest.mark.django_db
+def test_video_dash_serves_manifest(rf, tmp_path, settings):
+    settings.MEDIA_ROOT = tmp_path
+    hls_dir = tmp_path / "videos/hls/1"
+    hls_dir.mkdir(parents=True)
+    (hls_dir / "manifest.mpd").write_text("<MPD/>")
+
+    response = video_dash(rf.get('/fake-url/'), 1)
+
+    assert response["Content-Type"] == "application/dash+xml"
+    assert response.content == b"<MPD/>"
+    with pytest.raises(Http404):
+        video_dash(rf.get('/fake-url/'), 2)
 
 
 def test_video_hls_file_not_found(rf):
@@ -57,25 +204,195 @@ def test_video_hls_file_not_found(rf):
             video_hls(request, movie_id, resolution, segment)
 
 
-def test_video_hls_correct_path(rf):
+def test_video_hls_correct_path(rf, hls_files):
     request = rf.get('/fake-url/')
     movie_id, resolution, segment = 1, "720p", "test.ts"
     expected_path = os.path.join(settings.MEDIA_ROOT, f"videos/hls/{movie_id}/{resolution}/{segment}")
 
-    with mock.patch('os.path.exists', return_value=True) as m_exists, \
-         mock.patch('builtins.open', mock.mock_open(read_data=b'data')):
-        response = video_hls(request, movie_id, resolution, segment)
-        assert isinstance(response, FileResponse)
-        m_exists.assert_called_once_with(expected_path)
+    response = video_hls(request, movie_id, resolution, segment)
+    assert isinstance(response, FileResponse)
+    assert response.file_to_stream.name == expected_path
+    response.file_to_stream.close()
 
 
-def test_video_hls_default_segment(rf):
+@pytest.mark.django_db
+def test_video_hls_default_segment(rf, hls_files):
     request = rf.get('/fake-url/')
     movie_id = 1
     resolution = '720p'
+    (hls_files / "720p" / "index.m3u8").write_text("#EXTM3U\n#EXT-X-ENDLIST\n")
+
+    response = video_hls(request, movie_id, resolution)
+    assert response.content == b"#EXTM3U\n#EXT-X-ENDLIST\n"
+
+
+@pytest.mark.django_db
+def test_video_hls_master_playlist(rf, hls_files):
+    request = rf.get('/fake-url/')
+
+    response = video_hls(request, 1)
+    assert response.content == b"#EXTM3U\n"
+    assert response["Content-Type"] == "application/vnd.apple.mpegurl"
+
 
-    with mock.patch('os.path.exists', return_value=True), \
-         mock.patch('builtins.open', mock.mock_open(read_data=b'data')) as m_open:
-        response = video_hls(request, movie_id, resolution)
-        assert isinstance(response, FileResponse)
-        m_open.assert_called_once()
+@pytest.mark.django_db
+def test_video_status_reads_persisted_status(auth_client, movie):
+    response = auth_client.get(f'/api/video/{movie.id}/status/')
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "queued", "progress": 0.0}
+
+
+@pytest.mark.django_db
+def test_video_status_unknown_movie(auth_client):
+    response = auth_client.get('/api/video/999/status/')
+    assert response.status_code == 404
+
+
+def test_video_status_requires_authentication(api_client, movie):
+    response = api_client.get(f'/api/video/{movie.id}/status/')
+    assert response.status_code == 401
+
+
+def test_playback_tokens_are_bound_to_movie_and_expiry():
+    token = sign_playback_token(1)
+    assert verify_playback_token(1, token)
+    assert not verify_playback_token(2, token)
+    assert not verify_playback_token(1, token[:-1] + ("A" if token[-1] != "A" else "B"))
+    assert not verify_playback_token(1, sign_playback_token(1, expires=int(time.time()) - 1))
+    assert not verify_playback_token(1, "garbage")
+    assert not verify_playback_token(1, "\u00b2.signature")
+
+
+@pytest.mark.django_db
+def test_play_issues_signed_urls_that_unlock_segments(auth_client, movie, settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    settings.PLAYBACK_TOKENS_REQUIRED = True
+    hls_dir = tmp_path / f"videos/hls/{movie.id}/720p"
+    hls_dir.mkdir(parents=True)
+    (hls_dir / "segment_000.ts").write_bytes(b"data")
+    (hls_dir.parent / "master.m3u8").write_text("#EXTM3U\n720p/index.m3u8\n")
+
+    response = auth_client.post(f'/api/video/{movie.id}/play/')
+    assert response.status_code == 201
+    base_url = response.data["hls_url"].rsplit("/", 1)[0]
+    assert base_url.endswith(f"/api/video/{movie.id}/play/{response.data['token']}")
+    assert response.data["dash_url"] == f"{base_url}/manifest.mpd"
+
+    assert auth_client.get(response.data["hls_url"]).status_code == 200
+    segment = auth_client.get(f"{base_url}/720p/segment_000.ts")
+    assert segment.status_code == 200
+    assert b"".join(segment.streaming_content) == b"data"
+    assert auth_client.get(f'/api/video/{movie.id}/720p/segment_000.ts').status_code == 403
+    other = sign_playback_token(movie.id + 1)
+    assert auth_client.get(f'/api/video/{movie.id}/play/{other}/720p/segment_000.ts').status_code == 403
+    assert auth_client.get(f'/api/video/{movie.id}/play/%C2%B2.x/master.m3u8').status_code == 403
+
+
+@pytest.mark.django_db
+def test_play_falls_back_to_renditions_without_master_playlist(auth_client, movie, settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    settings.PLAYBACK_TOKENS_REQUIRED = True
+    for res in ("480p", "720p"):
+        hls_dir = tmp_path / f"videos/hls/{movie.id}/{res}"
+        hls_dir.mkdir(parents=True)
+        (hls_dir / "index.m3u8").write_text("#EXTM3U\n")
+
+    response = auth_client.post(f'/api/video/{movie.id}/play/')
+
+    assert list(response.data["renditions"]) == ["480p", "720p"]
+    assert response.data["hls_url"] == response.data["renditions"]["720p"]
+    assert response.data["hls_url"].endswith(f"/play/{response.data['token']}/720p/index.m3u8")
+    assert auth_client.get(response.data["hls_url"]).status_code == 200
+
+
+def test_play_requires_authentication(api_client):
+    assert api_client.post('/api/video/1/play/').status_code == 401
+
+
+@pytest.fixture
+def admin_client(api_client, db, django_user_model):
+    admin = django_user_model.objects.create_superuser(username="admin", email="admin@test.com", password="pw12345")
+    api_client.force_authenticate(admin)
+    return api_client
+
+
+def start_upload(admin_client, category, size):
+    return admin_client.post('/api/upload/', {
+        "filename": "../My Movie.mp4", "size": size, "title": "Uploaded",
+        "description": "desc", "category": category.id,
+    }, format='json')
+
+
+def send_chunk(admin_client, upload_id, offset, data):
+    return admin_client.generic(
+        'PATCH', f'/api/upload/{upload_id}/', data,
+        content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset)
+    )
+
+
+@pytest.mark.django_db
+def test_upload_chunks_resume_and_create_movie(admin_client, category, settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    content = b"0123456789" * 10
+    response = start_upload(admin_client, category, len(content))
+    assert response.status_code == 201
+    upload_id = response.data["id"]
+    assert response.data["filename"] == "My_Movie.mp4"
+
+    assert send_chunk(admin_client, upload_id, 0, content[:40]).status_code == 200
+    assert send_chunk(admin_client, upload_id, 0, content[:40]).status_code == 409
+
+    resumed = admin_client.get(f'/api/upload/{upload_id}/')
+    assert resumed['Upload-Offset'] == "40"
+
+    probe = {"has_audio": True, "width": 1280, "height": 720, "frame_rate": 25.0, "bitrate": 1000, "duration": 4.0}
+    with mock.patch("video_app.api.views.probe_video", return_value=probe), \
+         mock.patch("video_app.signals.hash_movie_task.delay") as mock_hash, \
+         mock.patch("video_app.tasks.generate_thumbnail.delay") as mock_thumb, \
+         mock.patch("video_app.tasks.generate_trickplay.delay") as mock_trickplay, \
+         mock.patch("video_app.tasks.convert_movie_task.delay") as mock_convert, \
+         mock.patch("django.db.transaction.on_commit", side_effect=lambda func: func()):
+        response = send_chunk(admin_client, upload_id, 40, content[40:])
+
+    assert response.status_code == 201
+    movie = Movie.objects.get(id=response.data["movie"])
+    assert movie.title == "Uploaded"
+    assert movie.source_width == 1280
+    assert open(movie.video_file.path, 'rb').read() == content
+    assert movie.video_sha256 == hashlib.sha256(content).hexdigest()
+    mock_hash.assert_not_called()
+    assert mock_thumb.called and mock_trickplay.called and mock_convert.called
+
+
+@pytest.mark.django_db
+def test_upload_leaves_hash_to_job_when_running_hash_is_lost(admin_client, category, settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    upload_id = start_upload(admin_client, category, 10).data["id"]
+    send_chunk(admin_client, upload_id, 0, b"01234")
+    upload_digests.clear()
+
+    probe = {"has_audio": True, "width": 1280, "height": 720, "frame_rate": 25.0, "bitrate": 1000, "duration": 4.0}
+    with mock.patch("video_app.api.views.probe_video", return_value=probe), \
+         mock.patch("video_app.signals.hash_movie_task.delay") as mock_hash, \
+         mock.patch("django.db.transaction.on_commit", side_effect=lambda func: func()):
+        response = send_chunk(admin_client, upload_id, 5, b"56789")
+
+    assert response.status_code == 201
+    assert Movie.objects.get(id=response.data["movie"]).video_sha256 == ""
+    mock_hash.assert_called_once_with(response.data["movie"])
+
+
+@pytest.mark.django_db
+def test_upload_rejects_chunk_beyond_size(admin_client, category, settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    upload_id = start_upload(admin_client, category, 10).data["id"]
+
+    response = send_chunk(admin_client, upload_id, 0, b"x" * 11)
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_upload_requires_admin(auth_client, category):
+    response = start_upload(auth_client, category, 10)
+    assert response.status_code == 403
@@ -0,0 +1,455 @@
+import base64
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import django_rq
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from .models import Movie
+
+TRANSCODE_CACHE_TIMEOUT = 60 * 60 * 24
+PROGRESS_REPORT_INTERVAL = 2
+PLAYLIST_CACHE_TIMEOUT = 60 * 60 * 24
+PLAYBACK_TOKEN_SALT = "video_app.playback"
+UPLOAD_DIGEST_SLOTS = 256
+
+
+def transcode_status_key(movie_id):
+    """Cache key holding the transcode status of a movie and the scopes reporting progress."""
+    return f"transcode:{movie_id}:status"
+
+
+def transcode_progress_key(movie_id, scope=None):
+    """Cache key holding the progress of a movie, or of one scope (rendition, chunk) of it."""
+    return f"transcode:{movie_id}:progress:{scope or 'all'}"
+
+
+def set_transcode_status(movie_id, status, progress=None, scopes=None, **fields):
+    """
+    Persist a transcode status transition and mirror it into the cache.
+    Only the given fields are written, so the movie is neither re-validated nor re-saved as a whole.
+
+    Args:
+        movie_id (int): The ID of the movie.
+        status (str): One of Movie.TranscodeStatus.
+        progress (float): The progress in percent to persist, if it changed.
+        scopes (list): The scopes that report progress separately, e.g. one per rendition job.
+        **fields: Further movie fields written in the same update.
+    """
+    fields["transcode_status"] = status
+    if progress is not None:
+        fields["transcode_progress"] = progress
+    Movie.objects.filter(pk=movie_id).update(**fields)
+
+    cache.set(transcode_status_key(movie_id), {"status": status, "scopes": scopes or []}, TRANSCODE_CACHE_TIMEOUT)
+    playlist_cache.invalidate(movie_id)
+    if status == Movie.TranscodeStatus.RUNNING:
+        cache.delete_many([transcode_progress_key(movie_id, scope) for scope in scopes or [None]])
+
+
+def get_transcode_state(movie_id):
+    """
+    Get the transcode status and progress of a movie.
+    Live progress comes from the cache; the database is only read if the cache has no state.
+
+    Args:
+        movie_id (int): The ID of the movie.
+
+    Returns:
+        dict: status and progress in percent, or None if the movie does not exist.
+    """
+    state = cache.get(transcode_status_key(movie_id))
+    if state is None:
+        row = Movie.objects.filter(pk=movie_id).values_list("transcode_status", "transcode_progress").first()
+        return {"status": row[0], "progress": row[1]} if row else None
+
+    if state["status"] == Movie.TranscodeStatus.READY:
+        return {"status": state["status"], "progress": 100.0}
+
+    keys = [transcode_progress_key(movie_id, scope) for scope in state["scopes"] or [None]]
+    values = cache.get_many(keys)
+    progress = sum(values.get(key, 0.0) for key in keys) / len(keys)
+    return {"status": state["status"], "progress": round(progress, 1)}
+
+
+class ProgressTracker:
+    """
+    Collects ffmpeg progress of a conversion and buffers it in the cache.
+    Work is split into parts (renditions, chunks) that each report a fraction between 0 and 1;
+    the average is written at most every PROGRESS_REPORT_INTERVAL seconds.
+
+    Attributes:
+        movie_id (int): The ID of the movie being converted.
+        duration (float): The source duration in seconds.
+        scope (str): The cache scope the progress is written to.
+    """
+
+    def __init__(self, movie_id, duration=None, parts=(None,), scope=None):
+        self.movie_id = movie_id
+        self.duration = duration
+        self.scope = scope
+        self.fractions = dict.fromkeys(parts, 0.0)
+        self.reported_at = 0.0
+
+    def set_parts(self, parts):
+        """
+        Replace the parts the work is split into, once they are known.
+        """
+        self.fractions = dict.fromkeys(parts, 0.0)
+
+    def callback(self, part=None):
+        """
+        Get a callback turning ffmpeg's encoded position in seconds into progress of one part.
+        """
+        return lambda seconds: self.update(part, seconds / self.duration if self.duration else 0.0)
+
+    def update(self, part, fraction):
+        """
+        Record the progress of one part and write the overall progress to the cache if it is due.
+        """
+        self.fractions[part] = min(max(fraction, 0.0), 1.0)
+        now = time.monotonic()
+        if now - self.reported_at >= PROGRESS_REPORT_INTERVAL or fraction >= 1.0:
+            self.reported_at = now
+            cache.set(transcode_progress_key(self.movie_id, self.scope), self.percent, TRANSCODE_CACHE_TIMEOUT)
+
+    @property
+    def percent(self):
+        """The overall progress in percent."""
+        return round(100 * sum(self.fractions.values()) / len(self.fractions), 1)
+
+
+def playlist_version_key(movie_id):
+    """Cache key holding the current playlist cache version of a movie."""
+    return f"playlist:{movie_id}:version"
+
+
+def playlist_key(movie_id, version, name):
+    """Cache key holding one playlist of a movie at a cache version."""
+    return f"playlist:{movie_id}:{version}:{name}"
+
+
+class PlaylistCache:
+    """
+    Two-level cache of finished playlists: a bounded per-process LRU in front of the shared cache.
+    Entries hold the playlist body with its validators and are keyed by a per-movie version token in the
+    shared cache; invalidating a movie replaces its token, which orphans all its entries on every level.
+    Each process keeps the token for PLAYLIST_CACHE_VERSION_TTL seconds, so a hit needs no network round trip
+    and an invalidation reaches other processes after at most that long.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.lock = threading.Lock()
+
+    def version(self, movie_id):
+        """
+        Get the cache version token of a movie, from the process if it is fresh enough.
+        """
+        now = time.monotonic()
+        with self.lock:
+            version, expires = self.versions.get(movie_id, (None, 0))
+        if expires <= now:
+            version = cache.get_or_set(playlist_version_key(movie_id), lambda: uuid.uuid4().hex, None)
+            with self.lock:
+                self.versions[movie_id] = (version, now + settings.PLAYLIST_CACHE_VERSION_TTL)
+        return version
+
+    def get(self, movie_id, name):
+        """
+        Get a cached playlist.
+
+        Args:
+            movie_id (int): The ID of the movie.
+            name (str): The playlist path relative to the movie's HLS directory.
+
+        Returns:
+            dict: The entry with body, etag and last_modified, or None if it is not cached.
+        """
+        key = playlist_key(movie_id, self.version(movie_id), name)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                return entry
+        entry = cache.get(key)
+        if entry is not None:
+            self.remember(key, entry)
+        return entry
+
+    def set(self, movie_id, name, entry):
+        """
+        Cache a playlist on both levels. Only playlists of finished titles may be cached.
+        """
+        key = playlist_key(movie_id, self.version(movie_id), name)
+        cache.set(key, entry, PLAYLIST_CACHE_TIMEOUT)
+        self.remember(key, entry)
+
+    def remember(self, key, entry):
+        """
+        Put an entry into the process LRU, evicting the least recently used beyond PLAYLIST_CACHE_SIZE.
+        """
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.PLAYLIST_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, movie_id):
+        """
+        Drop all cached playlists of a movie, e.g. when it is re-transcoded or deleted.
+        """
+        cache.delete(playlist_version_key(movie_id))
+        with self.lock:
+            self.versions.pop(movie_id, None)
+
+    def clear(self):
+        """
+        Forget everything cached in this process.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.versions.clear()
+
+
+playlist_cache = PlaylistCache()
+
+
+class UploadDigests:
+    """
+    Running SHA-256 hashes of resumable uploads, kept per process and updated as chunks are written,
+    so completing an upload needs no second pass over the file.
+    If a chunk arrives at another process, or after a failed chunk, the running hash is lost and the movie is
+    hashed by its background job instead. At most UPLOAD_DIGEST_SLOTS uploads are tracked, the least recently
+    used are dropped.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, upload_id, offset):
+        """
+        Take the running hash of an upload covering its first offset bytes.
+        The hash is removed until it is put back, so concurrent chunks of one upload never share it.
+        A new hash is only started at offset 0; the partial file is never read back inside a request.
+
+        Args:
+            upload_id (UUID): The ID of the upload session.
+            offset (int): The number of bytes received so far.
+
+        Returns:
+            hashlib.sha256: The running hash, or None if this process does not hold it.
+        """
+        with self.lock:
+            position, sha256 = self.entries.pop(upload_id, (None, None))
+        if sha256 is not None and position == offset:
+            return sha256
+        return hashlib.sha256() if offset == 0 else None
+
+    def put(self, upload_id, offset, sha256):
+        """
+        Keep the running hash of an upload covering its first offset bytes for the next chunk.
+        """
+        with self.lock:
+            self.entries[upload_id] = (offset, sha256)
+            self.entries.move_to_end(upload_id)
+            while len(self.entries) > UPLOAD_DIGEST_SLOTS:
+                self.entries.popitem(last=False)
+
+    def discard(self, upload_id):
+        """
+        Forget the running hash of an upload, e.g. when it is deleted.
+        """
+        with self.lock:
+            self.entries.pop(upload_id, None)
+
+    def clear(self):
+        """
+        Forget all running hashes of this process.
+        """
+        with self.lock:
+            self.entries.clear()
+
+
+upload_digests = UploadDigests()
+
+
+ACQUIRE_THREADS_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+local grants = redis.call('HGETALL', KEYS[2])
+local used = 0
+for i = 1, #grants, 2 do
+    if redis.call('ZSCORE', KEYS[1], grants[i]) then
+        used = used + tonumber(grants[i + 1])
+    else
+        redis.call('HDEL', KEYS[2], grants[i])
+    end
+end
+local grant = math.min(tonumber(ARGV[3]), tonumber(ARGV[5]) - used)
+if grant < tonumber(ARGV[4]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], tonumber(ARGV[1]) + tonumber(ARGV[6]), ARGV[2])
+redis.call('HSET', KEYS[2], ARGV[2], grant)
+return grant
+"""
+
+
+class ThreadBudget:
+    """
+    Host-wide budget of ffmpeg threads, shared by all workers through Redis.
+    Every running ffmpeg holds a lease in a sorted set scored by its expiry and the number of granted
+    threads in a hash. Granting is a single Lua script, so concurrent workers never exceed the budget.
+    A heartbeat renews the lease while it is held; leases of crashed workers simply expire.
+    The reserved threads are only granted to preview leases, so short jobs never wait behind transcodes.
+
+    Attributes:
+        budget (int): The total number of threads; 0 disables the budget.
+        reserved (int): The number of threads only preview leases may take.
+        connection (Redis): The Redis connection holding the leases.
+    """
+    leases_key = "ffmpeg:threads:leases"
+    grants_key = "ffmpeg:threads:grants"
+    lease_seconds = 60
+    poll_interval = 1.0
+
+    def __init__(self, budget=None, reserved=None, connection=None):
+        self.budget = settings.FFMPEG_THREAD_BUDGET if budget is None else budget
+        self.reserved = settings.FFMPEG_PREVIEW_THREADS if reserved is None else reserved
+        self.connection = connection or django_rq.get_connection("transcode")
+        self.acquire_script = self.connection.register_script(ACQUIRE_THREADS_SCRIPT)
+
+    def try_acquire(self, lease_id, threads, minimum=1, limit=None):
+        """
+        Try to take up to threads from the budget in one step.
+        The lease is only granted while all leases together hold fewer than limit threads.
+
+        Returns:
+            int: The number of granted threads, 0 if fewer than minimum are free.
+        """
+        limit = self.budget if limit is None else limit
+        args = [time.time(), lease_id, threads, minimum, limit, self.lease_seconds]
+        return int(self.acquire_script(keys=[self.leases_key, self.grants_key], args=args))
+
+    def renew(self, lease_id):
+        """
+        Push the expiry of a held lease forward.
+        """
+        self.connection.zadd(self.leases_key, {lease_id: time.time() + self.lease_seconds}, xx=True)
+
+    def release(self, lease_id):
+        """
+        Return the threads of a lease to the budget.
+        """
+        pipe = self.connection.pipeline()
+        pipe.zrem(self.leases_key, lease_id)
+        pipe.hdel(self.grants_key, lease_id)
+        pipe.execute()
+
+    @contextmanager
+    def lease(self, threads, minimum=1, preview=False):
+        """
+        Wait until at least minimum threads are free and hold up to threads of them.
+
+        Args:
+            threads (int): The number of threads wanted, capped at the budget.
+            minimum (int): The number of threads needed to start.
+            preview (bool): Whether the lease is for a short preview job and may take the reserved threads.
+
+        Yields:
+            int: The number of granted threads.
+        """
+        limit = self.budget if preview else max(1, self.budget - self.reserved)
+        threads = min(threads, limit)
+        lease_id = uuid.uuid4().hex
+        granted = self.try_acquire(lease_id, threads, minimum, limit)
+        while not granted:
+            time.sleep(self.poll_interval)
+            granted = self.try_acquire(lease_id, threads, minimum, limit)
+
+        stopped = threading.Event()
+        heartbeat = threading.Thread(target=self.keep_alive, args=(lease_id, stopped), daemon=True)
+        heartbeat.start()
+        try:
+            yield granted
+        finally:
+            stopped.set()
+            heartbeat.join()
+            self.release(lease_id)
+
+    def keep_alive(self, lease_id, stopped):
+        """
+        Renew a lease every third of its lifetime until stopped is set.
+        """
+        while not stopped.wait(self.lease_seconds / 3):
+            self.renew(lease_id)
+
+
+@contextmanager
+def ffmpeg_threads(threads, preview=False):
+    """
+    Hold threads from the host-wide ffmpeg thread budget while ffmpeg runs.
+
+    Args:
+        threads (int): The number of threads wanted.
+        preview (bool): Whether ffmpeg renders a thumbnail or trickplay and may use the reserved threads.
+
+    Yields:
+        int: The number of granted threads, or None if FFMPEG_THREAD_BUDGET is 0 and ffmpeg picks its own.
+    """
+    if not settings.FFMPEG_THREAD_BUDGET:
+        yield None
+        return
+    with ThreadBudget().lease(threads, preview=preview) as granted:
+        yield granted
+
+
+def playback_signature(movie_id, expires):
+    """
+    Compute the URL-safe HMAC of a movie ID and expiry, keyed with SECRET_KEY.
+    """
+    digest = salted_hmac(PLAYBACK_TOKEN_SALT, f"{movie_id}:{expires}", algorithm="sha256").digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def sign_playback_token(movie_id, expires=None):
+    """
+    Issue a playback token for a movie, valid for PLAYBACK_TOKEN_TTL seconds.
+    The token carries its expiry and an HMAC over movie and expiry, so checking it needs
+    neither the database nor a JWT decode.
+
+    Args:
+        movie_id (int): The ID of the movie.
+        expires (int): The expiry as a Unix timestamp, defaults to now plus PLAYBACK_TOKEN_TTL.
+
+    Returns:
+        str: The token, safe to use as a URL path segment.
+    """
+    if expires is None:
+        expires = int(time.time()) + settings.PLAYBACK_TOKEN_TTL
+    return f"{expires}.{playback_signature(movie_id, expires)}"
+
+
+def verify_playback_token(movie_id, token):
+    """
+    Check a playback token for a movie with pure CPU work; the signature is compared in constant time.
+
+    Args:
+        movie_id (int): The ID of the movie being requested.
+        token (str): The token from the URL.
+
+    Returns:
+        bool: Whether the token was issued for this movie and has not expired.
+    """
+    expires, _, signature = token.partition(".")
+    if not (expires.isascii() and expires.isdigit()) or int(expires) < time.time():
+        return False
+    return constant_time_compare(signature, playback_signature(movie_id, int(expires)))